@@ -0,0 +1,344 @@
+"""
+batch_query.py
+Author: Lyx Huston
+answers many questions about one data file in a single run
+
+the main functions of the other modules ask for input and answer one question
+before exiting, so every question pays for reading the file again.  this reads
+the file once and then answers a stream of queries, one JSON object per line,
+writing one result per query as a JSON line or as CSV rows.
+
+queries (fields in brackets are optional):
+{"query": "range", "region": "NY", ["quarterly": true],
+ ["year0": 2000], ["year1": 2012]}
+{"query": "ranking", "year": 2000, ["qtr": 1], ["k": 10]}
+{"query": "trend", "year0": 1994, "year1": 2002, ["k": 10]}
+{"query": "annualize", "region": "NY"}
+{"query": "plot", "regions": ["NY", "VT"], "years": [1988, 2008],
+ "output": "ny_vt.png", ["kind": "timeline" or "whiskers"]}
+any query can have an "id", which is copied to its result.  a query that fails
+gets a result with an "error" and the rest still run.
+
+usage:
+python batch_query.py data/HPI_PO_state.txt queries.jsonl
+python batch_query.py data/HPI_AT_ZIP5.txt --format csv < queries.jsonl
+"""
+
+import argparse
+import contextlib
+import csv
+import json
+import sys
+
+import index_tools
+import instrument
+import period_ranking
+import trending
+
+CSV_FIELDS = [
+    "id", "query", "field", "rank", "region", "year", "qtr", "value", "error"
+]
+
+
+class QuerySession:
+    """
+    a data file loaded once, and the queries that can be asked of it
+    """
+
+    def __init__(self, filepath: str):
+        """
+        reads the file, using the cache beside it
+        :param filepath: path to state or ZIP data file
+        """
+        self.filepath = filepath
+        if "state" in filepath:
+            self.quarterly = index_tools.read_state_house_price_data(
+                filepath, cache=True
+            )
+            self.annual = index_tools.annualize(self.quarterly)
+        else:
+            self.quarterly = None
+            self.annual = index_tools.read_zip_house_price_data(
+                filepath, cache=True
+            )
+
+    def run(self, query: dict) -> dict:
+        """
+        answers a single query
+        :param query: query as read from JSON
+        :return: result, with the id and query copied from the query, and
+        "error" if the query could not be answered
+        """
+        res = {"id": query.get("id"), "query": query.get("query")}
+        handler = getattr(self, "query_" + str(query.get("query")), None)
+        if handler is None:
+            res["error"] = f"unknown query {query.get('query')!r}"
+            return res
+        try:
+            with instrument.phase("batch_query." + query["query"]):
+                res.update(handler(query))
+        except KeyError as e:
+            res["error"] = f"missing {e}"
+        except (ValueError, IndexError, TypeError, OSError) as e:
+            res["error"] = str(e)
+        return res
+
+    def query_range(self, query: dict) -> dict:
+        """
+        :param query: has region, quarterly to use quarterly state data, and
+        year0 and year1 to look at only some years
+        :return: high and low of the region
+        """
+        data = self.annual
+        if query.get("quarterly"):
+            if self.quarterly is None:
+                raise ValueError("quarterly ranges need a state file")
+            data = self.quarterly
+        high, low = index_tools.get_hpi_extremes(
+            data, query["region"], query.get("year0"), query.get("year1")
+        )
+        return {
+            "region": query["region"],
+            "high": _hpi_dict(high),
+            "low": _hpi_dict(low),
+        }
+
+    def query_ranking(self, query: dict) -> dict:
+        """
+        :param query: has year, and qtr for a quarter of state data, and k
+        :return: top k and bottom k regions for the period
+        """
+        k = query.get("k", 10)
+        if query.get("qtr") is None:
+            ranking = period_ranking.annual_data(
+                self.annual, query["year"], k=k
+            )
+        else:
+            if self.quarterly is None:
+                raise ValueError("quarterly rankings need a state file")
+            ranking = period_ranking.quarter_data(
+                self.quarterly, query["year"], query["qtr"], k=k
+            )
+        return _ranking_dict(ranking, k)
+
+    def query_trend(self, query: dict) -> dict:
+        """
+        :param query: has year0, year1 and k
+        :return: top k and bottom k regions by compound annual growth rate
+        """
+        k = query.get("k", 10)
+        ranking = trending.calculate_trends(
+            self.annual, query["year0"], query["year1"], k=k
+        )
+        return _ranking_dict(ranking, k)
+
+    def query_annualize(self, query: dict) -> dict:
+        """
+        :param query: has region
+        :return: annual index values of the region, as [year, index] pairs
+        """
+        region = query["region"]
+        return {
+            "region": region,
+            "values": [[hpi.year, hpi.index] for hpi in self.annual[region]],
+        }
+
+    def query_plot(self, query: dict) -> dict:
+        """
+        saves a plot to a file, without displaying it
+        the plot is drawn on a Figure of its own rather than through pyplot,
+        so a plot that fails leaves nothing behind for the next one
+        :param query: has regions, years, output, and kind
+        :return: the file written
+        """
+        from matplotlib.figure import Figure
+        import timeline_plot
+
+        regions = list(query["regions"])
+        missing = [reg for reg in regions if reg not in self.annual]
+        if missing:
+            raise ValueError(f"regions not in data: {missing}")
+        year0, year1 = query["years"]
+        data = timeline_plot.filter_years(
+            self.annual.select(regions=regions), year0, year1
+        )
+        kind = query.get("kind", "timeline")
+        if kind == "timeline":
+            draw = timeline_plot.draw_HPI
+        elif kind == "whiskers":
+            draw = timeline_plot.draw_whiskers
+        else:
+            raise ValueError(f"unknown plot kind {kind!r}")
+        figure = Figure()
+        draw(figure.add_subplot(), data, regions)
+        figure.savefig(query["output"])
+        return {"output": query["output"]}
+
+
+def _hpi_dict(hpi) -> dict:
+    """
+    :param hpi: AnnualHPI or QuarterHPI
+    :return: its fields as a dict
+    """
+    return {
+        "year": hpi.year,
+        "qtr": getattr(hpi, "qtr", None),
+        "index": hpi.index,
+    }
+
+
+def _ranking_dict(ranking, k: int) -> dict:
+    """
+    :param ranking: ranked list or Ranking
+    :param k: how many from each end
+    :return: count of regions ranked, and the top k and bottom k
+    """
+    return {
+        "count": len(ranking),
+        "top": [list(item) for item in ranking[:k]],
+        "bottom": [list(item) for item in ranking[max(len(ranking) - k, 0):]],
+    }
+
+
+class _Unreadable:
+    """
+    a line of a query file that is not a JSON object, given in place of its
+    query so the line still gets a result
+    """
+
+    def __init__(self, error: str):
+        """
+        :param error: why the line could not be read
+        """
+        self.error = error
+
+
+def read_queries(file):
+    """
+    reads queries, one JSON object per line
+    blank lines and lines starting with # are skipped, a line that is not
+    a valid JSON object is given as an _Unreadable with the reason
+    :param file: text file to read
+    :return: generator of query dicts and _Unreadable
+    """
+    for number, line in enumerate(file, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            query = json.loads(line)
+        except ValueError as e:
+            yield _Unreadable(f"line {number}: {e}")
+            continue
+        if not isinstance(query, dict):
+            yield _Unreadable(f"line {number}: not an object")
+            continue
+        yield query
+
+
+def csv_rows(result: dict):
+    """
+    flattens a result into CSV rows
+    :param result: result of QuerySession.run
+    :return: generator of dicts with CSV_FIELDS keys
+    """
+    base = {"id": result.get("id"), "query": result.get("query")}
+    if "error" in result:
+        yield dict(base, error=result["error"])
+        return
+    if "high" in result:
+        for field in ("high", "low"):
+            yield dict(
+                base, field=field, region=result["region"],
+                year=result[field]["year"], qtr=result[field]["qtr"],
+                value=result[field]["index"]
+            )
+    elif "values" in result:
+        for year, value in result["values"]:
+            yield dict(
+                base, field="annual", region=result["region"], year=year,
+                value=value
+            )
+    elif "top" in result:
+        count = result["count"]
+        for field, items, first in (
+                ("top", result["top"], 1),
+                ("bottom", result["bottom"], count - len(result["bottom"]) + 1)
+        ):
+            for i, (region, value) in enumerate(items):
+                yield dict(
+                    base, field=field, rank=first + i, region=region,
+                    value=value
+                )
+    else:
+        yield dict(base, field="output", value=result.get("output"))
+
+
+def run_batch(session: QuerySession, queries, out, fmt: str = "jsonl") -> int:
+    """
+    answers every query and writes the results as they are answered
+    :param session: loaded data
+    :param queries: iterable of query dicts, as given by read_queries
+    :param out: text file to write to
+    :param fmt: "jsonl" or "csv"
+    :return: number of queries that failed
+    """
+    failed = 0
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(out, CSV_FIELDS)
+        writer.writeheader()
+    for query in queries:
+        if isinstance(query, _Unreadable):
+            result = {"id": None, "query": None, "error": query.error}
+        else:
+            result = session.run(query)
+        if "error" in result:
+            failed += 1
+        if writer is None:
+            out.write(json.dumps(result) + "\n")
+        else:
+            writer.writerows(csv_rows(result))
+    return failed
+
+
+def main() -> None:
+    """
+    main function
+    runs if module is run
+    exits with status 1 if any query failed
+    """
+    instrument.from_argv()
+    parser = argparse.ArgumentParser(
+        description="answer a file of queries about one HPI data file"
+    )
+    parser.add_argument("datafile", help="state or ZIP5 data file")
+    parser.add_argument(
+        "queries", nargs="?", help="JSON lines query file, stdin if not given"
+    )
+    parser.add_argument(
+        "--format", choices=("jsonl", "csv"), default="jsonl",
+        help="output format"
+    )
+    parser.add_argument("--output", help="file to write, stdout if not given")
+    args = parser.parse_args()
+
+    # warnings printed while reading would get mixed into the results
+    with contextlib.redirect_stdout(sys.stderr):
+        session = QuerySession(args.datafile)
+    queries = sys.stdin if args.queries is None else open(args.queries, "r")
+    out = sys.stdout if args.output is None else open(args.output, "w",
+                                                       newline="")
+    try:
+        failed = run_batch(session, read_queries(queries), out, args.format)
+    finally:
+        if queries is not sys.stdin:
+            queries.close()
+        if out is not sys.stdout:
+            out.close()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+benchmark.py
+Author: Lyx Huston
+times every stage of the pipeline on made up data
+
+files of each size are written with synthetic_data, then reading, annualize,
+annual_data, calculate_trends, rolling_cagr, filter_years,
+build_plottable_array and build_plottable_matrix are timed on them, best of
+a few runs, and their peak memory is measured with tracemalloc in a separate
+run.  results can be saved as a JSON baseline and later runs compared
+against it, so a change that slows a stage down shows up.
+
+usage:
+python benchmark.py --sizes 1000 100000 1000000 --save baseline.json
+python benchmark.py --sizes 1000 100000 1000000 --compare baseline.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import hpi_dataset
+import index_tools
+import period_ranking
+import synthetic_data
+import trending
+
+BASELINE_VERSION = 1
+# differences in time smaller than this are noise, not regressions
+NOISE_SECONDS = 0.002
+# regions given to build_plottable_array, it is called once per region
+PLOT_REGIONS = 100
+
+
+def _timeline_plot():
+    """
+    :return: the timeline_plot module, imported with a backend that does not
+    need a display
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import timeline_plot
+    return timeline_plot
+
+
+def _quiet(function, *args):
+    """
+    :param function: function to call
+    :param args: arguments to call it with
+    :return: what the function returns, anything it prints is dropped
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args)
+
+
+def _fresh(data: "hpi_dataset.HPIDataset") -> "hpi_dataset.HPIDataset":
+    """
+    :param data: dataset
+    :return: dataset sharing the same columns, but without the indexes built
+    by earlier runs, so every run pays for building them
+    """
+    return hpi_dataset.HPIDataset(
+        data.regions, data.offsets, data.year, data.index, data.qtr
+    )
+
+
+def stages(state_path: str, zip_path: str) -> list:
+    """
+    the stages to time, in pipeline order
+    each stage is a name and a function of the results of the stages before
+    :param state_path: state file to read
+    :param zip_path: ZIP5 file to read
+    :return: list of (name, function) pairs
+    """
+    timeline_plot = _timeline_plot()
+
+    def plottable(res):
+        years = list(range(1990, 2011))
+        data = res["filter_years"]
+        for reg in list(data)[:PLOT_REGIONS]:
+            timeline_plot.build_plottable_array(years, data[reg])
+
+    return [
+        ("read_state", lambda res: _quiet(
+            index_tools.read_state_house_price_data, state_path
+        )),
+        ("read_zip", lambda res: index_tools.read_zip_house_price_data(
+            zip_path
+        )),
+        ("annualize", lambda res: index_tools.annualize(res["read_state"])),
+        ("annual_data", lambda res: period_ranking.annual_data(
+            _fresh(res["read_zip"]), 2005
+        )),
+        ("calculate_trends", lambda res: trending.calculate_trends(
+            _fresh(res["read_zip"]), 1990, 2010
+        )),
+        ("rolling_cagr", lambda res: trending.rolling_cagr(
+            res["read_zip"], 5
+        )),
+        ("filter_years", lambda res: timeline_plot.filter_years(
+            _fresh(res["read_zip"]), 1990, 2010
+        )),
+        ("build_plottable_array", plottable),
+        ("build_plottable_matrix", lambda res: (
+            timeline_plot.build_plottable_matrix(
+                res["filter_years"], list(res["filter_years"])
+            )
+        )),
+    ]
+
+
+def measure(function, res: dict, repeat: int) -> dict:
+    """
+    times a stage and measures its memory
+    :param function: stage function
+    :param res: results of the stages before
+    :param repeat: number of timed runs, the fastest is kept
+    :return: seconds of the fastest run, peak MiB allocated while running,
+    and the result of the stage
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        clock = time.perf_counter()
+        result = function(res)
+        best = min(best, time.perf_counter() - clock)
+    tracemalloc.start()
+    function(res)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": best, "peak_mib": peak / 2 ** 20, "result": result}
+
+
+def run(
+        sizes: list[int],
+        repeat: int = 5,
+        missing_rate: float = None,
+        directory: str = None
+) -> dict:
+    """
+    runs every stage on data of every size
+    :param sizes: data lines in each of the files written
+    :param repeat: number of timed runs of each stage
+    :param missing_rate: share of lines with missing values, or None for
+    the default of each format
+    :param directory: where to write the data, a temporary directory if None
+    :return: results, as saved in a baseline
+    """
+    res = {
+        "version": BASELINE_VERSION,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "repeat": repeat,
+        "sizes": dict(),
+    }
+    with contextlib.ExitStack() as stack:
+        if directory is None:
+            directory = stack.enter_context(tempfile.TemporaryDirectory())
+        for size in sizes:
+            state_path, zip_path = synthetic_data.write_files(
+                os.path.join(directory, str(size)), size, size, missing_rate
+            )
+            done = dict()
+            timings = dict()
+            for name, function in stages(state_path, zip_path):
+                found = measure(function, done, repeat)
+                done[name] = found.pop("result")
+                timings[name] = found
+                print(f"{size:>10} {name:<22} {found['seconds']:10.4f}s "
+                      f"{found['peak_mib']:10.1f} MiB", file=sys.stderr)
+            res["sizes"][str(size)] = timings
+    return res
+
+
+def compare(
+        res: dict, baseline: dict, tolerance: float = 0.25
+) -> list[str]:
+    """
+    prints each stage next to the baseline
+    :param res: results of run
+    :param baseline: results of an earlier run
+    :param tolerance: how much slower or bigger, as a fraction, a stage can
+    be before it counts as a regression
+    :return: descriptions of the regressions
+    """
+    regressions = []
+    print(f"{'size':>10} {'stage':<22} {'seconds':>10} {'baseline':>10} "
+          f"{'ratio':>7} {'MiB':>8} {'baseline':>8}")
+    for size, timings in res["sizes"].items():
+        for name, found in timings.items():
+            before = baseline.get("sizes", dict()).get(size, dict()).get(name)
+            if before is None:
+                print(f"{size:>10} {name:<22} {found['seconds']:10.4f} "
+                      f"{'-':>10} {'-':>7} {found['peak_mib']:8.1f} {'-':>8}")
+                continue
+            ratio = found["seconds"] / max(before["seconds"], 1e-9)
+            flag = ""
+            slower = found["seconds"] - before["seconds"] > NOISE_SECONDS
+            if ratio > 1 + tolerance and slower:
+                flag = " slower"
+                regressions.append(f"{name} at {size} rows is {ratio:.2f}x "
+                                   "slower")
+            if found["peak_mib"] > before["peak_mib"] * (1 + tolerance) + 1:
+                flag += " bigger"
+                regressions.append(
+                    f"{name} at {size} rows peaks at "
+                    f"{found['peak_mib']:.1f} MiB, was "
+                    f"{before['peak_mib']:.1f} MiB"
+                )
+            print(f"{size:>10} {name:<22} {found['seconds']:10.4f} "
+                  f"{before['seconds']:10.4f} {ratio:7.2f} "
+                  f"{found['peak_mib']:8.1f} {before['peak_mib']:8.1f}{flag}")
+    return regressions
+
+
+def main() -> None:
+    """
+    main function
+    runs if module is run
+    exits with status 1 if compared against a baseline and a stage regressed
+    """
+    parser = argparse.ArgumentParser(
+        description="benchmark the pipeline on made up data"
+    )
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 100000],
+                        help="data lines in each file, one run per size")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="timed runs of each stage, the fastest is kept")
+    parser.add_argument("--missing-rate", type=float,
+                        help="share of lines with missing values")
+    parser.add_argument("--data-dir",
+                        help="directory to write the data files to")
+    parser.add_argument("--save", help="file to save the results to")
+    parser.add_argument("--compare", help="baseline file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="fraction slower or bigger that is a regression")
+    args = parser.parse_args()
+
+    res = run(args.sizes, args.repeat, args.missing_rate, args.data_dir)
+    if args.save is not None:
+        with open(args.save, "w") as file:
+            json.dump(res, file, indent=2)
+    if args.compare is not None:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+        regressions = compare(res, baseline, args.tolerance)
+        for line in regressions:
+            print(f"regression: {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+drawdown.py
+Author: Lyx Huston
+peak to trough drawdowns and recoveries of every region
+
+the data is laid out as a region by period matrix, and the running high of
+every region is found with one accumulate along the periods, so the drawdown
+series of all regions come out of a single pass.  crash_table finds, for
+every region at once, the peak before a crash year, the trough after it, the
+percentage drawdown and how long the index took to get back to the peak.
+the table ranks into a list that index_tools.print_ranking can print.
+
+usage:
+python drawdown.py data/HPI_PO_state.txt
+python drawdown.py data/HPI_AT_ZIP5.txt --crash 2007
+"""
+
+import argparse
+import contextlib
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+
+import hpi_dataset
+import index_tools
+import instrument
+import period_ranking
+
+
+@dataclass(slots=True)
+class Drawdown:
+    """
+    the fall of one region from its peak, one line of a ranking
+    periods are years, or (year, quarter) for quarterly data
+    """
+    region: str
+    drawdown: float
+    peak: tuple
+    trough: tuple
+    # years from the peak until the index was back to it, None if not yet
+    recovery_years: float = None
+
+    def __str__(self) -> str:
+        recovered = "not recovered" if self.recovery_years is None else \
+            f"recovered in {self.recovery_years:g} years"
+        return (f"{self.region}: {self.drawdown:.2f}% from "
+                f"{_period_name(self.peak)} to {_period_name(self.trough)}, "
+                f"{recovered}")
+
+
+def _period_name(period: tuple) -> str:
+    """
+    :param period: (year, index) or (year, quarter, index)
+    :return: period as text, like 2006 Q2 (230.10)
+    """
+    if len(period) == 2:
+        return f"{period[0]} ({period[1]:.2f})"
+    return f"{period[0]} Q{period[1]} ({period[2]:.2f})"
+
+
+def running_max(matrix: np.ndarray) -> np.ndarray:
+    """
+    :param matrix: region by period matrix, NaN where there is no data
+    :return: highest value of each region up to each period, NaN before the
+    first data
+    """
+    return np.fmax.accumulate(matrix, axis=1)
+
+
+@instrument.timed("drawdown.drawdown_matrix", rows=lambda res: len(res[0]))
+def drawdown_matrix(
+        data: "hpi_dataset.HPIDataset"
+) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """
+    percent below the running high of every region in every period
+    :param data: annual or quarterly HPIDataset
+    :return: list of regions, periods as in HPIDataset.period_keys, and array
+    of drawdown indexed by region then position in periods, 0 at a new high
+    and NaN where there is no data
+    """
+    periods, matrix = data.period_matrix()
+    with np.errstate(invalid="ignore"):
+        res = matrix / running_max(matrix)
+    res -= 1
+    res *= 100
+    return list(data.regions), periods, res
+
+
+@dataclass()
+class DrawdownTable:
+    """
+    the crash of every region with data before it, as arrays
+    columns are positions in periods, -1 where there is none
+    """
+    regions: list[str]
+    quarterly: bool
+    periods: np.ndarray
+    matrix: np.ndarray
+    # region number of each entry
+    ids: np.ndarray
+    peak: np.ndarray
+    trough: np.ndarray
+    recovery: np.ndarray
+    drawdown: np.ndarray
+    recovery_years: np.ndarray
+
+    def entry(self, i: int) -> Drawdown:
+        """
+        :param i: position in the table
+        :return: the entry as a Drawdown
+        """
+        years = float(self.recovery_years[i])
+        return Drawdown(
+            self.regions[int(self.ids[i])],
+            float(self.drawdown[i]),
+            self._period(i, int(self.peak[i])),
+            self._period(i, int(self.trough[i])),
+            None if np.isnan(years) else years
+        )
+
+    def _period(self, i: int, col: int) -> tuple:
+        """
+        :param i: position in the table
+        :param col: column of the period
+        :return: (year, index) or (year, quarter, index)
+        """
+        value = float(self.matrix[int(self.ids[i]), col])
+        period = int(self.periods[col])
+        if self.quarterly:
+            return period // 4, period % 4 + 1, value
+        return period, value
+
+    def ranking(self, k: int = None):
+        """
+        ranks the regions from the deepest drawdown to the shallowest
+        ties keep the order of the regions in the dataset
+        :param k: only keep the top k and bottom k, see period_ranking.rank
+        :return: list of Drawdown if k is None, otherwise a Ranking of them,
+        either works with index_tools.print_ranking
+        """
+        order = np.argsort(self.drawdown, kind="stable")
+        if k is None or 2 * k >= len(order):
+            return [self.entry(i) for i in order.tolist()]
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        return period_ranking.Ranking(
+            [self.entry(i) for i in order[:k].tolist()],
+            [self.entry(i) for i in order[len(order) - k:].tolist()],
+            len(order)
+        )
+
+
+@instrument.timed("drawdown.crash_table", rows=lambda res: len(res.ids))
+def crash_table(
+        data: "hpi_dataset.HPIDataset", crash: int = 2008
+) -> DrawdownTable:
+    """
+    finds the crash of every region at once
+    the peak is the highest value before the crash year, the earliest if
+    reached more than once.  the trough is the lowest value from the crash
+    year on, so a dip between the peak and the crash is not taken for it,
+    and the drawdown is the percent from the peak to the trough.  recovery
+    is the first period from the trough on back at the peak, and
+    recovery_years is how long after the peak that was, NaN if never.
+    regions with no data before the crash year, or none from it on, are
+    left out
+    :param data: annual or quarterly HPIDataset
+    :param crash: first year counted as after the peak
+    :return: the table
+    """
+    periods, matrix = data.period_matrix()
+    per_year = 4 if data.quarterly else 1
+    cols = np.arange(len(periods))
+    missing = np.isnan(matrix)
+    before = periods < crash * per_year
+    pre = np.where(before & ~missing, matrix, -np.inf)
+    peak = np.argmax(pre, axis=1)
+    rows = np.arange(len(matrix))
+    peak_value = pre[rows, peak]
+    # every peak is before the crash year, so these are all after it
+    post = np.where(~before & ~missing, matrix, np.inf)
+    trough = np.argmin(post, axis=1)
+    ids = np.flatnonzero(
+        (peak_value > -np.inf) & (post[rows, trough] < np.inf)
+    )
+    peak, trough, peak_value = peak[ids], trough[ids], peak_value[ids]
+    found = matrix[ids]
+    drawdown = (found[np.arange(len(ids)), trough] / peak_value - 1) * 100
+    back = (cols >= trough[:, None]) & (found >= peak_value[:, None])
+    recovery = np.where(back.any(axis=1), np.argmax(back, axis=1), -1)
+    recovery_years = np.where(
+        recovery >= 0,
+        (periods[recovery] - periods[peak]) / per_year,
+        np.nan
+    )
+    return DrawdownTable(
+        list(data.regions), data.quarterly, periods, matrix, ids, peak,
+        trough, recovery, drawdown, recovery_years
+    )
+
+
+def main() -> None:
+    """
+    main function
+    runs if module is run
+    prints the deepest and shallowest drawdowns of the regions in a file
+    """
+    instrument.from_argv()
+    parser = argparse.ArgumentParser(
+        description="rank regions by their fall from peak to trough"
+    )
+    parser.add_argument("datafile", help="state or ZIP5 data file")
+    parser.add_argument("--crash", type=int, default=2008,
+                        help="first year after the peak")
+    parser.add_argument("--annual", action="store_true",
+                        help="annualize state data before looking for peaks")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        if "state" in args.datafile:
+            data = index_tools.read_state_house_price_data(
+                args.datafile, cache=True
+            )
+            if args.annual:
+                data = index_tools.annualize(data)
+        else:
+            data = index_tools.read_zip_house_price_data(
+                args.datafile, cache=True
+            )
+    table = crash_table(data, args.crash)
+    ranking = table.ranking(10)
+    heading = f"Drawdown from the peak before {args.crash}, deepest first"
+    if len(ranking) < 20:
+        print(heading)
+        for i in range(len(ranking)):
+            print(f"{i + 1}: {ranking[i]}")
+    else:
+        index_tools.print_ranking(ranking, heading)
+
+
+if __name__ == "__main__":
+    main()
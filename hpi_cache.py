@@ -0,0 +1,334 @@
+"""
+hpi_cache.py
+Author: Lyx Huston
+binary cache of parsed house price index files
+
+the first time a file is parsed, the columns of the dataset are saved as .npy
+files in a sidecar directory next to it (data/HPI_AT_ZIP5.txt gets
+data/HPI_AT_ZIP5.txt.hpicache/).  later runs memory map those instead of
+parsing the text again.
+
+the cache is checked against the size and modification time of the file, and
+if those changed, against a hash of its contents.  a cache that does not match
+is rebuilt.
+
+a file of only new and revised rows, like the next quarter of a release, can
+be merged into the cache with merge_file, without parsing the data file again.
+
+a cache is written in a directory of its own and renamed into place whole, so
+processes saving at once do not mix their columns.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import hpi_dataset
+import hpi_parse
+import instrument
+
+CACHE_VERSION = 2
+SUFFIX = ".hpicache"
+
+# name of each saved column, and the type it is saved as
+_COLUMNS = {
+    "offsets": np.int64,
+    "year": np.int32,
+    "qtr": np.int8,
+    "index": np.float64,
+}
+
+
+def cache_dir(filepath: str) -> str:
+    """
+    :param filepath: path to data file
+    :return: path of the sidecar directory for that file
+    """
+    return filepath + SUFFIX
+
+
+def file_hash(filepath: str, block_size: int = 1024 * 1024) -> str:
+    """
+    hashes the contents of a file
+    :param filepath: path to file
+    :param block_size: bytes to read at a time
+    :return: hex digest
+    """
+    digest = hashlib.blake2b()
+    with open(filepath, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _source_key(filepath: str, fmt: "hpi_parse.FileFormat") -> dict:
+    """
+    :param filepath: path to data file
+    :param fmt: format the file is parsed with
+    :return: what a cache of the file must have been made from, except hash
+    """
+    stat = os.stat(filepath)
+    return {
+        "version": CACHE_VERSION,
+        "source": os.path.abspath(filepath),
+        "format": fmt.header.decode(),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+    }
+
+
+def _read_meta(directory: str) -> dict:
+    """
+    :param directory: cache directory
+    :return: metadata of the cache, or None if there is no complete cache
+    """
+    try:
+        with open(os.path.join(directory, "meta.json"), "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(directory: str, meta: dict) -> None:
+    """
+    writes the metadata of a cache, this is done last as it marks the cache as
+    complete
+    :param directory: cache directory
+    :param meta: metadata
+    :return: None
+    """
+    handle, temp = tempfile.mkstemp(suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(handle, "w") as file:
+            json.dump(meta, file)
+        os.replace(temp, os.path.join(directory, "meta.json"))
+    except OSError:
+        os.remove(temp)
+        raise
+
+
+def _same_cache(meta: dict, other: dict) -> bool:
+    """
+    :param meta: metadata of a cache
+    :param other: metadata of a cache, or None
+    :return: whether both are of the same data, from the same file and
+    updates
+    """
+    return other is not None and all(
+        meta.get(name) == other.get(name) for name in ("hash", "updates")
+    )
+
+
+def save(
+        directory: str,
+        data: "hpi_dataset.HPIDataset",
+        meta: dict
+) -> None:
+    """
+    saves a dataset as a cache
+    the cache is written to a new directory next to the old one, which is
+    then moved aside and removed.  if another process puts its cache in
+    place in between, that one is kept
+    :param directory: cache directory
+    :param data: dataset to save
+    :param meta: metadata identifying the source of the dataset
+    :return: None
+    """
+    parent, base = os.path.split(os.path.abspath(directory))
+    staging = tempfile.mkdtemp(prefix=base + ".", suffix=".tmp", dir=parent)
+    old = staging + ".old"
+    try:
+        for name, kind in _COLUMNS.items():
+            column = getattr(data, name)
+            if column is not None:
+                np.save(
+                    os.path.join(staging, name + ".npy"),
+                    np.asarray(column, dtype=kind)
+                )
+        np.save(
+            os.path.join(staging, "regions.npy"),
+            np.array(data.regions, dtype=str)
+        )
+        _write_meta(staging, meta)
+        try:
+            os.rename(directory, old)
+        except FileNotFoundError:
+            pass
+        try:
+            os.rename(staging, directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def open_cache(directory: str) -> "hpi_dataset.HPIDataset":
+    """
+    memory maps a saved dataset
+    :param directory: cache directory
+    :return: the dataset, with columns read from disk as they are used
+    """
+    columns = dict()
+    for name in _COLUMNS:
+        path = os.path.join(directory, name + ".npy")
+        if name == "qtr" and not os.path.exists(path):
+            columns[name] = None
+        else:
+            columns[name] = np.load(path, mmap_mode="r")
+    regions = np.load(os.path.join(directory, "regions.npy")).tolist()
+    return hpi_dataset.HPIDataset(
+        regions,
+        columns["offsets"],
+        columns["year"],
+        columns["index"],
+        columns["qtr"]
+    )
+
+
+def _select(
+        data: "hpi_dataset.HPIDataset",
+        stats: "hpi_parse.ParseStats",
+        regions,
+        years: tuple[int, int]
+) -> "hpi_dataset.HPIDataset":
+    """
+    picks regions and years out of a whole dataset, counting the rows left out
+    :param data: whole dataset
+    :param stats: counts for the whole dataset, updated
+    :param regions: region keys to keep, or None for all
+    :param years: (first, last) years to keep, or None for all
+    :return: the selected rows
+    """
+    if regions is None and years is None:
+        return data
+    res = data.select(regions, years)
+    stats.skipped += stats.rows - res.row_count
+    stats.rows = res.row_count
+    return res
+
+
+@instrument.timed("hpi_cache.parse_file", rows=lambda res: res[0].row_count)
+def parse_file(
+        filepath: str,
+        fmt: "hpi_parse.FileFormat",
+        timings: bool = False,
+        regions=None,
+        years: tuple[int, int] = None,
+        workers: int = 1
+) -> tuple["hpi_dataset.HPIDataset", "hpi_parse.ParseStats"]:
+    """
+    hpi_parse.parse_file, but using and keeping a cache of the result
+    if the cache cannot be written, the file is still parsed and returned
+    the cache always holds the whole file, regions and years are picked out
+    of the memory mapped columns, so only their rows are copied
+    :param filepath: path to data file
+    :param fmt: format of the file
+    :param timings: whether to print the counts and timings when done
+    :param regions: region keys to keep, or None for all
+    :param years: (first, last) years to keep, or None for all
+    :param workers: processes to parse with if the cache is not used, None
+    for one per CPU
+    :return: the dataset and counts of what was read when it was parsed
+    """
+    directory = cache_dir(filepath)
+    key = _source_key(filepath, fmt)
+    meta = _read_meta(directory)
+    fresh = meta is not None and all(
+        meta.get(name) == value for name, value in key.items()
+    )
+    if not fresh and meta is not None and meta.get("size") == key["size"]:
+        # touched but maybe not changed
+        key["hash"] = file_hash(filepath)
+        if meta.get("hash") == key["hash"] and all(
+                meta.get(name) == key[name]
+                for name in ("version", "source", "format")
+        ):
+            meta.update(key)
+            try:
+                _write_meta(directory, meta)
+            except OSError:
+                pass
+            fresh = True
+    if fresh:
+        clock = time.perf_counter()
+        try:
+            data = open_cache(directory)
+        except (OSError, ValueError):
+            # moved aside by a save in another process
+            data = None
+        # a cache saved by another process while the columns were mapped
+        # may have mixed them
+        fresh = data is not None and _same_cache(meta, _read_meta(directory))
+    if fresh:
+        stats = hpi_parse.ParseStats(
+            rows=data.row_count,
+            missing=meta["missing"],
+            malformed=meta["malformed"],
+            bytes=meta["size"],
+            read_seconds=time.perf_counter() - clock
+        )
+        data = _select(data, stats, regions, years)
+        if timings:
+            print(f"loaded {filepath} from cache {directory}")
+            print(stats)
+        return data, stats
+    if "hash" not in key:
+        key["hash"] = file_hash(filepath)
+    data, stats = hpi_parse.parse_file(
+        filepath, fmt, timings=timings, workers=workers
+    )
+    key["missing"] = stats.missing
+    key["malformed"] = stats.malformed
+    try:
+        save(directory, data, key)
+    except OSError:
+        pass
+    return _select(data, stats, regions, years), stats
+
+
+@instrument.timed("hpi_cache.merge_file", rows=lambda res: res[0].row_count)
+def merge_file(
+        filepath: str,
+        fmt: "hpi_parse.FileFormat",
+        update_path: str,
+        timings: bool = False
+) -> tuple["hpi_dataset.HPIDataset", "hpi_parse.ParseStats"]:
+    """
+    merges a file of new and revised rows, like a new quarter, into the cache
+    of a data file, so the data file does not have to be parsed again
+    the merged data is saved as the cache of the data file, and the update is
+    listed in its metadata.  if the data file itself changes, the cache is
+    rebuilt from it and the updates are dropped
+    :param filepath: path to data file
+    :param fmt: format of both files
+    :param update_path: path to the file of new and revised rows
+    :param timings: whether to print the counts and timings when done
+    :return: the merged dataset and counts of what was read from the update
+    """
+    data, _ = parse_file(filepath, fmt, timings=timings)
+    update, stats = hpi_parse.parse_file(update_path, fmt, timings=timings)
+    merged = data.merge(update)
+    directory = cache_dir(filepath)
+    meta = _read_meta(directory)
+    if meta is not None:
+        key = _source_key(update_path, fmt)
+        meta["missing"] += stats.missing
+        meta["malformed"] += stats.malformed
+        meta.setdefault("updates", []).append({
+            "source": key["source"],
+            "size": key["size"],
+            "mtime": key["mtime"],
+            "hash": file_hash(update_path),
+        })
+        try:
+            save(directory, merged, meta)
+        except OSError:
+            pass
+    return merged, stats
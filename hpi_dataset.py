@@ -0,0 +1,776 @@
+"""
+hpi_dataset.py
+Author: Lyx Huston
+columnar storage for house price index data
+
+the read functions in index_tools used to build a dict of region to list of
+HPI objects, one object per line of the file.  HPIDataset keeps the same data
+in a few contiguous numpy arrays instead, and only builds HPI objects when a
+region is looked up, so code written against the dict still works.
+"""
+
+from collections.abc import Mapping
+
+import numpy as np
+
+import index_tools
+
+
+class HPIDataset(Mapping):
+    """
+    holds HPI data for many regions in columns
+    rows of region number i are at offsets[i]:offsets[i + 1] in every column,
+    in ascending order by year and quarter
+    qtr is None for annual data
+    each region key is kept once, in regions, and rows only hold the number
+    of their region, positions maps keys back to numbers
+    looking up a region gives a new list of QuarterHPI or AnnualHPI objects
+    """
+
+    def __init__(
+            self,
+            regions: list[str],
+            offsets: np.ndarray,
+            year: np.ndarray,
+            index: np.ndarray,
+            qtr: np.ndarray = None
+    ):
+        """
+        :param regions: region keys, in order
+        :param offsets: row offsets of each region, one longer than regions
+        :param year: year of each row
+        :param index: index value of each row
+        :param qtr: quarter of each row, or None if data is annual
+        """
+        self.regions = list(regions)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.year = np.asarray(year, dtype=np.int32)
+        self.index = np.asarray(index, dtype=np.float64)
+        self.qtr = None if qtr is None else np.asarray(qtr, dtype=np.int8)
+        self._positions = None
+        self._region_ids = None
+        self._period_index = None
+        self._year_keys = None
+        self._extremes = None
+
+    @classmethod
+    def from_rows(
+            cls,
+            keys: list[str],
+            year,
+            index,
+            qtr=None
+    ) -> "HPIDataset":
+        """
+        groups rows by region key
+        regions are kept in order of first appearance, rows of a region are
+        kept in the order given
+        :param keys: region key of each row
+        :param year: year of each row
+        :param index: index value of each row
+        :param qtr: quarter of each row, or None if data is annual
+        :return: dataset holding the rows
+        """
+        codes = dict()
+        code = np.fromiter(
+            (codes.setdefault(key, len(codes)) for key in keys),
+            dtype=np.int64, count=len(keys)
+        )
+        return cls.from_codes(list(codes), code, year, index, qtr)
+
+    @classmethod
+    def from_codes(
+            cls,
+            regions: list[str],
+            code: np.ndarray,
+            year,
+            index,
+            qtr=None
+    ) -> "HPIDataset":
+        """
+        groups rows by region number
+        rows of a region are sorted by year and quarter, rows of the same
+        period are kept in the order given
+        :param regions: region keys, in order
+        :param code: number of the region of each row
+        :param year: year of each row
+        :param index: index value of each row
+        :param qtr: quarter of each row, or None if data is annual
+        :return: dataset holding the rows
+        """
+        code = np.asarray(code, dtype=np.int64)
+        year = np.asarray(year, dtype=np.int32)
+        index = np.asarray(index, dtype=np.float64)
+        if qtr is not None:
+            qtr = np.asarray(qtr, dtype=np.int8)
+        columns = [code, year] + ([] if qtr is None else [qtr])
+        if not rows_sorted(columns):
+            order = np.lexsort(columns[::-1])
+            year = year[order]
+            index = index[order]
+            if qtr is not None:
+                qtr = qtr[order]
+        offsets = np.zeros(len(regions) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(code, minlength=len(regions)), out=offsets[1:])
+        return cls(regions, offsets, year, index, qtr)
+
+    @classmethod
+    def from_dict(
+            cls,
+            data: dict[str, list]
+    ) -> "HPIDataset":
+        """
+        builds a dataset from a dict of region to list of HPI objects
+        :param data: dict of region to list of QuarterHPI or AnnualHPI
+        :return: dataset holding the same data
+        """
+        regions = []
+        lengths = []
+        year = []
+        index = []
+        qtr = []
+        for reg in data:
+            if not data[reg]:
+                continue
+            regions.append(reg)
+            lengths.append(len(data[reg]))
+            for hpi in data[reg]:
+                year.append(hpi.year)
+                index.append(hpi.index)
+                if isinstance(hpi, index_tools.QuarterHPI):
+                    qtr.append(hpi.qtr)
+        if len(qtr) != len(year):
+            qtr = None
+        # rows are numbered by region as they are read, the keys are not
+        # looked up for every row
+        code = np.repeat(np.arange(len(regions)), lengths)
+        return cls.from_codes(regions, code, year, index, qtr)
+
+    @property
+    def quarterly(self) -> bool:
+        """
+        :return: whether the rows are quarters rather than years
+        """
+        return self.qtr is not None
+
+    @property
+    def row_count(self) -> int:
+        """
+        :return: number of rows across all regions
+        """
+        return len(self.index)
+
+    @property
+    def region_ids(self) -> np.ndarray:
+        """
+        :return: the number of the region each row belongs to
+        """
+        if self._region_ids is None:
+            self._region_ids = np.repeat(
+                np.arange(len(self.regions), dtype=np.int64),
+                np.diff(self.offsets)
+            )
+        return self._region_ids
+
+    @property
+    def positions(self) -> dict[str, int]:
+        """
+        :return: lookup table of region key to region number, the reverse of
+        regions
+        """
+        if self._positions is None:
+            self._positions = {
+                reg: i for i, reg in enumerate(self.regions)
+            }
+        return self._positions
+
+    def position(self, region: str) -> int:
+        """
+        :param region: region key
+        :return: number of the region, raises KeyError if not present
+        """
+        return self.positions[region]
+
+    def codes(self, regions) -> np.ndarray:
+        """
+        looks up many regions at once
+        :param regions: region keys
+        :return: number of each region, -1 for regions not present
+        """
+        get = self.positions.get
+        return np.fromiter(
+            (get(reg, -1) for reg in regions), dtype=np.int64
+        )
+
+    def span(self, region: str) -> tuple[int, int]:
+        """
+        :param region: region key
+        :return: start and stop of the rows of the region
+        """
+        i = self.position(region)
+        return int(self.offsets[i]), int(self.offsets[i + 1])
+
+    def record(self, row: int):
+        """
+        builds a single HPI object
+        :param row: row number
+        :return: QuarterHPI or AnnualHPI for that row
+        """
+        if self.qtr is None:
+            return index_tools.AnnualHPI(
+                int(self.year[row]), float(self.index[row])
+            )
+        return index_tools.QuarterHPI(
+            int(self.year[row]), int(self.qtr[row]), float(self.index[row])
+        )
+
+    def cross_section(
+            self, year: int, qtr: int = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        finds the rows of every region for a single period
+        :param year: year looking at
+        :param qtr: quarter looking at, or None for any quarter
+        :return: region numbers and index values of the matching rows
+        """
+        mask = self.year == year
+        if qtr is not None:
+            mask &= self.qtr == qtr
+        return self.region_ids[mask], self.index[mask]
+
+    def year_matrix(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        lays annual data out as a dense region by year matrix
+        if a region has a year more than once the last one is used, same as
+        trending.search_for_annualhpi_of_years
+        :return: array of every year from the first to the last, and a matrix
+        with a row per region and a column per year, NaN where there is no data
+        """
+        if self.quarterly:
+            raise ValueError("year_matrix needs annual data, annualize first")
+        years, matrix = self.period_matrix()
+        return years.astype(np.int32), matrix
+
+    def period_matrix(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        lays the data out as a dense region by period matrix, periods are
+        years for annual data and quarters for quarterly data, see
+        period_keys.  a region with a period more than once has the last one
+        :return: array of every period from the first to the last, and a
+        matrix with a row per region and a column per period, NaN where there
+        is no data
+        """
+        if not self.row_count:
+            return (np.zeros(0, dtype=np.int64),
+                    np.full((len(self.regions), 0), np.nan))
+        keys = self.period_keys()
+        low = int(keys.min())
+        periods = np.arange(low, int(keys.max()) + 1, dtype=np.int64)
+        matrix = np.full((len(self.regions), len(periods)), np.nan)
+        matrix[self.region_ids, keys - low] = self.index
+        return periods, matrix
+
+    def year_bounds(
+            self, first: int, last: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        finds the rows of every region in a range of years
+        rows are sorted by region then year, so this is a binary search on
+        one key made of both
+        :param first: first year to include
+        :param last: last year to include
+        :return: start and stop row of each region
+        """
+        if self._year_keys is None:
+            low = int(self.year.min()) if self.row_count else 0
+            span = int(self.year.max()) - low + 2 if self.row_count else 1
+            self._year_keys = (
+                self.region_ids * span + (self.year - low), low, span
+            )
+        keys, low, span = self._year_keys
+        base = np.arange(len(self.regions), dtype=np.int64) * span
+        starts = np.searchsorted(
+            keys, base + min(max(first - low, 0), span - 1)
+        )
+        stops = np.searchsorted(
+            keys, base + min(max(last + 1 - low, 0), span - 1)
+        )
+        return starts, np.maximum(starts, stops)
+
+    def period_index(self) -> "PeriodIndex":
+        """
+        :return: index of the cross section of every period, built the first
+        time it is asked for
+        """
+        if self._period_index is None:
+            self._period_index = PeriodIndex(self)
+        return self._period_index
+
+    def extremes(self) -> "ExtremesTable":
+        """
+        :return: table for finding highs and lows over windows of rows,
+        built the first time it is asked for
+        """
+        if self._extremes is None:
+            self._extremes = ExtremesTable(self.index, self.offsets)
+        return self._extremes
+
+    def window_extremes(
+            self, first: int = None, last: int = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        finds the high and low of every region over a range of years
+        :param first: first year to include, or None for the earliest
+        :param last: last year to include, or None for the latest
+        :return: row of the high and row of the low of each region, the
+        earliest if more than one, -1 if the region has no rows in the years
+        """
+        if first is None and last is None:
+            starts, stops = self.offsets[:-1], self.offsets[1:]
+        else:
+            starts, stops = self.year_bounds(
+                -2 ** 31 if first is None else first,
+                2 ** 31 - 2 if last is None else last
+            )
+        return self.extremes().query(starts, stops)
+
+    @staticmethod
+    def span_rows(starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+        """
+        row numbers of many spans of rows at once, without a loop
+        :param starts: first row of each span
+        :param stops: row after the last of each span
+        :return: rows of every span, one span after another
+        """
+        lengths = stops - starts
+        # each span's rows run from its start
+        return np.arange(int(lengths.sum())) + np.repeat(
+            starts - np.cumsum(lengths) + lengths, lengths
+        )
+
+    def take(self, rows: np.ndarray, keep: np.ndarray = None) -> "HPIDataset":
+        """
+        copies out some of the rows
+        regions left with no rows are dropped, unless in keep
+        :param rows: ascending row numbers to keep
+        :param keep: region numbers to keep even if left with no rows
+        :return: dataset of those rows
+        """
+        ids = self.region_ids[rows]
+        counts = np.bincount(ids, minlength=len(self.regions))
+        kept = np.flatnonzero(counts)
+        if keep is not None:
+            kept = np.union1d(kept, keep)
+        offsets = np.zeros(len(kept) + 1, dtype=np.int64)
+        np.cumsum(counts[kept], out=offsets[1:])
+        return HPIDataset(
+            [self.regions[i] for i in kept.tolist()],
+            offsets,
+            self.year[rows],
+            self.index[rows],
+            None if self.qtr is None else self.qtr[rows]
+        )
+
+    def select(
+            self,
+            regions=None,
+            years: tuple[int, int] = None,
+            drop_empty: bool = True
+    ) -> "HPIDataset":
+        """
+        copies out the rows of some regions and years
+        regions not in the dataset are ignored
+        :param regions: region keys to keep, or None for all
+        :param years: (first, last) years to keep, or None for all
+        :param drop_empty: whether to drop regions with no rows in the years,
+        if False every region asked for is kept, even with no rows
+        :return: dataset of the selected rows, regions keep their order
+        """
+        if regions is None:
+            found = np.arange(len(self.regions))
+        else:
+            found = np.unique(self.codes(regions))
+            found = found[found >= 0]
+        if years is None:
+            starts = self.offsets[found]
+            stops = self.offsets[found + 1]
+        else:
+            starts, stops = self.year_bounds(years[0], years[1])
+            starts = starts[found]
+            stops = stops[found]
+        rows = self.span_rows(starts, stops)
+        return self.take(rows, None if drop_empty else found)
+
+    def year_starts(self) -> np.ndarray:
+        """
+        rows are sorted by region then year, so the quarters of a year of a
+        region are next to each other
+        :return: first row of each year of each region, and the row count at
+        the end
+        """
+        if not self.row_count:
+            return np.zeros(1, dtype=np.int64)
+        change = np.empty(self.row_count, dtype=bool)
+        change[0] = True
+        np.not_equal(self.year[1:], self.year[:-1], out=change[1:])
+        # a region starting on the same year as the last one ended
+        change[self.offsets[1:-1][np.diff(self.offsets)[1:] > 0]] = True
+        return np.append(np.flatnonzero(change), self.row_count)
+
+    def quarter_counts(self) -> np.ndarray:
+        """
+        :return: number of quarters in each year of each region, in the order
+        of the rows of annualized(), so partial years can be found
+        """
+        if self.qtr is None:
+            return np.ones(self.row_count, dtype=np.int64)
+        return np.diff(self.year_starts())
+
+    def annualized(self, min_quarters: int = 1) -> "HPIDataset":
+        """
+        averages the quarters of each year for each region
+        the years are found in one pass over the sorted rows, and summed with
+        one bincount.  quarters are summed in row order, same as
+        index_tools.annualize
+        :param min_quarters: fewest quarters a year needs to be kept, 4 to
+        leave out partial years
+        :return: annual dataset
+        """
+        if self.qtr is None:
+            return self
+        starts = self.year_starts()
+        counts = np.diff(starts)
+        group = np.repeat(np.arange(len(counts)), counts)
+        sums = np.bincount(group, weights=self.index, minlength=len(counts))
+        first = starts[:-1]
+        region = self.region_ids[first]
+        kept = counts >= min_quarters
+        if not kept.all():
+            first, region = first[kept], region[kept]
+            sums, counts = sums[kept], counts[kept]
+        offsets = np.zeros(len(self.regions) + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(region, minlength=len(self.regions)),
+            out=offsets[1:]
+        )
+        return HPIDataset(
+            self.regions, offsets, self.year[first], sums / counts
+        )
+
+    def period_keys(self, year=None, qtr=None) -> np.ndarray:
+        """
+        :param year: years, the year column if None
+        :param qtr: quarters, the quarter column if None
+        :return: number of the period of each row, the year for annual data
+        and year * 4 + quarter - 1 for quarterly data
+        """
+        year = self.year if year is None else year
+        if not self.quarterly:
+            return np.asarray(year, dtype=np.int64)
+        qtr = self.qtr if qtr is None else qtr
+        return np.asarray(year, dtype=np.int64) * 4 + qtr - 1
+
+    def merge(self, update: "HPIDataset") -> "HPIDataset":
+        """
+        merges new and revised rows, like those of a new release, into a copy
+        of the dataset
+        a row of the update replaces every row of the same region and period,
+        other rows of the update are added.  if the update has a region and
+        period more than once only its last row of them is used.  regions
+        only in the update are added after the others, so the numbers of the
+        regions already here do not change.  only the update is sorted, the
+        rows here are copied once
+        if the period index was built, only the periods in the update are
+        indexed again
+        :param update: dataset of the new and revised rows
+        :return: merged dataset
+        """
+        if update.quarterly != self.quarterly:
+            raise ValueError("cannot merge annual and quarterly data")
+        regions = list(self.regions)
+        codes = dict(self.positions)
+        new_code = np.array(
+            [codes.setdefault(reg, len(codes)) for reg in update.regions],
+            dtype=np.int64
+        )
+        regions += list(codes)[len(self.regions):]
+        code = new_code[update.region_ids]
+        period = update.period_keys()
+        order = np.lexsort((period, code))
+        code = code[order]
+        period = period[order]
+        # the sort is stable, so the last of a run of the same key is the
+        # last row of it in the update
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = (code[1:] != code[:-1]) | (period[1:] != period[:-1])
+        order = order[last]
+        code = code[last]
+        period = period[last]
+
+        # one sortable key for region and period, rows here are in key order
+        both = np.concatenate((self.period_keys(), period))
+        low = int(both.min()) if len(both) else 0
+        span = int(both.max()) - low + 1 if len(both) else 1
+        keys = self.region_ids * span + (self.period_keys() - low)
+        update_keys = code * span + (period - low)
+        starts = np.searchsorted(keys, update_keys)
+        stops = np.searchsorted(keys, update_keys, "right")
+        # rows covered by any [start, stop) are replaced
+        marks = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.add.at(marks, starts, 1)
+        np.add.at(marks, stops, -1)
+        kept = np.flatnonzero(np.cumsum(marks[:-1]) == 0)
+        at = np.searchsorted(keys[kept], update_keys, "right")
+
+        counts = np.bincount(
+            self.region_ids[kept], minlength=len(regions)
+        ) + np.bincount(code, minlength=len(regions))
+        offsets = np.zeros(len(regions) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        res = HPIDataset(
+            regions,
+            offsets,
+            np.insert(self.year[kept], at, update.year[order]),
+            np.insert(self.index[kept], at, update.index[order]),
+            None if self.qtr is None else
+            np.insert(self.qtr[kept], at, update.qtr[order])
+        )
+        if self._period_index is not None:
+            res._period_index = self._period_index.merged(
+                res, np.unique(period)
+            )
+        return res
+
+    def reannualized(
+            self,
+            annual: "HPIDataset",
+            update: "HPIDataset",
+            min_quarters: int = 1
+    ) -> "HPIDataset":
+        """
+        brings annual averages up to date after merging an update, only the
+        years of each region the update has quarters in are averaged again
+        :param annual: annualized() of the data before the update was merged
+        :param update: the quarterly rows merged into this dataset
+        :param min_quarters: fewest quarters a year needs, as annual was made
+        with
+        :return: same as annualized(), but in time proportional to the update
+        """
+        if self.qtr is None:
+            return self
+        low = int(self.year.min()) if self.row_count else 0
+        width = int(self.year.max()) - low + 1 if self.row_count else 1
+        touched = np.unique(
+            self.codes(update.regions)[update.region_ids] * width
+            + (update.year - low)
+        )
+        rows = np.flatnonzero(np.isin(
+            self.region_ids * width + (self.year - low), touched
+        ))
+        return annual.merge(self.take(rows).annualized(min_quarters))
+
+    def __getitem__(self, region: str) -> list:
+        start, stop = self.span(region)
+        years = self.year[start:stop].tolist()
+        indexes = self.index[start:stop].tolist()
+        if self.qtr is None:
+            return [
+                index_tools.AnnualHPI(y, i) for y, i in zip(years, indexes)
+            ]
+        qtrs = self.qtr[start:stop].tolist()
+        return [
+            index_tools.QuarterHPI(y, q, i)
+            for y, q, i in zip(years, qtrs, indexes)
+        ]
+
+    def __contains__(self, region) -> bool:
+        try:
+            self.position(region)
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.regions)
+
+    def __len__(self) -> int:
+        return len(self.regions)
+
+    def __repr__(self) -> str:
+        kind = "quarterly" if self.quarterly else "annual"
+        return (f"HPIDataset({len(self.regions)} regions, "
+                f"{self.row_count} {kind} rows)")
+
+
+def rows_sorted(columns: list[np.ndarray]) -> bool:
+    """
+    checks if rows are in ascending order, without sorting
+    :param columns: columns of the rows, most significant first
+    :return: whether every row is less than or equal to the next
+    """
+    if len(columns[0]) < 2:
+        return True
+    undecided = np.ones(len(columns[0]) - 1, dtype=bool)
+    for col in columns:
+        if np.any(undecided & (col[1:] < col[:-1])):
+            return False
+        undecided &= col[1:] == col[:-1]
+    return True
+
+
+class PeriodIndex:
+    """
+    the rows of a dataset grouped by period, and sorted in descending order by
+    index within each period, so the ranking of a period is a slice
+    periods are years for annual data and (year, quarter) for quarterly data
+    ties keep the order of the rows in the dataset
+    """
+
+    def __init__(self, data: HPIDataset):
+        """
+        :param data: dataset to index
+        """
+        self.quarterly = data.quarterly
+        period = self._period(data.year, data.qtr)
+        order = np.lexsort((-data.index, period))
+        self.periods, starts = np.unique(period[order], return_index=True)
+        self.starts = np.append(starts, len(order))
+        self.region_ids = data.region_ids[order]
+        self.values = data.index[order]
+
+    def merged(self, data: HPIDataset, periods: np.ndarray) -> "PeriodIndex":
+        """
+        indexes some periods again after rows were merged in, the rest of the
+        index is kept as it is
+        :param data: merged dataset, regions already indexed keep their numbers
+        :param periods: numbers of the periods with merged rows, ascending
+        :return: the same index as PeriodIndex(data)
+        """
+        lengths = np.diff(self.starts)
+        old = np.repeat(self.periods, lengths)
+        kept = ~np.isin(old, periods)
+        period = self._period(data.year, data.qtr)
+        rows = np.flatnonzero(np.isin(period, periods))
+        order = rows[np.lexsort((-data.index[rows], period[rows]))]
+        period = np.concatenate((old[kept], period[order]))
+        # both parts are in period order, so this only merges two runs
+        merge = np.argsort(period, kind="stable")
+        res = PeriodIndex.__new__(PeriodIndex)
+        res.quarterly = self.quarterly
+        res.periods, starts = np.unique(period[merge], return_index=True)
+        res.starts = np.append(starts, len(merge))
+        res.region_ids = np.concatenate(
+            (self.region_ids[kept], data.region_ids[order])
+        )[merge]
+        res.values = np.concatenate(
+            (self.values[kept], data.index[order])
+        )[merge]
+        return res
+
+    def _period(self, year, qtr):
+        """
+        :param year: year or array of years
+        :param qtr: quarter or array of quarters, None for annual data
+        :return: number of the period
+        """
+        if not self.quarterly:
+            return year
+        return np.asarray(year, dtype=np.int64) * 4 + qtr - 1
+
+    def lookup(
+            self, year: int, qtr: int = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        finds the cross section of a period
+        :param year: year looking at
+        :param qtr: quarter looking at, must be given for quarterly data
+        :return: region numbers and index values in descending order by index
+        """
+        if self.quarterly and qtr is None:
+            raise ValueError("quarterly data is indexed by year and quarter")
+        period = self._period(year, qtr)
+        i = int(np.searchsorted(self.periods, period))
+        # a quarter out of 1 to 4 would be numbered as one of another year
+        outside = self.quarterly and not 1 <= qtr <= 4
+        if outside or i == len(self.periods) or self.periods[i] != period:
+            return self.region_ids[:0], self.values[:0]
+        start, stop = self.starts[i], self.starts[i + 1]
+        return self.region_ids[start:stop], self.values[start:stop]
+
+
+class ExtremesTable:
+    """
+    sparse table of where the highs and lows of a column are
+    level k holds, for each row, the row of the highest and the lowest value
+    in the 2 ** k rows starting there, so any window is covered by two
+    overlapping power of two blocks.  windows never cross regions, so levels
+    only go up to the length of the longest region
+    ties go to the earliest row
+    """
+
+    def __init__(self, values: np.ndarray, offsets: np.ndarray):
+        """
+        :param values: column to find extremes of
+        :param offsets: row offsets of each region
+        """
+        self.values = values
+        longest = int(np.diff(offsets).max()) if len(offsets) > 1 else 0
+        rows = np.int32 if len(values) < 2 ** 31 else np.int64
+        high = [np.arange(len(values), dtype=rows)]
+        low = [high[0]]
+        size = 1
+        while size * 2 <= longest:
+            prev_high, prev_low = high[-1], low[-1]
+            left = prev_high[:-size]
+            right = prev_high[size:]
+            high.append(np.where(values[right] > values[left], right, left))
+            left = prev_low[:-size]
+            right = prev_low[size:]
+            low.append(np.where(values[right] < values[left], right, left))
+            size *= 2
+        self.high = high
+        self.low = low
+
+    def query(
+            self, starts: np.ndarray, stops: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        finds the extremes of many windows at once
+        :param starts: first row of each window
+        :param stops: row after the last of each window
+        :return: row of the high and row of the low of each window, -1 for
+        empty windows
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        stops = np.asarray(stops, dtype=np.int64)
+        length = stops - starts
+        empty = length <= 0
+        level = np.zeros(len(length), dtype=np.int64)
+        level[~empty] = np.log2(length[~empty]).astype(np.int64)
+        high = np.full(len(length), -1, dtype=np.int64)
+        low = np.full(len(length), -1, dtype=np.int64)
+        for k in np.unique(level[~empty]).tolist():
+            chosen = ~empty & (level == k)
+            left = starts[chosen]
+            right = stops[chosen] - 2 ** k
+            high[chosen] = self._pick(
+                self.high[k][left], self.high[k][right], True
+            )
+            low[chosen] = self._pick(
+                self.low[k][left], self.low[k][right], False
+            )
+        return high, low
+
+    def _pick(
+            self, left: np.ndarray, right: np.ndarray, highest: bool
+    ) -> np.ndarray:
+        """
+        :param left: rows found for the left blocks
+        :param right: rows found for the right blocks
+        :param highest: whether to pick the higher rather than the lower
+        :return: the better row of each pair, the earlier if equal
+        """
+        a = self.values[left]
+        b = self.values[right]
+        better = b > a if highest else b < a
+        return np.where(better | ((a == b) & (right < left)), right, left)
@@ -0,0 +1,592 @@
+"""
+hpi_parse.py
+Author: Lyx Huston
+bulk parser for the HPI_PO_state and ZIP5 text files
+
+instead of splitting and converting the file line by line, a whole chunk of the
+file is handled at once as a numpy byte array: token boundaries, rows and
+columns are found with array operations, and numbers are converted from their
+digits directly.  a '.' in a needed column marks the row as missing, these rows
+are dropped and counted rather than printed.
+
+target throughput is 2 million rows per second on one core for the ZIP5
+format; parse_file(..., timings=True) reports the time spent in each stage so
+that can be checked.
+
+with workers > 1 the file is split into byte ranges that end on line breaks,
+and each range is parsed in its own process.  the parsed ranges are joined in
+file order, so the result is the same as parsing on one core.
+
+files compressed with gzip, bzip2, xz or zstd are found by their first bytes,
+whatever they are named, and decompressed as they are read, a chunk at a time.
+zstd needs the zstandard package, or Python 3.14.  a compressed file cannot be
+split into byte ranges, so it is always parsed on one core.
+"""
+
+import os
+import time
+from dataclasses import dataclass, fields
+
+import numpy as np
+
+import hpi_dataset
+import instrument
+
+# the arrays made while parsing a chunk take several times its size, so
+# chunks are kept small enough that this stays well below the data itself
+CHUNK_SIZE = 4 * 1024 * 1024
+# smallest byte range worth handing to a worker process
+MIN_RANGE_SIZE = 4 * 1024 * 1024
+
+# first bytes of each kind of compressed file
+_MAGIC = (
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+)
+
+# how many digits a number can have and still be converted exactly
+_MAX_DIGITS = 15
+_POW10 = 10.0 ** np.arange(_MAX_DIGITS + 1)
+
+
+@dataclass(frozen=True)
+class FileFormat:
+    """
+    describes the columns of a house price index text file
+    """
+    header: bytes
+    year: int
+    index: int
+    qtr: int = None
+    # columns that make the row missing if they hold '.'
+    required: tuple[int, ...] = ()
+
+    @property
+    def width(self) -> int:
+        """
+        :return: least number of tokens a row needs
+        """
+        return max(self.required + (self.year, self.index)) + 1
+
+
+STATE_FORMAT = FileFormat(b"state", year=1, qtr=2, index=3, required=(1, 2, 3))
+ZIP_FORMAT = FileFormat(b"Five-Digit", year=1, index=3, required=(1, 3))
+
+
+@dataclass()
+class ParseStats:
+    """
+    counts and timings for one parse
+    """
+    rows: int = 0
+    missing: int = 0
+    malformed: int = 0
+    # rows left out by a region or year filter
+    skipped: int = 0
+    bytes: int = 0
+    read_seconds: float = 0.0
+    parse_seconds: float = 0.0
+    group_seconds: float = 0.0
+
+    @property
+    def seconds(self) -> float:
+        """
+        :return: total time spent
+        """
+        return self.read_seconds + self.parse_seconds + self.group_seconds
+
+    @property
+    def rows_per_second(self) -> float:
+        """
+        :return: rows read (kept or not) per second
+        """
+        total = self.rows + self.missing + self.malformed + self.skipped
+        return total / self.seconds if self.seconds else float("inf")
+
+    def add(self, other: "ParseStats") -> None:
+        """
+        adds the counts and timings of another parse to these
+        :param other: stats to add
+        :return: None
+        """
+        for field in fields(self):
+            setattr(
+                self, field.name,
+                getattr(self, field.name) + getattr(other, field.name)
+            )
+
+    def __str__(self) -> str:
+        return (
+            f"rows: {self.rows} missing: {self.missing} "
+            f"malformed: {self.malformed} skipped: {self.skipped} "
+            f"bytes: {self.bytes}\n"
+            f"read: {self.read_seconds:.4f}s parse: {self.parse_seconds:.4f}s "
+            f"group: {self.group_seconds:.4f}s "
+            f"({self.rows_per_second:,.0f} rows/s)"
+        )
+
+
+@dataclass()
+class Columns:
+    """
+    parsed rows of part of a file, not yet grouped by region
+    """
+    keys: np.ndarray
+    year: np.ndarray
+    index: np.ndarray
+    qtr: np.ndarray = None
+
+
+def _gather(
+        buf: np.ndarray, starts: np.ndarray, lengths: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    copies tokens into a zero padded 2d array, one token per row
+    :param buf: bytes of the chunk
+    :param starts: start of each token
+    :param lengths: length of each token
+    :return: 2d array of token bytes and mask of which bytes are in the token
+    """
+    width = int(lengths.max()) if len(lengths) else 1
+    if len(buf) < width or (len(starts) and starts[-1] + width > len(buf)):
+        buf = np.concatenate((buf, np.zeros(width, dtype=np.uint8)))
+    inside = np.arange(width) < lengths[:, None]
+    out = np.lib.stride_tricks.sliding_window_view(buf, width)[starts]
+    out[~inside] = 0
+    return out, inside
+
+
+def _parse_ints(
+        buf: np.ndarray, starts: np.ndarray, lengths: np.ndarray
+) -> np.ndarray:
+    """
+    converts tokens of digits to integers
+    :param buf: bytes of the chunk
+    :param starts: start of each token
+    :param lengths: length of each token
+    :return: integer value of each token, raises ValueError if not all digits
+    """
+    chars, inside = _gather(buf, starts, lengths)
+    if chars.shape[1] > _MAX_DIGITS:
+        raise ValueError("number too long")
+    res = np.zeros(len(chars), dtype=np.int64)
+    for col, used in zip(chars.T - np.uint8(ord("0")), inside.T):
+        if np.any(used & (col > 9)):
+            raise ValueError("expected a whole number")
+        res = np.where(used, res * 10 + col, res)
+    return res
+
+
+def _parse_floats(
+        buf: np.ndarray, starts: np.ndarray, lengths: np.ndarray
+) -> np.ndarray:
+    """
+    converts decimal tokens like 123.45 or -6.7 to floats
+    numbers with up to 15 digits are converted as mantissa / 10 ** decimals,
+    which rounds the same as float() does.  anything else falls back to
+    float() for that token only
+    :param buf: bytes of the chunk
+    :param starts: start of each token
+    :param lengths: length of each token
+    :return: float value of each token
+    """
+    chars, inside = _gather(buf, starts, lengths)
+    negative = chars[:, 0] == ord("-")
+    signed = negative | (chars[:, 0] == ord("+"))
+    simple = lengths <= _MAX_DIGITS + 2
+    mantissa = np.zeros(len(chars), dtype=np.int64)
+    decimals = np.zeros(len(chars), dtype=np.int64)
+    count = np.zeros(len(chars), dtype=np.int64)
+    seen_point = np.zeros(len(chars), dtype=bool)
+    # digits are added one column at a time, least significant last
+    for i, col in enumerate(chars.T[:_MAX_DIGITS + 2]):
+        digit = col - np.uint8(ord("0"))
+        is_digit = digit <= 9
+        point = col == ord(".")
+        valid = is_digit | ~inside[:, i] | (point & ~seen_point)
+        if i == 0:
+            valid |= signed
+        simple &= valid
+        mantissa = np.where(is_digit, mantissa * 10 + digit, mantissa)
+        decimals += is_digit & seen_point
+        count += is_digit
+        seen_point |= point
+    simple &= (count > 0) & (count <= _MAX_DIGITS)
+    res = mantissa / _POW10[np.where(simple, decimals, 0)]
+    res[negative] = -res[negative]
+    for i in np.flatnonzero(~simple).tolist():
+        res[i] = float(buf[starts[i]:starts[i] + lengths[i]].tobytes())
+    return res
+
+
+def parse_chunk(
+        chunk: bytes,
+        fmt: FileFormat,
+        stats: ParseStats,
+        first: bool = False,
+        regions: np.ndarray = None,
+        years: tuple[int, int] = None
+) -> Columns:
+    """
+    parses whole lines of a file
+    :param chunk: bytes holding only complete lines
+    :param fmt: format of the file
+    :param stats: counts of rows are added to this
+    :param first: whether the chunk is the start of the file, and may have a
+    header line
+    :param regions: array of region keys as bytes to keep, or None for all
+    :param years: (first, last) years to keep, or None for all
+    :return: columns of the rows with no missing values
+    """
+    buf = np.frombuffer(chunk, dtype=np.uint8)
+    space = buf <= ord(" ")
+    # space padded on both ends, so tokens start and end in pairs where the
+    # padded mask changes
+    padded = np.ones(len(buf) + 2, dtype=bool)
+    padded[1:-1] = space
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    starts = edges[0::2]
+    lengths = edges[1::2] - starts
+    # the first token after each line break starts a row, blank lines give
+    # the same token more than once
+    first_tokens = np.searchsorted(starts, np.flatnonzero(buf == ord("\n")))
+    first_tokens = np.concatenate(([0], first_tokens))
+    first_tokens = first_tokens[first_tokens < len(starts)]
+    if len(first_tokens):
+        first_tokens = first_tokens[np.concatenate(
+            ([True], first_tokens[1:] != first_tokens[:-1])
+        )]
+    counts = np.diff(np.append(first_tokens, len(starts)))
+    if first and len(first_tokens):
+        if chunk[starts[0]:starts[0] + lengths[0]] == fmt.header:
+            first_tokens = first_tokens[1:]
+            counts = counts[1:]
+    complete = counts >= fmt.width
+    stats.malformed += int(np.count_nonzero(~complete))
+    first_tokens = first_tokens[complete]
+
+    missing = np.zeros(len(first_tokens), dtype=bool)
+    for col in fmt.required:
+        token = first_tokens + col
+        missing |= (lengths[token] == 1) & (buf[starts[token]] == ord("."))
+    stats.missing += int(np.count_nonzero(missing))
+    first_tokens = first_tokens[~missing]
+
+    keys, _ = _gather(buf, starts[first_tokens], lengths[first_tokens])
+    keys = np.ascontiguousarray(keys).view(f"S{keys.shape[1]}").ravel()
+    if regions is not None:
+        keep = np.isin(keys, regions)
+        first_tokens = first_tokens[keep]
+        keys = keys[keep]
+    year = first_tokens + fmt.year
+    year = _parse_ints(buf, starts[year], lengths[year])
+    if years is not None:
+        keep = (year >= years[0]) & (year <= years[1])
+        first_tokens = first_tokens[keep]
+        keys = keys[keep]
+        year = year[keep]
+    stats.skipped += len(missing) - int(np.count_nonzero(missing)) \
+        - len(first_tokens)
+    stats.rows += len(first_tokens)
+
+    index = first_tokens + fmt.index
+    res = Columns(
+        keys, year, _parse_floats(buf, starts[index], lengths[index])
+    )
+    if fmt.qtr is not None:
+        qtr = first_tokens + fmt.qtr
+        res.qtr = _parse_ints(buf, starts[qtr], lengths[qtr])
+    return res
+
+
+def compression(filepath: str) -> str:
+    """
+    :param filepath: path to file
+    :return: "gzip", "bz2", "xz" or "zstd" if the file is compressed, None if
+    it is not
+    """
+    with open(filepath, "rb") as file:
+        start = file.read(6)
+    for magic, name in _MAGIC:
+        if start.startswith(magic):
+            return name
+    return None
+
+
+def open_binary(filepath: str):
+    """
+    opens a file for reading bytes, decompressing it if it is compressed
+    :param filepath: path to file
+    :return: file object, raises ValueError for zstd files if there is no
+    zstd module
+    """
+    kind = compression(filepath)
+    if kind is None:
+        return open(filepath, "rb")
+    if kind == "gzip":
+        import gzip
+        return gzip.open(filepath, "rb")
+    if kind == "bz2":
+        import bz2
+        return bz2.open(filepath, "rb")
+    if kind == "xz":
+        import lzma
+        return lzma.open(filepath, "rb")
+    try:
+        from compression import zstd
+        return zstd.open(filepath, "rb")
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError(
+            f"{filepath} is zstd compressed, install zstandard to read it"
+        ) from None
+    return zstandard.open(filepath, "rb")
+
+
+def read_chunks(file, chunk_size: int = CHUNK_SIZE, size: int = None):
+    """
+    reads a binary file in chunks that end on a line break
+    :param file: file opened in binary mode
+    :param chunk_size: bytes to read at a time, None to read all at once
+    :param size: bytes to read from where the file is, None to read to the end
+    :return: generator of chunks
+    """
+    rest = b""
+    while size is None or size > 0:
+        amount = -1 if chunk_size is None else chunk_size
+        if size is not None:
+            amount = size if amount < 0 else min(amount, size)
+            size -= amount
+        block = file.read(amount)
+        if not block:
+            break
+        block = rest + block
+        cut = block.rfind(b"\n") + 1
+        if cut == 0:
+            rest = block
+            continue
+        rest = block[cut:]
+        yield block[:cut]
+    if rest:
+        yield rest
+
+
+def byte_ranges(filepath: str, count: int) -> list[tuple[int, int]]:
+    """
+    splits a file into about equal byte ranges that each end on a line break
+    :param filepath: path to file
+    :param count: how many ranges to aim for
+    :return: list of (start, stop) byte offsets, in file order
+    """
+    size = os.path.getsize(filepath)
+    count = max(1, min(count, size // MIN_RANGE_SIZE))
+    cuts = [0]
+    with open(filepath, "rb") as file:
+        for i in range(1, count):
+            file.seek(max(size * i // count - 1, cuts[-1]))
+            file.readline()
+            if file.tell() < size and file.tell() > cuts[-1]:
+                cuts.append(file.tell())
+    cuts.append(size)
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def parse_range(
+        filepath: str,
+        start: int,
+        stop: int,
+        fmt: FileFormat,
+        chunk_size: int = CHUNK_SIZE,
+        regions: np.ndarray = None,
+        years: tuple[int, int] = None
+) -> tuple[Columns, ParseStats]:
+    """
+    parses the lines in a byte range of a file, run in a worker process
+    :param filepath: path to file
+    :param start: offset of the first byte, at the start of a line
+    :param stop: offset after the last byte, at the start of a line or the
+    end of the file
+    :param fmt: format of the file
+    :param chunk_size: bytes to parse at a time, None for the whole range
+    :param regions: array of region keys as bytes to keep, or None for all
+    :param years: (first, last) years to keep, or None for all
+    :return: columns of the rows kept, and counts of what was read
+    """
+    stats = ParseStats()
+    parts = []
+    with open(filepath, "rb") as file:
+        file.seek(start)
+        clock = time.perf_counter()
+        for chunk in read_chunks(file, chunk_size, stop - start):
+            now = time.perf_counter()
+            stats.read_seconds += now - clock
+            stats.bytes += len(chunk)
+            parts.append(parse_chunk(
+                chunk, fmt, stats, start == 0 and not parts, regions, years
+            ))
+            clock = time.perf_counter()
+            stats.parse_seconds += clock - now
+    if len(parts) == 1:
+        return parts[0], stats
+    return Columns(
+        _concatenate_keys([part.keys for part in parts]),
+        np.concatenate([part.year for part in parts]),
+        np.concatenate([part.index for part in parts]),
+        None if fmt.qtr is None
+        else np.concatenate([part.qtr for part in parts])
+    ), stats
+
+
+def _concatenate_keys(keys: list[np.ndarray]) -> np.ndarray:
+    """
+    :param keys: arrays of region keys as bytes, maybe of different widths
+    :return: the keys joined into one array
+    """
+    width = max(part.dtype.itemsize for part in keys)
+    return np.concatenate([part.astype(f"S{width}") for part in keys])
+
+
+def group_columns(parts: list[Columns]) -> "hpi_dataset.HPIDataset":
+    """
+    joins parsed parts of a file and groups the rows by region
+    regions are kept in the order they first appear
+    :param parts: parsed columns, in file order
+    :return: the dataset
+    """
+    if not parts:
+        return hpi_dataset.HPIDataset([], [0], [], [])
+    keys = _concatenate_keys([part.keys for part in parts])
+    unique, first, inverse = np.unique(
+        keys, return_index=True, return_inverse=True
+    )
+    order = np.argsort(first, kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    qtr = None
+    if parts[0].qtr is not None:
+        qtr = np.concatenate([part.qtr for part in parts])
+    return hpi_dataset.HPIDataset.from_codes(
+        [key.decode() for key in unique[order].tolist()],
+        rank[inverse.ravel()],
+        np.concatenate([part.year for part in parts]),
+        np.concatenate([part.index for part in parts]),
+        qtr
+    )
+
+
+@instrument.timed("hpi_parse.parse_file", rows=lambda res: res[1].rows)
+def parse_file(
+        filepath: str,
+        fmt: FileFormat,
+        chunk_size: int = CHUNK_SIZE,
+        timings: bool = False,
+        regions=None,
+        years: tuple[int, int] = None,
+        workers: int = 1
+) -> tuple["hpi_dataset.HPIDataset", ParseStats]:
+    """
+    reads a house price index text file into a dataset
+    rows outside of regions or years are dropped as each chunk is parsed, so
+    only the rows kept are ever held in memory together
+    :param filepath: path to file
+    :param fmt: format of the file, STATE_FORMAT or ZIP_FORMAT
+    :param chunk_size: bytes to parse at a time, None for the whole file
+    :param timings: whether to print the counts and timings when done
+    :param regions: region keys to keep, or None for all
+    :param years: (first, last) years to keep, or None for all
+    :param workers: processes to parse with, None for one per CPU, a
+    compressed file is parsed with one
+    :return: the dataset and counts of what was read
+    """
+    if regions is not None:
+        regions = np.array([reg.encode() for reg in regions], dtype=bytes)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    plain = compression(filepath) is None
+    if workers > 1 and plain:
+        ranges = byte_ranges(filepath, workers)
+        if len(ranges) > 1:
+            return _parse_parallel(
+                filepath, fmt, ranges, workers, chunk_size, timings,
+                regions, years
+            )
+    stats = ParseStats()
+    parts = []
+    # knowing the size keeps a small file from getting a whole chunk buffer
+    size = os.path.getsize(filepath) if plain else None
+    with open_binary(filepath) as file:
+        clock = time.perf_counter()
+        for chunk in read_chunks(file, chunk_size, size):
+            now = time.perf_counter()
+            stats.read_seconds += now - clock
+            stats.bytes += len(chunk)
+            parts.append(parse_chunk(
+                chunk, fmt, stats, not parts, regions, years
+            ))
+            clock = time.perf_counter()
+            stats.parse_seconds += clock - now
+    data = group_columns(parts)
+    stats.group_seconds = time.perf_counter() - clock
+    if timings:
+        print(f"parsed {filepath}")
+        print(stats)
+    return data, stats
+
+
+def _parse_parallel(
+        filepath: str,
+        fmt: FileFormat,
+        ranges: list[tuple[int, int]],
+        workers: int,
+        chunk_size: int,
+        timings: bool,
+        regions: np.ndarray,
+        years: tuple[int, int]
+) -> tuple["hpi_dataset.HPIDataset", ParseStats]:
+    """
+    parse_file for more than one worker, each byte range is parsed in a
+    worker process and the results are grouped in file order
+    the read and parse times in the stats are the wall clock time of the
+    workers, not the sum of their times
+    :param filepath: path to file
+    :param fmt: format of the file
+    :param ranges: byte ranges from byte_ranges
+    :param workers: processes to parse with
+    :param chunk_size: bytes for each worker to parse at a time
+    :param timings: whether to print the counts and timings when done
+    :param regions: array of region keys as bytes to keep, or None for all
+    :param years: (first, last) years to keep, or None for all
+    :return: the dataset and counts of what was read
+    """
+    # only imported here, it is slow to import and most runs use one worker
+    from concurrent.futures import ProcessPoolExecutor
+
+    stats = ParseStats()
+    parts = []
+    clock = time.perf_counter()
+    with ProcessPoolExecutor(min(workers, len(ranges))) as pool:
+        futures = [
+            pool.submit(
+                parse_range, filepath, start, stop, fmt, chunk_size,
+                regions, years
+            )
+            for start, stop in ranges
+        ]
+        for future in futures:
+            part, part_stats = future.result()
+            parts.append(part)
+            stats.add(part_stats)
+    now = time.perf_counter()
+    stats.read_seconds = 0.0
+    stats.parse_seconds = now - clock
+    data = group_columns(parts)
+    stats.group_seconds = time.perf_counter() - now
+    if timings:
+        print(f"parsed {filepath} with {len(ranges)} workers")
+        print(stats)
+    return data, stats
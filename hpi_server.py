@@ -0,0 +1,400 @@
+"""
+hpi_server.py
+Author: Lyx Huston
+long running HPI query service
+
+loads the state and ZIP5 files once and keeps them in memory, then answers
+range, ranking, trend and annualize queries over HTTP on localhost or a Unix
+socket.  the queries are the ones batch_query answers:
+
+GET /range?dataset=state&region=NY&quarterly=1
+GET /range?dataset=zip&region=02138&year0=2000&year1=2012
+GET /ranking?dataset=zip&year=2000&k=10
+GET /ranking?dataset=state&year=2000&qtr=2
+GET /trend?dataset=zip&year0=1994&year1=2002&k=10
+GET /annualize?dataset=state&region=VT
+POST /query with a JSON query object as the body, plus "dataset"
+POST /reload?dataset=zip   reads the file again, for a new data release
+GET /metrics               request counts and latencies per endpoint, with
+                           unknown paths counted together as "other"
+
+every response is JSON.  dataset defaults to state.
+
+usage:
+python hpi_server.py --port 8080
+python hpi_server.py --unix /tmp/hpi.sock --zip data/HPI_AT_ZIP5.txt
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import sys
+import time
+from collections import deque
+from urllib.parse import parse_qsl, urlsplit
+
+import batch_query
+import instrument
+
+# query parameters that are numbers, and those that are flags
+INT_PARAMS = ("year", "qtr", "k", "year0", "year1")
+FLAG_PARAMS = ("quarterly",)
+# endpoints answered by batch_query, and all endpoints metrics are kept for,
+# anything else is counted as "other"
+QUERY_ENDPOINTS = ("range", "ranking", "trend", "annualize")
+ENDPOINTS = QUERY_ENDPOINTS + ("query", "reload", "metrics")
+# most header lines, and bytes of them, read for one request
+MAX_HEADERS = 100
+MAX_HEADER_BYTES = 64 * 1024
+
+REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 500: "Internal Server Error",
+}
+
+
+class LatencyMetrics:
+    """
+    counts requests and keeps the latencies of the most recent ones, for each
+    endpoint
+    """
+
+    def __init__(self, keep: int = 10000):
+        """
+        :param keep: how many recent latencies to keep per endpoint
+        """
+        self.keep = keep
+        self.counts = dict()
+        self.errors = dict()
+        self.latencies = dict()
+
+    def record(self, endpoint: str, seconds: float, error: bool) -> None:
+        """
+        :param endpoint: endpoint name, see endpoint_of
+        :param seconds: time taken to answer
+        :param error: whether the answer was an error
+        :return: None
+        """
+        if endpoint not in self.counts:
+            self.counts[endpoint] = 0
+            self.errors[endpoint] = 0
+            self.latencies[endpoint] = deque(maxlen=self.keep)
+        self.counts[endpoint] += 1
+        self.errors[endpoint] += error
+        self.latencies[endpoint].append(seconds)
+
+    def summary(self) -> dict:
+        """
+        :return: for each endpoint, counts and latencies in milliseconds of
+        the kept requests
+        """
+        res = dict()
+        for endpoint, count in self.counts.items():
+            recent = sorted(self.latencies[endpoint])
+            res[endpoint] = {
+                "count": count,
+                "errors": self.errors[endpoint],
+                "mean_ms": 1000 * sum(recent) / len(recent),
+                "p50_ms": 1000 * recent[len(recent) // 2],
+                "p99_ms": 1000 * recent[min(
+                    len(recent) - 1, (len(recent) * 99) // 100
+                )],
+                "max_ms": 1000 * recent[-1],
+            }
+        return res
+
+
+def endpoint_of(target: str) -> str:
+    """
+    :param target: request path and query string
+    :return: the endpoint name, or "other" if it is not one, so unknown paths
+    do not each get their own metrics
+    """
+    endpoint = urlsplit(target).path.strip("/")
+    return endpoint if endpoint in ENDPOINTS else "other"
+
+
+class HPIServer:
+    """
+    the loaded datasets, and the handling of requests for them
+    """
+
+    def __init__(self, files: dict[str, str]):
+        """
+        :param files: dataset name to data file path, like
+        {"state": "data/HPI_PO_state.txt"}
+        """
+        self.files = files
+        self.sessions = dict()
+        self.metrics = LatencyMetrics()
+        for name in files:
+            self.sessions[name] = self._load(name)
+
+    def _load(self, name: str) -> batch_query.QuerySession:
+        """
+        the period indexes are built here too, so the first ranking query
+        does not pay for them
+        :param name: dataset name
+        :return: session with the data file loaded
+        """
+        with contextlib.redirect_stdout(sys.stderr):
+            session = batch_query.QuerySession(self.files[name])
+        for data in (session.annual, session.quarterly):
+            if data is not None:
+                data.period_index()
+        return session
+
+    async def reload(self, name: str) -> dict:
+        """
+        reads a data file again in a worker thread, queries keep being
+        answered from the old data until the new data is ready
+        :param name: dataset name
+        :return: result to send back
+        """
+        if name not in self.files:
+            raise KeyError(name)
+        clock = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        self.sessions[name] = await loop.run_in_executor(
+            None, self._load, name
+        )
+        return {
+            "reloaded": name,
+            "regions": len(self.sessions[name].annual),
+            "seconds": time.perf_counter() - clock,
+        }
+
+    def query(self, query: dict) -> tuple[int, dict]:
+        """
+        answers a query
+        :param query: query dict, with "dataset" naming the dataset
+        :return: HTTP status and result
+        """
+        name = query.pop("dataset", "state")
+        if name not in self.sessions:
+            return 404, {"error": f"unknown dataset {name!r}"}
+        if query.get("query") == "plot":
+            return 400, {"error": "plots are not served, use batch_query"}
+        res = self.sessions[name].run(query)
+        return (400 if "error" in res else 200), res
+
+    async def respond(
+            self, method: str, target: str, body: bytes
+    ) -> tuple[int, dict]:
+        """
+        works out the answer to a request
+        :param method: HTTP method
+        :param target: request path and query string
+        :param body: request body
+        :return: HTTP status and result
+        """
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+        endpoint = url.path.strip("/")
+        try:
+            for name in INT_PARAMS:
+                if name in params:
+                    params[name] = int(params[name])
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        for name in FLAG_PARAMS:
+            if name in params:
+                params[name] = params[name].lower() in ("1", "true", "yes")
+        if endpoint == "metrics":
+            return 200, self.metrics.summary()
+        if endpoint == "reload":
+            if method != "POST":
+                return 405, {"error": "reload needs POST"}
+            try:
+                return 200, await self.reload(params.get("dataset", "state"))
+            except KeyError as e:
+                return 404, {"error": f"unknown dataset {e}"}
+        if endpoint == "query":
+            if method != "POST":
+                return 405, {"error": "query needs POST"}
+            try:
+                query = json.loads(body or b"{}")
+            except ValueError as e:
+                return 400, {"error": str(e)}
+            if not isinstance(query, dict):
+                return 400, {"error": "query must be an object"}
+            return self.query(query)
+        if endpoint in QUERY_ENDPOINTS:
+            return self.query(dict(params, query=endpoint))
+        return 404, {"error": f"no endpoint {url.path!r}"}
+
+    async def handle(
+            self,
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        serves requests on a connection until the client closes it
+        :param reader: connection input
+        :param writer: connection output
+        :return: None
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                clock = time.perf_counter()
+                try:
+                    method, target, version = line.decode().split()
+                except ValueError:
+                    await self._send(writer, 400, {"error": "bad request"})
+                    break
+                try:
+                    headers = await self._read_headers(reader)
+                except ValueError as e:
+                    # the rest of the headers are not read, so the start of
+                    # the next request is not known
+                    await self._send(writer, 400, {"error": str(e)})
+                    self.metrics.record(
+                        endpoint_of(target), time.perf_counter() - clock,
+                        True
+                    )
+                    break
+                try:
+                    length = int(headers.get("content-length", 0))
+                    if length < 0:
+                        raise ValueError
+                except ValueError:
+                    # the end of the body is not known, so neither is the
+                    # start of the next request
+                    await self._send(
+                        writer, 400, {"error": "bad content-length"}
+                    )
+                    self.metrics.record(
+                        endpoint_of(target), time.perf_counter() - clock,
+                        True
+                    )
+                    break
+                body = await reader.readexactly(length) if length else b""
+                try:
+                    status, res = await self.respond(method, target, body)
+                except Exception as e:
+                    status, res = 500, {"error": repr(e)}
+                keep_alive = (
+                    version == "HTTP/1.1"
+                    and headers.get("connection", "").lower() != "close"
+                )
+                await self._send(writer, status, res, keep_alive)
+                self.metrics.record(
+                    endpoint_of(target), time.perf_counter() - clock,
+                    status != 200
+                )
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_headers(reader: asyncio.StreamReader) -> dict[str, str]:
+        """
+        reads header lines up to the blank line that ends them
+        raises ValueError for headers that are not UTF-8, or more than
+        MAX_HEADERS lines or MAX_HEADER_BYTES bytes of them
+        :param reader: connection input
+        :return: dictionary of lowercase header names to values
+        """
+        headers = dict()
+        count = 0
+        size = 0
+        while True:
+            # a line longer than the reader's limit raises ValueError too
+            header = await reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                return headers
+            count += 1
+            size += len(header)
+            if count > MAX_HEADERS or size > MAX_HEADER_BYTES:
+                raise ValueError("headers too large")
+            try:
+                name, _, value = header.decode().partition(":")
+            except UnicodeDecodeError:
+                raise ValueError("bad header") from None
+            headers[name.strip().lower()] = value.strip()
+
+    @staticmethod
+    async def _send(
+            writer: asyncio.StreamWriter,
+            status: int,
+            res: dict,
+            keep_alive: bool = False
+    ) -> None:
+        """
+        writes a JSON response
+        :param writer: connection output
+        :param status: HTTP status
+        :param res: result to send
+        :param keep_alive: whether the connection stays open after
+        :return: None
+        """
+        body = json.dumps(res).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n".encode() + body
+        )
+        await writer.drain()
+
+
+async def serve(
+        server: HPIServer,
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        unix: str = None
+) -> None:
+    """
+    serves requests until cancelled
+    :param server: loaded server
+    :param host: address to listen on
+    :param port: port to listen on
+    :param unix: path of a Unix socket to listen on instead
+    :return: None
+    """
+    if unix is not None:
+        listener = await asyncio.start_unix_server(server.handle, unix)
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+    where = unix if unix is not None else f"http://{host}:{port}"
+    print(f"serving {', '.join(server.sessions)} on {where}", file=sys.stderr)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main() -> None:
+    """
+    main function
+    runs if module is run
+    """
+    instrument.from_argv()
+    parser = argparse.ArgumentParser(description="serve HPI queries")
+    parser.add_argument("--state", default="data/HPI_PO_state.txt",
+                        help="state data file, 'none' to leave out")
+    parser.add_argument("--zip", default="data/HPI_AT_ZIP5.txt",
+                        help="ZIP5 data file, 'none' to leave out")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--unix", help="Unix socket path to listen on")
+    args = parser.parse_args()
+    files = {
+        name: path for name, path in (("state", args.state), ("zip", args.zip))
+        if path.lower() != "none"
+    }
+    server = HPIServer(files)
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
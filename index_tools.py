@@ -8,106 +8,99 @@ no test for this module, tested indirectly by other modules working
 from dataclasses import dataclass
 from typing import Union
 
+import numpy as np
 
-@dataclass()
+import hpi_cache
+import hpi_dataset
+import hpi_parse
+import instrument
+
+
+@dataclass(slots=True)
 class QuarterHPI:
     """
     holds data for quarter
+    slotted, so there is no __dict__ for each of the many records
     """
     year: int
     qtr: int
     index: float
 
 
-@dataclass()
+@dataclass(slots=True)
 class AnnualHPI:
     """
     holds data for year
+    slotted, so there is no __dict__ for each of the many records
     """
     year: int
     index: float
 
 
-def read_state_house_price_data(filepath: str) -> dict:
+@instrument.timed("index_tools.read_state_house_price_data",
+                  rows=instrument.rows_of)
+def read_state_house_price_data(
+        filepath: str,
+        timings: bool = False,
+        cache: bool = False,
+        regions=None,
+        years: tuple[int, int] = None,
+        workers: int = 1
+) -> "hpi_dataset.HPIDataset":
     """
     given file path computes dictionary with mapping of state abbrev to
-    QuarterHPI.  prints warning if data value unavailable
-    ("data unavailable" and then print line content)
+    QuarterHPI.  lines with a data value unavailable are skipped, and a
+    warning with how many there were is printed
     ex:
-    data unavailable:
-    VT 1976 1 . . warning: data unavailable in original source.
-    :param filepath: string, path to file
-    :return: dictionary mapping state abbreviation strings to
+    Data unavailable for 12 lines
+    :param filepath: string, path to file, which can be compressed
+    :param timings: whether to print parse counts and timings
+    :param cache: whether to load from and save to a binary cache beside the
+    file, see hpi_cache
+    :param regions: region keys to read, or None for all
+    :param years: (first, last) years to read, or None for all
+    :param workers: processes to parse the file with, None for one per CPU
+    :return: HPIDataset mapping state abbreviation strings to
     list of QuarterHPI objects
     """
-    file = open(filepath, "r")
-    line = file.readline()
-    read = line.strip().split()
-    res = dict()
-    if read[0] != "state":
-        if "." in read[1:4]:
-            print("Data unavailable")
-            print(line)
-        else:
-            res[read[0]] = [QuarterHPI(int(read[1]), int(read[2]), float(read[3]))]
-    for line in file:
-        read = line.strip().split()
-        if "." in read[1:4]:
-            print("Data unavailable")
-            print(line)
-            continue
-        elif read[0] in res.keys():
-            res[read[0]].append(
-                QuarterHPI(int(read[1]), int(read[2]), float(read[3]))
-            )
-        else:
-            res[read[0]] = [QuarterHPI(
-                int(read[1]), int(read[2]), float(read[3])
-            )]
+    parse = hpi_cache.parse_file if cache else hpi_parse.parse_file
+    res, stats = parse(
+        filepath, hpi_parse.STATE_FORMAT, timings=timings,
+        regions=regions, years=years, workers=workers
+    )
+    if stats.missing:
+        print(f"Data unavailable for {stats.missing} lines")
     return res
 
 
-def read_zip_house_price_data(filepath: str) -> dict:
+@instrument.timed("index_tools.read_zip_house_price_data",
+                  rows=instrument.rows_of)
+def read_zip_house_price_data(
+        filepath: str,
+        timings: bool = False,
+        cache: bool = False,
+        regions=None,
+        years: tuple[int, int] = None,
+        workers: int = 1
+) -> "hpi_dataset.HPIDataset":
     """
-    constructs dict of lists
-    prints count of lines read and lines uncounted because incomplete
-    count: {counted} uncounted: {uncounted}
-    :param filepath: string, path to ZIP5 file
-    :return: dictionary mapping state abbreviation strings to
+    constructs dataset of region to annual rows
+    lines with a missing year or index are not counted
+    :param filepath: string, path to ZIP5 file, which can be compressed
+    :param timings: whether to print parse counts and timings
+    :param cache: whether to load from and save to a binary cache beside the
+    file, see hpi_cache
+    :param regions: region keys to read, or None for all
+    :param years: (first, last) years to read, or None for all
+    :param workers: processes to parse the file with, None for one per CPU
+    :return: HPIDataset mapping ZIP code strings to
     list of AnnualHPI objects
     """
-    file = open(filepath, "r")
-    counted = 0
-    uncounted = 0
-    line = file.readline()
-    read = line.strip().split()
-    res = dict()
-    if read[0] != "Five-Digit":
-        if "." == read[1] or "." == read[3]:
-            uncounted += 1
-        else:
-            counted += 1
-            res[read[0]] = [AnnualHPI(
-                int(read[1]), float(read[3])
-            )]
-    for line in file:
-        read = line.strip().split()
-        if "." == read[1] or "." == read[3]:
-            uncounted += 1
-            continue
-        elif read[0] in res.keys():
-            counted += 1
-            res[read[0]].append(
-                AnnualHPI(
-                    int(read[1]), float(read[3])
-                )
-            )
-        else:
-            counted += 1
-            res[read[0]] = [AnnualHPI(
-                int(read[1]), float(read[3])
-            )]
-    return res
+    parse = hpi_cache.parse_file if cache else hpi_parse.parse_file
+    return parse(
+        filepath, hpi_parse.ZIP_FORMAT, timings=timings,
+        regions=regions, years=years, workers=workers
+    )[0]
 
 
 def index_range(
@@ -124,25 +117,78 @@ def index_range(
 
 
 def get_hpi_extremes(
-        data: dict[str, list[Union[AnnualHPI, QuarterHPI]]], region: str
+        data: dict[str, list[Union[AnnualHPI, QuarterHPI]]],
+        region: str,
+        year0: int = None,
+        year1: int = None
 ) -> tuple[Union[AnnualHPI, QuarterHPI], Union[AnnualHPI, QuarterHPI]]:
     """
     helper function for print range and index_range
+    the earliest is given if the high or low is reached more than once
     :param data: dictionary of region to list of HPI objects
     :param region: region looking at
-    :return: tuple of HPI objects with highest and lowest values
+    :param year0: first year to look at, or None for the earliest
+    :param year1: last year to look at, or None for the latest
+    :return: tuple of HPI objects with highest and lowest values, raises
+    ValueError if the region has no data in the years
     """
-    get = data[region]
+    if isinstance(data, hpi_dataset.HPIDataset):
+        start, stop = data.span(region)
+        years = data.year[start:stop]
+        if year0 is not None:
+            start += int(np.searchsorted(years, year0))
+        if year1 is not None:
+            stop -= len(years) - int(np.searchsorted(years, year1, "right"))
+        if start >= stop:
+            raise ValueError(f"no data for {region} in those years")
+        # one window is a single scan, the sparse table of data.extremes()
+        # only pays for itself over every region at once
+        values = data.index[start:stop]
+        return (data.record(start + int(values.argmax())),
+                data.record(start + int(values.argmin())))
+    get = [
+        hpi for hpi in data[region]
+        if (year0 is None or hpi.year >= year0)
+        and (year1 is None or hpi.year <= year1)
+    ]
+    if not get:
+        raise ValueError(f"no data for {region} in those years")
     low = get[0]
     high = get[0]
     for hpi in get[1:]:
         if low.index > hpi.index:
             low = hpi
-        elif high.index < hpi.index:
+        if high.index < hpi.index:
             high = hpi
     return high, low
 
 
+@instrument.timed("index_tools.get_all_hpi_extremes", rows=len)
+def get_all_hpi_extremes(
+        data: dict[str, list[Union[AnnualHPI, QuarterHPI]]],
+        year0: int = None,
+        year1: int = None
+) -> dict[str, tuple[Union[AnnualHPI, QuarterHPI],
+                     Union[AnnualHPI, QuarterHPI]]]:
+    """
+    get_hpi_extremes for every region at once, like the peak and trough of
+    every ZIP code from 2000 to 2012
+    :param data: dictionary of region to list of HPI objects
+    :param year0: first year to look at, or None for the earliest
+    :param year1: last year to look at, or None for the latest
+    :return: dict of region to high and low, regions with no data in the
+    years are left out
+    """
+    if not isinstance(data, hpi_dataset.HPIDataset):
+        data = hpi_dataset.HPIDataset.from_dict(data)
+    high, low = data.window_extremes(year0, year1)
+    res = dict()
+    for reg, h, l in zip(data.regions, high.tolist(), low.tolist()):
+        if h >= 0:
+            res[reg] = (data.record(h), data.record(l))
+    return res
+
+
 def print_range(
         data: dict[str, list[Union[AnnualHPI, QuarterHPI]]], region: str
 ) -> None:
@@ -186,28 +232,71 @@ def print_ranking(
         print(f"{i + 1}: {data[i]}")
 
 
-def annualize(data: dict[str, list[QuarterHPI]]) -> dict[str, list[AnnualHPI]]:
+@instrument.timed("index_tools.annualize", rows=instrument.rows_of)
+def annualize(
+        data: dict[str, list[QuarterHPI]], min_quarters: int = 1
+) -> dict[str, list[AnnualHPI]]:
     """
     averages quarter API objects to create annual API
+    an HPIDataset is averaged for all regions and years at once, see
+    HPIDataset.annualized, and HPIDataset.quarter_counts for how many
+    quarters each year has
     :param data: dictionary of region to list of quarter HPI objects
-    :return: dict of region to list of annual HPI objects
+    :param min_quarters: fewest quarters a year needs to be kept, 4 to leave
+    out partial years
+    :return: dict of region to list of annual HPI objects, or an HPIDataset
+    if given one
     """
+    if isinstance(data, hpi_dataset.HPIDataset):
+        return data.annualized(min_quarters)
     res = dict()
     for reg in data:
-        work = dict()
+        sums = dict()
+        counts = dict()
         for h in data[reg]:
-            if h.year in work.keys():
-                work[h.year] = (work[h.year][0] + h.index, work[h.year][1] + 1)
-            else:
-                work[h.year] = (h.index, 1)
-        res[reg] = []
-        for y in work:
-            res[reg].append(AnnualHPI(
-                y, work[y][0] / work[y][1]
-            ))
+            sums[h.year] = sums.get(h.year, 0.0) + h.index
+            counts[h.year] = counts.get(h.year, 0) + 1
+        res[reg] = [
+            AnnualHPI(y, sums[y] / counts[y])
+            for y in sums if counts[y] >= min_quarters
+        ]
     return res
 
 
+@instrument.timed("index_tools.merge_update",
+                  rows=lambda res: res[0].row_count)
+def merge_update(
+        data: dict[str, list[Union[AnnualHPI, QuarterHPI]]],
+        update: dict[str, list[Union[AnnualHPI, QuarterHPI]]],
+        annual: dict[str, list[AnnualHPI]] = None,
+        min_quarters: int = 1
+) -> tuple["hpi_dataset.HPIDataset", "hpi_dataset.HPIDataset"]:
+    """
+    merges a new release, only its new and revised rows, into data already
+    read, instead of reading the whole file and annualizing again
+    a row of the update replaces the row of the same region and period
+    :param data: data read before, dict or HPIDataset
+    :param update: new and revised rows, dict or HPIDataset
+    :param annual: annualize(data) if already made, only the years in the
+    update are averaged again, if None all of them are
+    :param min_quarters: fewest quarters a year needs to be kept, as in
+    annualize
+    :return: merged data, and the annual data of it
+    """
+    if not isinstance(data, hpi_dataset.HPIDataset):
+        data = hpi_dataset.HPIDataset.from_dict(data)
+    if not isinstance(update, hpi_dataset.HPIDataset):
+        update = hpi_dataset.HPIDataset.from_dict(update)
+    merged = data.merge(update)
+    if not merged.quarterly:
+        return merged, merged
+    if annual is None:
+        return merged, merged.annualized(min_quarters)
+    if not isinstance(annual, hpi_dataset.HPIDataset):
+        annual = hpi_dataset.HPIDataset.from_dict(annual)
+    return merged, merged.reannualized(annual, update, min_quarters)
+
+
 def main() -> None:
     """
     main function
@@ -227,12 +316,8 @@ def main() -> None:
     6. The list of annualized index values for all the years available for the
     (state or zip code) region.
     """
+    instrument.from_argv()
     filepath = "data/" + input("Enter house price index file: ")
-    if "state" in filepath:
-        unanualized_data = read_state_house_price_data(filepath)
-        dat = annualize(unanualized_data)
-    else:
-        dat = read_zip_house_price_data(filepath)
     regs = [input("First region of interest: ")]
     while True:
         inp = input("Next region of interest (Hit ENTER to stop): ")
@@ -240,6 +325,13 @@ def main() -> None:
             break
         else:
             regs.append(inp)
+    if "state" in filepath:
+        unanualized_data = read_state_house_price_data(
+            filepath, cache=True, regions=regs
+        )
+        dat = annualize(unanualized_data)
+    else:
+        dat = read_zip_house_price_data(filepath, cache=True, regions=regs)
     if "state" in filepath:
         for reg in regs:
             print("=" * 40)
@@ -272,23 +364,34 @@ def main() -> None:
                 print(data[i])
 
 
+def period_key(hpi: Union[AnnualHPI, QuarterHPI]) -> tuple[int, int]:
+    """
+    :param hpi: AnnualHPI or QuarterHPI
+    :return: (year, quarter) to sort by, quarter is 0 for AnnualHPI
+    """
+    return hpi.year, getattr(hpi, "qtr", 0)
+
+
+def is_sorted(data: list[Union[AnnualHPI, QuarterHPI]]) -> bool:
+    """
+    :param data: list of HPI objects
+    :return: whether the list is in ascending order by year and quarter
+    """
+    return all(
+        period_key(a) <= period_key(b) for a, b in zip(data, data[1:])
+    )
+
+
 def sort(data: list[Union[AnnualHPI, QuarterHPI]]) -> list:
     """
-    sorts a list from smallest to largest in place
-    insertion sort
-    preconditions: all items of list integers or floats
-    postconditions: the list is given
+    sorts a list of HPI objects by year and quarter in place
+    the list is only checked if it is already sorted, which lists from an
+    HPIDataset always are, otherwise it is stable sorted
     :param data: A list to be sorted
     :return: the list
     """
-    for i in range(len(data)):
-        rep = 0
-        while i - rep > 0:
-            if data[i - rep].year >= data[i - rep - 1].year:
-                break
-            else:
-                data.insert(i - rep - 1, data.pop(i - rep))
-            rep += 1
+    if not is_sorted(data):
+        data.sort(key=period_key)
     return data
 
 
@@ -0,0 +1,343 @@
+"""
+instrument.py
+Author: Lyx Huston
+phase timing and profiling for the pipeline
+
+phases are parts of a run like reading, annualizing or plotting.  when
+instrumentation is on, each phase adds up its calls, wall time and rows
+processed, and a summary is printed to stderr when the program exits, as a
+table or as JSON.  phases can be inside other phases, the time of a phase
+includes the phases inside it.  phases can also be run under cProfile, with
+the top functions printed with the summary.
+
+turned on by environment variable:
+HPI_INSTRUMENT=table or HPI_INSTRUMENT=json
+HPI_PROFILE=index_tools.annualize,trending.calculate_trends (or all)
+HPI_INSTRUMENT_OUT=timings.json   write the summary here instead of stderr
+or by giving --instrument, --instrument=json or --profile=PHASES to any of
+the main functions.
+
+when off, a timed function only checks one flag before calling through, and
+phase() hands back the same do nothing context every time, and cProfile and
+pstats are not imported.
+"""
+
+import atexit
+import functools
+import io
+import json
+import os
+import sys
+import time
+
+# functions printed for each profiled phase
+PROFILE_LINES = 20
+
+
+class _State:
+    """
+    whether instrumentation is on, and what has been collected
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.fmt = "table"
+        self.out = None
+        self.profile = set()
+        self.profiling = False
+        self.calls = dict()
+        self.seconds = dict()
+        self.rows = dict()
+        self.profiles = dict()
+        self.registered = False
+
+
+_state = _State()
+
+
+class Phase:
+    """
+    a running phase, used as a context manager
+    rows can be added while it runs
+    """
+
+    def __init__(self, name: str, rows: int = 0):
+        """
+        :param name: name of the phase
+        :param rows: rows processed, if already known
+        """
+        self.name = name
+        self.rows = rows
+        self.clock = 0.0
+        self.profile = None
+
+    def add_rows(self, rows: int) -> None:
+        """
+        :param rows: more rows processed by this phase
+        :return: None
+        """
+        self.rows += rows
+
+    def __enter__(self) -> "Phase":
+        if not _state.profiling and (
+                self.name in _state.profile or "all" in _state.profile
+        ):
+            import cProfile
+            self.profile = _state.profiles.setdefault(
+                self.name, cProfile.Profile()
+            )
+            _state.profiling = True
+            self.profile.enable()
+        self.clock = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        seconds = time.perf_counter() - self.clock
+        if self.profile is not None:
+            self.profile.disable()
+            _state.profiling = False
+        record(self.name, seconds, self.rows)
+
+
+class _NullPhase:
+    """
+    stands in for Phase when instrumentation is off
+    """
+
+    def add_rows(self, rows: int) -> None:
+        pass
+
+    def __enter__(self) -> "_NullPhase":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NULL_PHASE = _NullPhase()
+
+
+def enabled() -> bool:
+    """
+    :return: whether instrumentation is on
+    """
+    return _state.enabled
+
+
+def configure(
+        fmt: str = "table", profile=(), out: str = None
+) -> None:
+    """
+    turns instrumentation on
+    :param fmt: "table" or "json", how the summary is printed
+    :param profile: names of phases to run under cProfile, or "all"
+    :param out: file to write the summary to, None for stderr
+    :return: None
+    """
+    if fmt not in ("table", "json"):
+        raise ValueError(f"unknown instrument format {fmt!r}")
+    _state.enabled = True
+    _state.fmt = fmt
+    _state.out = out
+    _state.profile = set(profile)
+    if not _state.registered:
+        atexit.register(report)
+        _state.registered = True
+
+
+def disable() -> None:
+    """
+    turns instrumentation off and forgets what was collected
+    :return: None
+    """
+    registered = _state.registered
+    _state.__init__()
+    _state.registered = registered
+
+
+def from_env(environ=None) -> None:
+    """
+    turns instrumentation on if HPI_INSTRUMENT or HPI_PROFILE is set
+    this runs on import, so an unknown format only prints a warning and
+    leaves instrumentation off
+    :param environ: environment to read, os.environ if None
+    :return: None
+    """
+    environ = os.environ if environ is None else environ
+    fmt = environ.get("HPI_INSTRUMENT", "")
+    profile = environ.get("HPI_PROFILE", "")
+    if not fmt and not profile:
+        return
+    if fmt.lower() in ("", "1", "true", "yes", "on"):
+        fmt = "table"
+    try:
+        configure(
+            fmt.lower(),
+            [name for name in profile.split(",") if name],
+            environ.get("HPI_INSTRUMENT_OUT") or None
+        )
+    except ValueError as e:
+        print(f"HPI_INSTRUMENT: {e}, instrumentation is off", file=sys.stderr)
+
+
+def from_argv(argv: list[str] = None) -> None:
+    """
+    turns instrumentation on if --instrument or --profile is given, and
+    takes those arguments out so the rest of the arguments can be parsed as
+    before
+    :param argv: argument list to look through and change, sys.argv if None
+    :return: None
+    """
+    argv = sys.argv if argv is None else argv
+    fmt = None
+    profile = []
+    rest = []
+    for arg in argv:
+        if arg == "--instrument":
+            fmt = "table"
+        elif arg.startswith("--instrument="):
+            fmt = arg.partition("=")[2]
+        elif arg.startswith("--profile="):
+            profile += [name for name in arg.partition("=")[2].split(",")
+                        if name]
+        else:
+            rest.append(arg)
+    argv[:] = rest
+    if fmt is not None or profile:
+        configure(fmt or "table", profile, _state.out)
+
+
+def phase(name: str, rows: int = 0):
+    """
+    times a block of code as a phase
+    with instrument.phase("timeline_plot.render") as p:
+        ...
+        p.add_rows(n)
+    :param name: name of the phase
+    :param rows: rows processed, if already known
+    :return: context manager
+    """
+    if not _state.enabled:
+        return _NULL_PHASE
+    return Phase(name, rows)
+
+
+def timed(name: str, rows=None):
+    """
+    decorator timing every call of a function as a phase
+    :param name: name of the phase
+    :param rows: function of the result giving the rows processed, or None
+    :return: decorator
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return function(*args, **kwargs)
+            with Phase(name) as running:
+                res = function(*args, **kwargs)
+                if rows is not None:
+                    running.add_rows(rows(res))
+            return res
+        return wrapper
+    return decorate
+
+
+def rows_of(data) -> int:
+    """
+    counts rows in a result, for timed
+    :param data: HPIDataset, dict of region to list, or a sequence
+    :return: number of rows
+    """
+    if hasattr(data, "row_count"):
+        return data.row_count
+    if isinstance(data, dict):
+        return sum(len(rows) for rows in data.values())
+    return len(data)
+
+
+def record(name: str, seconds: float, rows: int = 0) -> None:
+    """
+    adds time already measured to a phase, does nothing when off
+    :param name: name of the phase
+    :param seconds: wall time spent
+    :param rows: rows processed
+    :return: None
+    """
+    if not _state.enabled:
+        return
+    _state.calls[name] = _state.calls.get(name, 0) + 1
+    _state.seconds[name] = _state.seconds.get(name, 0.0) + seconds
+    _state.rows[name] = _state.rows.get(name, 0) + rows
+
+
+def summary() -> dict:
+    """
+    :return: for each phase in the order first seen, its calls, seconds, rows
+    and rows per second
+    """
+    return {
+        name: {
+            "calls": calls,
+            "seconds": _state.seconds[name],
+            "rows": _state.rows[name],
+            "rows_per_second": (_state.rows[name] / _state.seconds[name]
+                                if _state.seconds[name] else None),
+        }
+        for name, calls in _state.calls.items()
+    }
+
+
+def format_table(phases: dict) -> str:
+    """
+    :param phases: result of summary
+    :return: summary as a text table
+    """
+    lines = [f"{'phase':<40} {'calls':>6} {'seconds':>10} {'rows':>10} "
+             f"{'rows/s':>12}"]
+    for name, found in phases.items():
+        speed = found["rows_per_second"]
+        lines.append(
+            f"{name:<40} {found['calls']:>6} {found['seconds']:>10.4f} "
+            f"{found['rows']:>10} "
+            + (f"{speed:>12,.0f}" if found["rows"] and speed else f"{'':>12}")
+        )
+    return "\n".join(lines)
+
+
+def report(file=None) -> None:
+    """
+    prints the summary, and the profile of each profiled phase
+    :param file: text file to write to, the configured output if None
+    :return: None
+    """
+    if not _state.enabled or not _state.calls:
+        return
+    if file is None and _state.out is not None:
+        with open(_state.out, "w") as out:
+            report(out)
+        return
+    import pstats
+
+    file = sys.stderr if file is None else file
+    phases = summary()
+    if _state.fmt == "json":
+        profiles = dict()
+        for name, profile in _state.profiles.items():
+            text = io.StringIO()
+            pstats.Stats(profile, stream=text).sort_stats(
+                "cumulative"
+            ).print_stats(PROFILE_LINES)
+            profiles[name] = text.getvalue()
+        json.dump({"phases": phases, "profiles": profiles}, file, indent=2)
+        file.write("\n")
+        return
+    print(format_table(phases), file=file)
+    for name, profile in _state.profiles.items():
+        print(f"\nprofile of {name}", file=file)
+        pstats.Stats(profile, stream=file).sort_stats(
+            "cumulative"
+        ).print_stats(PROFILE_LINES)
+
+
+from_env()
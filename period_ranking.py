@@ -4,7 +4,126 @@ Author: Lyx Huston
 part 1
 """
 
+import heapq
+from collections.abc import Sequence
+
+import numpy as np
+
+import hpi_dataset
 import index_tools
+import instrument
+
+
+class Ranking(Sequence):
+    """
+    list of (region, value) tuples in descending order by value, that only
+    holds the top and bottom entries.  its length is the length of the whole
+    ranking, and indexing an entry that was not kept raises IndexError
+    works with index_tools.print_ranking
+    """
+
+    def __init__(self, top: list, bottom: list, length: int):
+        """
+        :param top: first entries of the ranking
+        :param bottom: last entries of the ranking
+        :param length: number of entries in the whole ranking
+        """
+        self.top = top
+        self.bottom = bottom
+        self.length = length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.length))]
+        if i < 0:
+            i += self.length
+        if 0 <= i < len(self.top):
+            return self.top[i]
+        if self.length - len(self.bottom) <= i < self.length:
+            return self.bottom[i - self.length + len(self.bottom)]
+        if 0 <= i < self.length:
+            raise IndexError(f"ranking only holds the top {len(self.top)} "
+                             f"and bottom {len(self.bottom)}")
+        raise IndexError("ranking index out of range")
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __repr__(self) -> str:
+        return f"Ranking({self.top}, {self.bottom}, {self.length})"
+
+
+def rank(items, k: int = None):
+    """
+    ranks (region, value) tuples in descending order by value
+    ties keep the order the items were given in
+    with k, only the top k and bottom k are kept, using two heaps of size k,
+    so ranking n items takes O(n log k)
+    :param items: iterable of (region, value) tuples
+    :param k: how many to keep at each end, None to keep all
+    :return: sorted list if k is None, otherwise a Ranking
+    """
+    if k is None:
+        res = list(items)
+        res.sort(key=lambda item: item[1], reverse=True)
+        return res
+    if k < 1:
+        raise ValueError("k must be at least 1")
+    # top holds the k best as (value, -seq), bottom the k worst as
+    # (-value, seq), so the root of each heap is the first to be pushed out
+    top = []
+    bottom = []
+    length = 0
+    for item in items:
+        entry = (item[1], -length, item)
+        if len(top) < k:
+            heapq.heappush(top, entry)
+        elif entry > top[0]:
+            heapq.heapreplace(top, entry)
+        entry = (-item[1], length, item)
+        if len(bottom) < k:
+            heapq.heappush(bottom, entry)
+        elif entry > bottom[0]:
+            heapq.heapreplace(bottom, entry)
+        length += 1
+    return Ranking(
+        [entry[2] for entry in sorted(top, reverse=True)],
+        [entry[2] for entry in sorted(bottom)],
+        length
+    )
+
+
+def rank_values(
+        names: list[str], ids: np.ndarray, values: np.ndarray, k: int = None
+):
+    """
+    rank for arrays, the item at position i is (names[ids[i]], values[i])
+    ties keep the order of the positions
+    with k, the top and bottom are found with a partition, so ranking takes
+    O(n) plus sorting the k at each end
+    :param names: region keys
+    :param ids: region number of each value
+    :param values: value to rank by
+    :param k: how many to keep at each end, None to keep all
+    :return: sorted list if k is None, otherwise a Ranking
+    """
+    length = len(values)
+    if k is not None and k < 1:
+        raise ValueError("k must be at least 1")
+    if k is None or 2 * k >= length:
+        order = np.argsort(-values, kind="stable")
+        return _ranking_of_sorted(names, ids[order], values[order], k)
+    ends = []
+    for cut, side in ((length - k, values.__ge__), (k - 1, values.__le__)):
+        # everything tied with the kth value is a candidate, and the stable
+        # sort settles which of them are kept
+        found = np.flatnonzero(side(np.partition(values, cut)[cut]))
+        found = found[np.argsort(-values[found], kind="stable")]
+        found = found[:k] if not ends else found[len(found) - k:]
+        ends.append(list(zip(
+            [names[i] for i in ids[found].tolist()], values[found].tolist()
+        )))
+    return Ranking(ends[0], ends[1], length)
 
 
 def binary_insert(data: list, checked, ins, length: int = None) -> None:
@@ -48,39 +167,87 @@ def binary_insert(data: list, checked, ins, length: int = None) -> None:
         data.append(ins)
 
 
-def quarter_data(data: dict, year: int, qtr: int) -> list:
+def _ranking_of_sorted(
+        names: list[str], ids: np.ndarray, values: np.ndarray, k: int = None
+):
+    """
+    rank_values for values that are already in descending order
+    :param names: region keys
+    :param ids: region number of each value
+    :param values: values in descending order
+    :param k: how many to keep at each end, None to keep all
+    :return: list if k is None, otherwise a Ranking
+    """
+    if k is not None and k < 1:
+        raise ValueError("k must be at least 1")
+    if k is None or 2 * k >= len(values):
+        res = list(zip([names[i] for i in ids.tolist()], values.tolist()))
+        return res if k is None else Ranking(res, res, len(res))
+    ends = [
+        list(zip([names[i] for i in part_ids.tolist()], part.tolist()))
+        for part_ids, part in ((ids[:k], values[:k]), (ids[-k:], values[-k:]))
+    ]
+    return Ranking(ends[0], ends[1], len(values))
+
+
+@instrument.timed("period_ranking.quarter_data", rows=len)
+def quarter_data(data: dict, year: int, qtr: int, k: int = None) -> list:
     """
     gets quarter data for each region
     :param data: dict of state region to list of qtrHPI
     :param year: year looking at
     :param qtr: quarter looking at
+    :param k: only keep the top k and bottom k, see rank
     :return: list of tuples (Region, HPI)
     """
-    res = []
-    length = 0
-    for reg in data:
-        for h in data[reg]:
-            if h.year == year and h.qtr == qtr:
-                binary_insert(res, h.index, (reg, h.index), length)
-                length += 1
-    return res
+    if isinstance(data, hpi_dataset.HPIDataset):
+        return ranked_cross_section(data, year, qtr, k)
+    return rank((
+        (reg, h.index)
+        for reg in data for h in data[reg]
+        if h.year == year and h.qtr == qtr
+    ), k)
 
 
-def annual_data(data: dict, year: int) -> list:
+@instrument.timed("period_ranking.annual_data", rows=len)
+def annual_data(data: dict, year: int, k: int = None) -> list:
     """
     gets annual data for each region
     :param data: dict of state region to list of annualHPI
     :param year: year looking at
+    :param k: only keep the top k and bottom k, see rank
     :return: list of tuples (Region, HPI)
     """
-    res = []
-    length = 0
-    for reg in data:
-        for h in data[reg]:
-            if h.year == year:
-                binary_insert(res, h.index, (reg, h.index), length)
-                length += 1
-    return res
+    if isinstance(data, hpi_dataset.HPIDataset):
+        return ranked_cross_section(data, year, k=k)
+    return rank((
+        (reg, h.index)
+        for reg in data for h in data[reg]
+        if h.year == year
+    ), k)
+
+
+def ranked_cross_section(
+        data: hpi_dataset.HPIDataset, year: int, qtr: int = None, k: int = None
+) -> list:
+    """
+    gets data for each region for a period from a dataset
+    ties keep the order of the regions in the dataset
+    the cross section is looked up in the dataset's period index, which is
+    built the first time, so ranking more periods of the same dataset only
+    copies out the entries returned
+    :param data: HPIDataset
+    :param year: year looking at
+    :param qtr: quarter looking at, None for annual data
+    :param k: only keep the top k and bottom k, see rank
+    :return: list of tuples (Region, HPI) sorted in descending order by HPI
+    """
+    if data.quarterly and qtr is None:
+        # every quarter of the year, not a single period
+        regions, values = data.cross_section(year, qtr)
+        return rank_values(data.regions, regions, values, k)
+    regions, values = data.period_index().lookup(year, qtr)
+    return _ranking_of_sorted(data.regions, regions, values, k)
 
 
 def main():
@@ -89,17 +256,22 @@ def main():
     runs if module is run
     prints top 10 and bottom 10 for year in file
     """
+    instrument.from_argv()
     filepath = "data/" + input(
         "Enter region-based house price index filename: "
     )
     year = int(input("Enter year of interest for house prices: "))
     if "state" in filepath:
         data = index_tools.annualize(
-            index_tools.read_state_house_price_data(filepath)
+            index_tools.read_state_house_price_data(
+                filepath, cache=True, years=(year, year)
+            )
         )
     else:
-        data = index_tools.read_zip_house_price_data(filepath)
-    dat = annual_data(data, year)
+        data = index_tools.read_zip_house_price_data(
+            filepath, cache=True, years=(year, year)
+        )
+    dat = annual_data(data, year, k=10)
     index_tools.print_ranking(dat, f"{year} Annual Ranking")
 
 
@@ -0,0 +1,215 @@
+"""
+render_plots.py
+Author: Lyx Huston
+renders timeline and whisker plots to image files without a display
+
+timeline_plot's plot functions draw with pyplot and wait on a window.  this
+draws the same plots on plain matplotlib Figures, which need no display, and
+saves them as PNG or SVG.  the plots are spread across worker processes, and
+each worker keeps one Figure and clears it between plots instead of making a
+new one every time.
+
+groups of regions are given in a JSON file of group name to list of regions,
+or with --each for one plot per region in the data:
+{"northeast": ["NY", "VT", "MA"], "south": ["MS", "AL"]}
+
+usage:
+python render_plots.py data/HPI_PO_state.txt --groups groups.json -o charts
+python render_plots.py data/HPI_PO_state.txt --each --format svg -o charts
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import index_tools
+import instrument
+
+KINDS = ("timeline", "whiskers")
+
+# the Figure of this worker process, made by _start_worker
+_figure = None
+
+
+def _start_worker(size: tuple[float, float], dpi: int) -> None:
+    """
+    makes the Figure a worker draws every plot on
+    :param size: figure size in inches
+    :param dpi: dots per inch of saved images
+    :return: None
+    """
+    global _figure
+    from matplotlib.figure import Figure
+    _figure = Figure(figsize=size, dpi=dpi)
+
+
+def render(job: tuple) -> tuple[str, str]:
+    """
+    draws one plot and saves it, run in a worker process
+    :param job: (kind, data, regions, output), with data holding the regions
+    already filtered to the years to plot
+    :return: output path, and an error message or None
+    """
+    import timeline_plot
+
+    kind, data, regions, output = job
+    if _figure is None:
+        _start_worker(None, None)
+    _figure.clear()
+    axes = _figure.add_subplot()
+    try:
+        with instrument.phase("render_plots.render"):
+            if kind == "timeline":
+                timeline_plot.draw_HPI(axes, data, regions)
+            else:
+                timeline_plot.draw_whiskers(axes, data, regions)
+            _figure.savefig(output)
+    except (KeyError, IndexError, ValueError, OSError) as e:
+        return output, f"{type(e).__name__}: {e}"
+    return output, None
+
+
+def file_name(name: str) -> str:
+    """
+    :param name: group name
+    :return: name with anything unsafe in a file name replaced by _
+    """
+    return re.sub(r"[^\w.-]+", "_", name).strip("._") or "group"
+
+
+def make_jobs(
+        data,
+        groups: dict[str, list[str]],
+        directory: str,
+        fmt: str = "png",
+        kinds=KINDS
+) -> list[tuple]:
+    """
+    pairs each group and kind of plot with the data it needs
+    only the rows of a group's regions are given to its job, so little has
+    to be sent to the worker
+    :param data: annual data, already filtered to the years to plot
+    :param groups: group name to list of regions
+    :param directory: directory to save to
+    :param fmt: image format, png or svg
+    :param kinds: kinds of plot to make for each group
+    :return: list of jobs for render
+    """
+    jobs = []
+    for name, regions in groups.items():
+        regions = list(regions)
+        subset = data.select(regions=regions, drop_empty=False)
+        for kind in kinds:
+            output = os.path.join(
+                directory, f"{file_name(name)}_{kind}.{fmt}"
+            )
+            jobs.append((kind, subset, regions, output))
+    return jobs
+
+
+def render_all(
+        jobs: list[tuple],
+        workers: int = None,
+        size: tuple[float, float] = (8.0, 6.0),
+        dpi: int = 100
+) -> dict[str, str]:
+    """
+    renders every job
+    :param jobs: jobs from make_jobs
+    :param workers: processes to render with, None for one per CPU, 1 to
+    render in this process
+    :param size: figure size in inches
+    :param dpi: dots per inch of saved images
+    :return: output path to error message, for the jobs that failed
+    """
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    if workers <= 1 or len(jobs) <= 1:
+        _start_worker(size, dpi)
+        results = map(render, jobs)
+        return {output: error for output, error in results if error}
+    with ProcessPoolExecutor(
+            min(workers, len(jobs)), initializer=_start_worker,
+            initargs=(size, dpi)
+    ) as pool:
+        chunk = max(1, len(jobs) // (workers * 4))
+        results = pool.map(render, jobs, chunksize=chunk)
+        return {output: error for output, error in results if error}
+
+
+def read_groups(filepath: str) -> dict[str, list[str]]:
+    """
+    :param filepath: JSON file of group name to list of regions
+    :return: the groups
+    """
+    with open(filepath, "r") as file:
+        groups = json.load(file)
+    if not isinstance(groups, dict) or not all(
+            isinstance(regions, list) for regions in groups.values()
+    ):
+        raise ValueError(f"{filepath}: expected an object of lists")
+    return groups
+
+
+def main() -> None:
+    """
+    main function
+    runs if module is run
+    exits with status 1 if any plot failed
+    """
+    instrument.from_argv()
+    parser = argparse.ArgumentParser(
+        description="render timeline and whisker plots to files"
+    )
+    parser.add_argument("datafile", help="state or ZIP5 data file")
+    parser.add_argument("--groups", help="JSON file of group to regions")
+    parser.add_argument("--each", action="store_true",
+                        help="one plot per region in the data")
+    parser.add_argument("--years", type=int, nargs=2, default=None,
+                        metavar=("FIRST", "LAST"),
+                        help="years to plot, all if not given")
+    parser.add_argument("--kind", choices=KINDS + ("both",), default="both")
+    parser.add_argument("--format", choices=("png", "svg"), default="png")
+    parser.add_argument("-o", "--output", default=".",
+                        help="directory to save to")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes to render with, one per CPU if not "
+                             "given")
+    parser.add_argument("--dpi", type=int, default=100)
+    args = parser.parse_args()
+    if args.groups is None and not args.each:
+        parser.error("give --groups or --each")
+
+    groups = dict() if args.groups is None else read_groups(args.groups)
+    years = None if args.years is None else tuple(sorted(args.years))
+    # warnings printed while reading go with the progress messages
+    with contextlib.redirect_stdout(sys.stderr):
+        if "state" in args.datafile:
+            data = index_tools.annualize(
+                index_tools.read_state_house_price_data(
+                    args.datafile, cache=True, years=years
+                )
+            )
+        else:
+            data = index_tools.read_zip_house_price_data(
+                args.datafile, cache=True, years=years
+            )
+    if args.each:
+        groups.update((reg, [reg]) for reg in data)
+    os.makedirs(args.output, exist_ok=True)
+    kinds = KINDS if args.kind == "both" else (args.kind,)
+    jobs = make_jobs(data, groups, args.output, args.format, kinds)
+    failed = render_all(jobs, args.workers, dpi=args.dpi)
+    for output, error in failed.items():
+        print(f"{output}: {error}", file=sys.stderr)
+    print(f"rendered {len(jobs) - len(failed)} of {len(jobs)} plots to "
+          f"{args.output}", file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
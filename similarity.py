@@ -0,0 +1,194 @@
+"""
+similarity.py
+Author: Lyx Huston
+finds the regions whose house price index followed the same path as another
+
+every region with data for every year of a window is laid out with
+timeline_plot.build_plottable_matrix, and each series is rebased to 1 at the
+first year.  the normalized vectors are made once, so a query is one matrix
+vector product against all of them and an argpartition for the best k.
+two measures:
+correlation   pearson correlation of the series, 1 is the same shape
+euclidean     distance between the rebased series, 0 is the same path
+
+usage:
+python similarity.py data/HPI_AT_ZIP5.txt 14623 --years 2000 2015 --k 5
+python similarity.py data/HPI_PO_state.txt NY --metric euclidean -o ny.png
+"""
+
+import argparse
+import contextlib
+import sys
+
+import numpy as np
+
+import hpi_dataset
+import index_tools
+import instrument
+import timeline_plot
+
+METRICS = ("correlation", "euclidean")
+
+
+class TrajectoryIndex:
+    """
+    normalized series of every region over a window of years, ready to be
+    searched
+    regions missing any year of the window are left out, as their paths
+    cannot be compared year for year
+    """
+
+    @instrument.timed("similarity.TrajectoryIndex")
+    def __init__(
+            self,
+            data: "hpi_dataset.HPIDataset",
+            first: int,
+            last: int,
+            metric: str = "correlation"
+    ):
+        """
+        :param data: annual data, dict of region to list of AnnualHPI or
+        HPIDataset
+        :param first: first year of the window
+        :param last: last year of the window
+        :param metric: "correlation" or "euclidean"
+        """
+        if metric not in METRICS:
+            raise ValueError(f"unknown metric {metric!r}")
+        if last <= first:
+            raise ValueError("the window needs at least two years")
+        self.metric = metric
+        self.years = list(range(first, last + 1))
+        _, matrix = timeline_plot.build_plottable_matrix(
+            data, list(data), self.years
+        )
+        full = ~matrix.mask.any(axis=1) & (matrix.data[:, 0] > 0)
+        regions = list(data)
+        self.regions = [regions[i] for i in np.flatnonzero(full).tolist()]
+        self._positions = {reg: i for i, reg in enumerate(self.regions)}
+        vectors = matrix.data[full]
+        vectors /= vectors[:, :1]
+        if metric == "correlation":
+            vectors -= vectors.mean(axis=1, keepdims=True)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            # a flat series has no shape to correlate with
+            np.divide(vectors, norms, out=vectors, where=norms > 0)
+            self.norms = None
+        else:
+            self.norms = np.einsum("ij,ij->i", vectors, vectors)
+        self.vectors = vectors
+
+    def __contains__(self, region) -> bool:
+        return region in self._positions
+
+    def __len__(self) -> int:
+        return len(self.regions)
+
+    def query(self, region: str, k: int = 10) -> list[tuple[str, float]]:
+        """
+        finds the regions most like one in the index
+        :param region: region to match, raises KeyError if not in the index
+        :param k: how many to find
+        :return: list of (region, score) tuples, best first, not including
+        the region itself.  the score is the correlation, or the distance
+        between rebased series
+        """
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        i = self._positions[region]
+        dots = self.vectors @ self.vectors[i]
+        if self.metric == "correlation":
+            # higher is better, sort on the negative
+            keys = -dots
+        else:
+            keys = np.sqrt(np.maximum(
+                self.norms + self.norms[i] - 2 * dots, 0
+            ))
+        keys[i] = np.inf
+        k = min(k, len(keys) - 1)
+        if k <= 0:
+            return []
+        best = np.argpartition(keys, k - 1)[:k]
+        best = best[np.argsort(keys[best], kind="stable")]
+        scores = -keys[best] if self.metric == "correlation" else keys[best]
+        return list(zip(
+            [self.regions[j] for j in best.tolist()], scores.tolist()
+        ))
+
+
+def similar_regions(
+        data: "hpi_dataset.HPIDataset",
+        region: str,
+        first: int,
+        last: int,
+        k: int = 10,
+        metric: str = "correlation"
+) -> list[str]:
+    """
+    the region and its k closest matches, ready for timeline_plot.plot_HPI
+    an index is made for the one query, keep a TrajectoryIndex to ask more
+    :param data: annual data
+    :param region: region to match
+    :param first: first year of the window
+    :param last: last year of the window
+    :param k: how many matches to find
+    :param metric: "correlation" or "euclidean"
+    :return: list of regions, the region first
+    """
+    index = TrajectoryIndex(data, first, last, metric)
+    if region not in index:
+        raise KeyError(f"{region} has no data for every year "
+                       f"{first}-{last}")
+    return [region] + [reg for reg, _ in index.query(region, k)]
+
+
+def main() -> None:
+    """
+    main function
+    runs if module is run
+    prints the closest matches to a region and plots them with it
+    """
+    instrument.from_argv()
+    parser = argparse.ArgumentParser(
+        description="find regions whose house prices moved like another's"
+    )
+    parser.add_argument("datafile", help="state or ZIP5 data file")
+    parser.add_argument("region", help="region to match")
+    parser.add_argument("--years", type=int, nargs=2, default=(2000, 2015),
+                        metavar=("FIRST", "LAST"))
+    parser.add_argument("--k", type=int, default=5,
+                        help="how many matches to find")
+    parser.add_argument("--metric", choices=METRICS, default="correlation")
+    parser.add_argument("-o", "--output",
+                        help="file to save the plot to, shown if not given")
+    parser.add_argument("--no-plot", action="store_true")
+    args = parser.parse_args()
+    first, last = sorted(args.years)
+
+    with contextlib.redirect_stdout(sys.stderr):
+        if "state" in args.datafile:
+            data = index_tools.annualize(
+                index_tools.read_state_house_price_data(
+                    args.datafile, cache=True, years=(first, last)
+                )
+            )
+        else:
+            data = index_tools.read_zip_house_price_data(
+                args.datafile, cache=True, years=(first, last)
+            )
+    index = TrajectoryIndex(data, first, last, args.metric)
+    if args.region not in index:
+        sys.exit(f"{args.region} has no data for every year {first}-{last}")
+    matches = index.query(args.region, args.k)
+    print(f"Regions most like {args.region}, {first}-{last}, by "
+          f"{args.metric}")
+    for i, (reg, score) in enumerate(matches):
+        print(f"{i + 1}: {reg} {score:.4f}")
+    if not args.no_plot:
+        timeline_plot.plot_HPI(
+            data, [args.region] + [reg for reg, _ in matches], args.output
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+    file: conftest.py
+    description:
+    Fixtures shared by the tests
+    author: Lyx Huston
+"""
+
+import pytest
+
+import hpi_dataset
+import index_tools
+
+# a made up state file, with a missing value
+STATE_LINES = [
+    "state yr qtr index_nsa index_sa",
+    "NY 2000 1 100.00 100.00",
+    "NY 2000 2 110.00 110.00",
+    "NY 2001 1 121.00 121.00",
+    "VT 2000 1 90.00 90.00",
+    "VT 2000 2 . . warning: data unavailable in original source.",
+    "VT 2001 1 80.00 80.00",
+]
+
+
+@pytest.fixture
+def annual_dataset():
+    """
+        builds an annual dataset from a dict of region to dict of year to
+        index
+    """
+    def build(values: dict) -> hpi_dataset.HPIDataset:
+        return hpi_dataset.HPIDataset.from_dict({
+            reg: [index_tools.AnnualHPI(y, v) for y, v in found.items()]
+            for reg, found in values.items()
+        })
+
+    return build
+
+
+@pytest.fixture
+def state_lines() -> list[str]:
+    """
+        the lines of the made up state file, to change and write again
+    """
+    return list(STATE_LINES)
+
+
+@pytest.fixture
+def state_file(tmp_path, state_lines):
+    """
+        writes the made up state file as HPI_PO_state.txt in a temporary
+        directory and gives its path
+    """
+    path = tmp_path / "HPI_PO_state.txt"
+    path.write_text("\n".join(state_lines) + "\n")
+    return path
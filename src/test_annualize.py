@@ -0,0 +1,52 @@
+"""
+    file: test_annualize.py
+    description:
+    Test that annualizing a dataset in one grouped pass gives the same years
+    and averages as annualizing the dict of lists, and that partial years are
+    counted and can be left out
+    author: Lyx Huston
+"""
+
+import numpy as np
+
+import hpi_dataset
+import index_tools  # subject of test
+import synthetic_data
+
+
+def test1(tmp_path):
+    """
+        tests the dataset against the dict, with and without partial years
+    """
+    state = str(tmp_path / "HPI_PO_state.txt")
+    synthetic_data.write_state_file(state, 3000, missing_rate=0.1, seed=6)
+    data = index_tools.read_state_house_price_data(state)
+    lists = {reg: data[reg] for reg in data}
+
+    for least in (1, 4):
+        annual = index_tools.annualize(data, least)
+        expected = index_tools.annualize(lists, least)
+        assert list(annual) == list(expected)
+        for reg in expected:
+            assert annual[reg] == expected[reg]
+    assert index_tools.annualize(data, 4).row_count < \
+        index_tools.annualize(data).row_count
+
+
+def test2():
+    """
+        tests quarter counts, including a region starting on the year the
+        one before it ended
+    """
+    data = hpi_dataset.HPIDataset.from_dict({
+        "AA": [index_tools.QuarterHPI(2000, q, 1.0) for q in (1, 2, 3, 4)]
+        + [index_tools.QuarterHPI(2001, 1, 3.0)],
+        "AB": [index_tools.QuarterHPI(2001, q, 2.0 * q) for q in (2, 3)],
+    })
+    annual = data.annualized()
+
+    assert np.array_equal(data.quarter_counts(), [4, 1, 2])
+    assert np.array_equal(annual.year, [2000, 2001, 2001])
+    assert np.array_equal(annual.index, [1.0, 3.0, 5.0])
+    assert np.array_equal(annual.offsets, [0, 2, 3])
+    assert data.annualized(4)["AB"] == []
@@ -0,0 +1,125 @@
+"""
+    file: test_batch_query.py
+    description:
+    Test the batch_query.py module on a small made up state file
+    author: Lyx Huston
+"""
+
+import io
+import json
+
+import batch_query  # subject of test
+
+
+def test1(state_file):
+    """
+        tests range, ranking and trend queries, and a bad query
+    """
+    session = batch_query.QuerySession(str(state_file))
+    queries = [
+        {"id": 1, "query": "range", "region": "NY", "quarterly": True},
+        {"id": 2, "query": "ranking", "year": 2000, "k": 1},
+        {"id": 3, "query": "trend", "year0": 2000, "year1": 2001},
+        {"id": 4, "query": "range", "region": "ZZ"},
+    ]
+    out = io.StringIO()
+    failed = batch_query.run_batch(session, queries, out)
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+
+    assert failed == 1
+    assert results[0]["high"] == {"year": 2001, "qtr": 1, "index": 121.0}
+    assert results[0]["low"] == {"year": 2000, "qtr": 1, "index": 100.0}
+    assert results[1]["count"] == 2
+    assert results[1]["top"] == [["NY", 105.0]]
+    assert results[1]["bottom"] == [["VT", 90.0]]
+    assert [item[0] for item in results[2]["top"]] == ["NY", "VT"]
+    assert "error" in results[3]
+
+
+def test2(state_file):
+    """
+        tests csv output
+    """
+    session = batch_query.QuerySession(str(state_file))
+    out = io.StringIO()
+    batch_query.run_batch(
+        session, [{"id": 7, "query": "ranking", "year": 2001, "k": 1}],
+        out, "csv"
+    )
+    lines = out.getvalue().splitlines()
+
+    assert lines[0] == ",".join(batch_query.CSV_FIELDS)
+    assert lines[1] == "7,ranking,top,1,NY,,,121.0,"
+    assert lines[2] == "7,ranking,bottom,2,VT,,,80.0,"
+
+
+def test3(state_file):
+    """
+        tests a range query over some years
+    """
+    session = batch_query.QuerySession(str(state_file))
+    res = session.run({
+        "query": "range", "region": "NY", "quarterly": True, "year1": 2000
+    })
+    empty = session.run({"query": "range", "region": "NY", "year0": 2002})
+
+    assert res["high"] == {"year": 2000, "qtr": 2, "index": 110.0}
+    assert res["low"] == {"year": 2000, "qtr": 1, "index": 100.0}
+    assert "error" in empty
+
+
+def test4(tmp_path, state_file):
+    """
+        tests that plots that cannot be drawn or saved fail alone and leave
+        no figure open
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    session = batch_query.QuerySession(str(state_file))
+    queries = [
+        {"id": 1, "query": "plot", "regions": ["NY", "VT"],
+         "years": [2000, 2001], "output": str(tmp_path / "none" / "x.png")},
+        {"id": 2, "query": "plot", "regions": ["NY"], "years": [1980, 1990],
+         "output": str(tmp_path / "empty.png")},
+        {"id": 3, "query": "plot", "regions": ["NY"], "years": [2000, 2001],
+         "output": str(tmp_path / "ny.png"), "kind": "whiskers"},
+    ]
+    out = io.StringIO()
+    failed = batch_query.run_batch(session, queries, out)
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+
+    assert failed == 2
+    assert "error" in results[0]
+    assert results[1]["error"] == "no data for the regions to plot"
+    assert not (tmp_path / "empty.png").exists()
+    assert results[2]["output"] == str(tmp_path / "ny.png")
+    assert (tmp_path / "ny.png").exists()
+    assert plt.get_fignums() == []
+
+
+def test5(state_file):
+    """
+        tests that lines that are not JSON objects fail, and that a query
+        with an "error" field of its own is still answered
+    """
+    session = batch_query.QuerySession(str(state_file))
+    lines = io.StringIO(
+        '{"id": 1, "query": "annualize", "region": "VT", "error": "x"}\n'
+        "# a comment\n"
+        "\n"
+        "{not json\n"
+        "[1, 2]\n"
+    )
+    out = io.StringIO()
+    failed = batch_query.run_batch(
+        session, batch_query.read_queries(lines), out
+    )
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+
+    assert failed == 2
+    assert results[0]["values"] == [[2000, 90.0], [2001, 80.0]]
+    assert "error" not in results[0]
+    assert results[1]["error"].startswith("line 4: ")
+    assert results[2]["error"] == "line 5: not an object"
@@ -0,0 +1,88 @@
+"""
+    file: test_drawdown.py
+    description:
+    Test the drawdown.py module on small made up datasets
+    author: Lyx Huston
+"""
+
+import numpy as np
+
+import drawdown  # subject of test
+import hpi_dataset
+import index_tools
+
+
+def test1(annual_dataset):
+    """
+        tests peaks, troughs, drawdowns, recoveries and the ranking
+    """
+    data = annual_dataset({
+        "AA": {2005: 100.0, 2006: 120.0, 2009: 60.0, 2010: 90.0, 2013: 125.0},
+        "AB": {2006: 80.0, 2007: 80.0, 2008: 76.0, 2011: 70.0},
+        "AC": {2009: 50.0, 2010: 40.0},
+        "AD": {2004: 10.0, 2007: 12.0},
+        "AE": {2007: 200.0, 2008: 150.0, 2009: 210.0},
+    })
+    table = drawdown.crash_table(data, 2008)
+    ranking = table.ranking()
+
+    assert [entry.region for entry in ranking] == ["AA", "AE", "AB"]
+    assert ranking[0].peak == (2006, 120.0)
+    assert ranking[0].trough == (2009, 60.0)
+    assert ranking[0].drawdown == -50.0
+    assert ranking[0].recovery_years == 7.0
+    assert ranking[1].recovery_years == 2.0
+    assert ranking[2].peak == (2006, 80.0)
+    assert ranking[2].trough == (2011, 70.0)
+    assert ranking[2].recovery_years is None
+    assert "not recovered" in str(ranking[2])
+
+
+def test2(annual_dataset):
+    """
+        tests the drawdown series against a running high in Python, with
+        gaps, and the peaks of quarterly data
+    """
+    rng = np.random.default_rng(8)
+    values = {
+        f"R{i}": {y: float(v) for y, v in zip(
+            range(1990, 2015), rng.uniform(50, 150, 25)
+        ) if rng.random() > 0.2}
+        for i in range(20)
+    }
+    regions, years, res = drawdown.drawdown_matrix(annual_dataset(values))
+
+    for i, reg in enumerate(regions):
+        high = None
+        for j, year in enumerate(years.tolist()):
+            if year not in values[reg]:
+                assert np.isnan(res[i, j])
+                continue
+            value = values[reg][year]
+            high = value if high is None else max(high, value)
+            assert np.isclose(res[i, j], (value / high - 1) * 100)
+
+    quarters = hpi_dataset.HPIDataset.from_dict({
+        "AA": [index_tools.QuarterHPI(2007, q, v)
+               for q, v in ((1, 10.0), (2, 12.0), (3, 11.0), (4, 12.0))]
+        + [index_tools.QuarterHPI(2008, 1, 6.0),
+           index_tools.QuarterHPI(2008, 3, 12.5)],
+    })
+    entry = drawdown.crash_table(quarters, 2008).ranking()[0]
+    assert entry.peak == (2007, 2, 12.0)
+    assert entry.trough == (2008, 1, 6.0)
+    assert entry.recovery_years == 1.25
+
+
+def test3(annual_dataset):
+    """
+        tests that a dip before the crash year is not taken for the trough
+    """
+    data = annual_dataset({
+        "AA": {2005: 100.0, 2006: 120.0, 2007: 80.0, 2009: 90.0, 2010: 130.0},
+    })
+    entry = drawdown.crash_table(data, 2008).ranking()[0]
+    assert entry.peak == (2006, 120.0)
+    assert entry.trough == (2009, 90.0)
+    assert entry.drawdown == -25.0
+    assert entry.recovery_years == 4.0
@@ -0,0 +1,147 @@
+"""
+    file: test_hpi_cache.py
+    description:
+    Test when the hpi_cache.py module uses its cache and when it parses the
+    file again, on a small made up state file
+    author: Lyx Huston
+"""
+
+import os
+
+import numpy as np
+
+import hpi_cache  # subject of test
+import hpi_parse
+
+def counting(monkeypatch) -> dict:
+    """
+        counts the parses and hashes hpi_cache does
+    """
+    calls = {"parse": 0, "hash": 0}
+    parse_file = hpi_parse.parse_file
+    file_hash = hpi_cache.file_hash
+
+    def counted_parse(*args, **kwargs):
+        calls["parse"] += 1
+        return parse_file(*args, **kwargs)
+
+    def counted_hash(*args, **kwargs):
+        calls["hash"] += 1
+        return file_hash(*args, **kwargs)
+
+    monkeypatch.setattr(hpi_parse, "parse_file", counted_parse)
+    monkeypatch.setattr(hpi_cache, "file_hash", counted_hash)
+    return calls
+
+
+def load(path):
+    """
+        reads the state file through the cache
+    """
+    return hpi_cache.parse_file(str(path), hpi_parse.STATE_FORMAT)
+
+
+def test1(state_file, monkeypatch):
+    """
+        tests that the second read comes from the cache, with the same
+        data and counts, and that no temporary files are left
+    """
+    calls = counting(monkeypatch)
+    parsed, parsed_stats = load(state_file)
+    cached, cached_stats = load(state_file)
+
+    assert calls == {"parse": 1, "hash": 1}
+    assert cached.regions == parsed.regions == ["NY", "VT"]
+    assert np.array_equal(cached.offsets, parsed.offsets)
+    assert np.array_equal(cached.year, parsed.year)
+    assert np.array_equal(cached.qtr, parsed.qtr)
+    assert np.array_equal(cached.index, parsed.index)
+    assert cached_stats.rows == parsed_stats.rows == 5
+    assert cached_stats.missing == parsed_stats.missing == 1
+    assert sorted(os.listdir(hpi_cache.cache_dir(str(state_file)))) == [
+        "index.npy", "meta.json", "offsets.npy", "qtr.npy", "regions.npy",
+        "year.npy"
+    ]
+
+
+def test2(state_file, state_lines, monkeypatch):
+    """
+        tests that a file that changed size is parsed again, and only hashed
+        for the new cache
+    """
+    load(state_file)
+    calls = counting(monkeypatch)
+    state_file.write_text(
+        "\n".join(state_lines + ["CA 2000 1 50.00 50.00"]) + "\n"
+    )
+    data, stats = load(state_file)
+
+    assert calls == {"parse": 1, "hash": 1}
+    assert data.regions == ["NY", "VT", "CA"]
+    assert stats.rows == 6
+
+
+def test3(state_file, state_lines, monkeypatch):
+    """
+        tests that a file that was only touched is hashed once and then used
+        from the cache, and one changed without changing size is parsed again
+    """
+    load(state_file)
+    calls = counting(monkeypatch)
+    stat = os.stat(state_file)
+    os.utime(state_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    load(state_file)
+    assert calls == {"parse": 0, "hash": 1}
+    load(state_file)
+    assert calls == {"parse": 0, "hash": 1}
+
+    state_lines[2] = state_lines[2].replace("110.00", "120.00")
+    state_file.write_text("\n".join(state_lines) + "\n")
+    os.utime(state_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10 ** 9))
+    data, _ = load(state_file)
+    assert calls == {"parse": 1, "hash": 2}
+    assert data.index.tolist() == [100.0, 120.0, 121.0, 90.0, 80.0]
+
+
+def test4(state_file, monkeypatch):
+    """
+        tests that a cache made by another version is not used, and the one
+        made in its place is
+    """
+    load(state_file)
+    calls = counting(monkeypatch)
+    version = hpi_cache.CACHE_VERSION + 1
+    monkeypatch.setattr(hpi_cache, "CACHE_VERSION", version)
+    load(state_file)
+    load(state_file)
+
+    assert calls == {"parse": 1, "hash": 1}
+
+
+def test5(state_file, tmp_path, monkeypatch):
+    """
+        tests that saving leaves only the cache directory behind, and that
+        a cache saved by another process while one is being mapped is not
+        used
+    """
+    load(state_file)
+    load(state_file)
+    directory = hpi_cache.cache_dir(str(state_file))
+    assert sorted(os.listdir(tmp_path)) == \
+        ["HPI_PO_state.txt", "HPI_PO_state.txt.hpicache"]
+
+    open_cache = hpi_cache.open_cache
+
+    def swapped(path):
+        data = open_cache(path)
+        other = dict(hpi_cache._read_meta(path), hash="other")
+        hpi_cache.save(path, data.select(["VT"]), other)
+        return data
+
+    calls = counting(monkeypatch)
+    monkeypatch.setattr(hpi_cache, "open_cache", swapped)
+    data, _ = load(state_file)
+    assert calls["parse"] == 1
+    assert data.regions == ["NY", "VT"]
+    assert len(os.listdir(tmp_path)) == 2
+    assert hpi_cache._read_meta(directory)["hash"] != "other"
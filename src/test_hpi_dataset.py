@@ -0,0 +1,142 @@
+"""
+    file: test_hpi_dataset.py
+    description:
+    Test the indexes of the hpi_dataset.py module against plain scans of the
+    rows of random datasets
+    author: Lyx Huston
+"""
+
+import numpy as np
+
+import hpi_dataset  # subject of test
+import index_tools
+
+
+def random_dataset(rng, quarterly: bool) -> hpi_dataset.HPIDataset:
+    """
+        makes 20 regions with random rows dropped and many tied values, over
+        1990 to 1999, with 1995 left out of every region
+    """
+    code = []
+    year = []
+    qtr = []
+    for reg in range(20):
+        for y in range(1990, 2000):
+            for q in range(1, 5 if quarterly else 2):
+                if y != 1995 and rng.random() > 0.3:
+                    code.append(reg)
+                    year.append(y)
+                    qtr.append(q)
+    index = rng.integers(0, 6, len(code)).astype(float)
+    return hpi_dataset.HPIDataset.from_codes(
+        [f"R{i:02d}" for i in range(20)], code, year, index,
+        qtr if quarterly else None
+    )
+
+
+def test1():
+    """
+        tests PeriodIndex lookups against scanning the rows for the period,
+        for annual and quarterly data and for periods with no rows
+    """
+    rng = np.random.default_rng(6)
+    for quarterly in (False, True):
+        data = random_dataset(rng, quarterly)
+        index = data.period_index()
+        ids = data.region_ids
+        for year in range(1988, 2002):
+            for qtr in (range(0, 6) if quarterly else [None]):
+                found = data.year == year
+                if quarterly:
+                    found &= data.qtr == qtr
+                rows = np.flatnonzero(found)
+                rows = rows[np.argsort(-data.index[rows], kind="stable")]
+                regions, values = index.lookup(year, qtr)
+                assert regions.tolist() == ids[rows].tolist()
+                assert values.tolist() == data.index[rows].tolist()
+        if quarterly:
+            try:
+                index.lookup(1990)
+            except ValueError:
+                pass
+            else:
+                assert False, "quarterly data needs a quarter"
+
+
+def test2():
+    """
+        tests the highs and lows of ExtremesTable against a scan of every
+        window, for random windows of years, single years, and windows with
+        no rows
+    """
+    rng = np.random.default_rng(12)
+    for quarterly in (False, True):
+        data = random_dataset(rng, quarterly)
+        windows = [(None, None), (1995, 1995), (2001, 2005), (1980, 1989),
+                   (1999, 1990), (1990, None), (None, 1993)]
+        windows += [tuple(sorted(rng.integers(1988, 2002, 2).tolist()))
+                    for _ in range(30)]
+        windows += [(y, y) for y in range(1989, 2001)]
+        for first, last in windows:
+            high, low = data.window_extremes(first, last)
+            for reg in range(len(data.regions)):
+                start, stop = data.offsets[reg], data.offsets[reg + 1]
+                rows = np.arange(start, stop)
+                years = data.year[rows]
+                if first is not None:
+                    rows = rows[years >= first]
+                    years = years[years >= first]
+                if last is not None:
+                    rows = rows[years <= last]
+                if not len(rows):
+                    assert high[reg] == low[reg] == -1
+                    continue
+                values = data.index[rows]
+                assert high[reg] == rows[np.argmax(values)]
+                assert low[reg] == rows[np.argmin(values)]
+
+        # windows of rows never cross regions
+        regions = rng.integers(0, len(data.regions), 200)
+        lengths = np.diff(data.offsets)[regions]
+        starts = data.offsets[regions] + rng.integers(0, lengths + 1)
+        room = data.offsets[regions + 1] - starts
+        stops = starts + rng.integers(-1, room + 1)
+        high, low = data.extremes().query(starts, stops)
+        for i, (start, stop) in enumerate(zip(starts, stops)):
+            if stop <= start:
+                assert high[i] == low[i] == -1
+            else:
+                values = data.index[start:stop]
+                assert high[i] == start + np.argmax(values)
+                assert low[i] == start + np.argmin(values)
+
+
+def test3():
+    """
+        tests get_hpi_extremes of single regions over windows of years
+        against window_extremes, and that it does not build the sparse table
+    """
+    rng = np.random.default_rng(3)
+    windows = [(None, None), (1992, 1997), (1995, 1996), (None, 1991),
+               (1998, None)]
+    for quarterly in (False, True):
+        data = random_dataset(rng, quarterly)
+        found = dict()
+        for first, last in windows:
+            for region in data.regions:
+                try:
+                    found[region, first, last] = index_tools.get_hpi_extremes(
+                        data, region, first, last
+                    )
+                except ValueError:
+                    found[region, first, last] = None
+        assert data._extremes is None
+        for first, last in windows:
+            high, low = data.window_extremes(first, last)
+            for reg, region in enumerate(data.regions):
+                if high[reg] == -1:
+                    assert found[region, first, last] is None
+                else:
+                    assert found[region, first, last] == (
+                        data.record(int(high[reg])), data.record(int(low[reg]))
+                    )
@@ -0,0 +1,108 @@
+"""
+    file: test_hpi_merge.py
+    description:
+    Test that merging an update gives the same data, annual averages and
+    period index as reading everything again
+    author: Lyx Huston
+"""
+
+import numpy as np
+
+import hpi_cache
+import hpi_dataset
+import hpi_parse
+import index_tools  # subject of test
+import synthetic_data
+
+
+def same(a, b):
+    """
+        checks two datasets hold the same rows
+    """
+    assert a.regions == b.regions
+    assert np.array_equal(a.offsets, b.offsets)
+    assert np.array_equal(a.year, b.year)
+    assert np.array_equal(a.index, b.index)
+    assert (a.qtr is None) == (b.qtr is None)
+    if a.qtr is not None:
+        assert np.array_equal(a.qtr, b.qtr)
+
+
+def test1(tmp_path):
+    """
+        tests merging revised quarters, a new quarter and a new region
+    """
+    state = str(tmp_path / "HPI_PO_state.txt")
+    synthetic_data.write_state_file(state, 2000, seed=4)
+    full, _ = hpi_parse.parse_file(state, hpi_parse.STATE_FORMAT)
+    # the base is missing 2015 and region AK, and has some old values
+    mask = (full.year < 2015) & (full.region_ids < 11)
+    rows = np.flatnonzero(mask)
+    base = full.take(rows)
+    base.index[rows % 17 == 0] += 1.0
+    revised = ~mask | (np.arange(full.row_count) % 17 == 0)
+    update = full.take(np.flatnonzero(revised))
+    annual = index_tools.annualize(base)
+    base.period_index()
+    annual.period_index()
+
+    merged, merged_annual = index_tools.merge_update(base, update, annual)
+
+    same(merged, full)
+    same(merged_annual, full.annualized())
+    for old, new in [(merged, full), (merged_annual, full.annualized())]:
+        index = old.period_index()
+        expected = hpi_dataset.PeriodIndex(new)
+        assert np.array_equal(index.periods, expected.periods)
+        assert np.array_equal(index.starts, expected.starts)
+        assert np.array_equal(index.region_ids, expected.region_ids)
+        assert np.array_equal(index.values, expected.values)
+
+
+def test2(tmp_path):
+    """
+        tests merging an update file into a cache
+    """
+    zips = str(tmp_path / "HPI_AT_ZIP5.txt")
+    later = str(tmp_path / "update.txt")
+    synthetic_data.write_zip_file(zips, 500, seed=2)
+    with open(zips, "r") as file:
+        lines = file.readlines()
+    with open(zips, "w") as file:
+        file.writelines(lines[:400])
+    with open(later, "w") as file:
+        file.writelines(lines[:1] + lines[400:])
+
+    merged, stats = hpi_cache.merge_file(zips, hpi_parse.ZIP_FORMAT, later)
+    cached, _ = hpi_cache.parse_file(zips, hpi_parse.ZIP_FORMAT)
+    with open(zips, "w") as file:
+        file.writelines(lines)
+    expected, _ = hpi_parse.parse_file(zips, hpi_parse.ZIP_FORMAT)
+
+    assert stats.rows + stats.missing == 101
+    same(merged, expected)
+    same(cached, expected)
+
+
+def test3():
+    """
+        tests that a region and period given more than once in an update is
+        merged once, with the last of its rows
+    """
+    base = hpi_dataset.HPIDataset.from_dict({
+        "AA": [index_tools.AnnualHPI(2000, 1.0),
+               index_tools.AnnualHPI(2001, 2.0)],
+    })
+    update = hpi_dataset.HPIDataset.from_dict({
+        "AB": [index_tools.AnnualHPI(2000, 3.0),
+               index_tools.AnnualHPI(2000, 4.0)],
+        "AA": [index_tools.AnnualHPI(2001, 5.0),
+               index_tools.AnnualHPI(2002, 6.0),
+               index_tools.AnnualHPI(2001, 7.0)],
+    })
+    merged = base.merge(update)
+
+    assert merged.regions == ["AA", "AB"]
+    assert merged.offsets.tolist() == [0, 3, 4]
+    assert merged.year.tolist() == [2000, 2001, 2002, 2000]
+    assert merged.index.tolist() == [1.0, 7.0, 6.0, 4.0]
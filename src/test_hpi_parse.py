@@ -0,0 +1,251 @@
+"""
+    file: test_hpi_parse.py
+    description:
+    Test that parsing a file in byte ranges with several processes, or
+    decompressing it as it is read, gives the same dataset as parsing it on
+    one, and that chunks are parsed into the values float() and int() give
+    author: Lyx Huston
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+
+import numpy as np
+
+import hpi_parse  # subject of test
+
+ZIP_HEADER = "Five-Digit ZIP Code\tYear\tAnnual Change (%)\tHPI"
+
+
+def write_zip_file(tmp_path):
+    """
+        writes a made up ZIP5 file, with regions spread through it, a missing
+        value, and no line break at the end
+    """
+    lines = [ZIP_HEADER]
+    for year in range(1980, 2020):
+        for zipcode in range(10000, 10030):
+            index = "." if (year, zipcode) == (1990, 10007) else \
+                f"{(zipcode - 9900) * (year - 1970) / 7:.2f}"
+            lines.append(f"{zipcode}\t{year}\t.\t{index}")
+    path = tmp_path / "HPI_AT_ZIP5.txt"
+    path.write_text("\n".join(lines))
+    return str(path)
+
+
+def test1(tmp_path, monkeypatch):
+    """
+        tests parsing with three workers against parsing with one
+    """
+    path = write_zip_file(tmp_path)
+    monkeypatch.setattr(hpi_parse, "MIN_RANGE_SIZE", 1000)
+    assert len(hpi_parse.byte_ranges(path, 3)) == 3
+
+    one, one_stats = hpi_parse.parse_file(path, hpi_parse.ZIP_FORMAT)
+    many, many_stats = hpi_parse.parse_file(
+        path, hpi_parse.ZIP_FORMAT, chunk_size=4096, workers=3
+    )
+
+    assert many.regions == one.regions
+    assert np.array_equal(many.offsets, one.offsets)
+    assert np.array_equal(many.year, one.year)
+    assert np.array_equal(many.index, one.index)
+    assert many_stats.rows == one_stats.rows == 30 * 40 - 1
+    assert many_stats.missing == one_stats.missing == 1
+    assert many_stats.bytes == one_stats.bytes
+
+
+def test2(tmp_path, monkeypatch):
+    """
+        tests that byte ranges cover the file and start on lines
+    """
+    path = write_zip_file(tmp_path)
+    monkeypatch.setattr(hpi_parse, "MIN_RANGE_SIZE", 1)
+    with open(path, "rb") as file:
+        content = file.read()
+    ranges = hpi_parse.byte_ranges(path, 64)
+
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == len(content)
+    for (_, stop), (start, _) in zip(ranges, ranges[1:]):
+        assert stop == start
+        assert content[start - 1:start] == b"\n"
+
+
+def test3(tmp_path, monkeypatch):
+    """
+        tests reading compressed files, which are always parsed on one core
+    """
+    path = write_zip_file(tmp_path)
+    monkeypatch.setattr(hpi_parse, "MIN_RANGE_SIZE", 1000)
+    with open(path, "rb") as file:
+        content = file.read()
+    one, one_stats = hpi_parse.parse_file(path, hpi_parse.ZIP_FORMAT)
+
+    for name, module in [("gzip", gzip), ("bz2", bz2), ("xz", lzma)]:
+        packed = tmp_path / f"packed.{name}"
+        packed.write_bytes(module.compress(content))
+        assert hpi_parse.compression(str(packed)) == name
+        data, stats = hpi_parse.parse_file(
+            str(packed), hpi_parse.ZIP_FORMAT, chunk_size=4096, workers=3
+        )
+        assert data.regions == one.regions
+        assert np.array_equal(data.year, one.year)
+        assert np.array_equal(data.index, one.index)
+        assert stats.bytes == one_stats.bytes
+    assert hpi_parse.compression(path) is None
+
+
+def parse_lines(lines: list[str], fmt=hpi_parse.STATE_FORMAT, first=True):
+    """
+        parses lines as one chunk
+    """
+    stats = hpi_parse.ParseStats()
+    chunk = ("\n".join(lines) + "\n").encode()
+    return hpi_parse.parse_chunk(chunk, fmt, stats, first), stats
+
+
+def test4():
+    """
+        tests that index values come out the same as float() gives, for
+        numbers short enough to convert directly and ones that fall back
+    """
+    rng = np.random.default_rng(2)
+    tokens = [f"{v:.{d}f}" for v, d in zip(
+        rng.uniform(-1000, 1000, 500), rng.integers(0, 8, 500)
+    )]
+    tokens += ["0", "+3", "-0.5", "7.", ".25", "0.1", "0.3", "1e3",
+               "123456789012345.5", "1.23456789012345678", "99999.99999"]
+    lines = [f"AA {2000 + i // 4} {i % 4 + 1} {token} 1.0"
+             for i, token in enumerate(tokens)]
+    res, stats = parse_lines(lines)
+
+    assert stats.rows == len(tokens)
+    assert res.index.tolist() == [float(token) for token in tokens]
+    assert res.year.tolist() == [2000 + i // 4 for i in range(len(tokens))]
+    assert res.qtr.tolist() == [i % 4 + 1 for i in range(len(tokens))]
+
+
+def test5():
+    """
+        tests that the header is only skipped at the start of the file
+    """
+    lines = ["state yr qtr index_nsa index_sa", "AA 2000 1 100.00 100.00"]
+    res, stats = parse_lines(lines)
+    assert res.keys.tolist() == [b"AA"]
+    assert stats.rows == 1 and stats.malformed == 0
+
+    res, stats = parse_lines(lines[1:])
+    assert res.keys.tolist() == [b"AA"]
+
+    zip_lines = [ZIP_HEADER, "10001\t2000\t.\t100.00"]
+    res, stats = parse_lines(zip_lines, hpi_parse.ZIP_FORMAT)
+    assert res.keys.tolist() == [b"10001"]
+    assert res.index.tolist() == [100.0]
+
+    try:
+        parse_lines(lines, first=False)
+    except ValueError:
+        pass
+    else:
+        assert False, "a header in the middle of a file is not a row"
+
+
+def test6():
+    """
+        tests that '.' in a needed column marks the row as missing, and in
+        any other column does not
+    """
+    lines = [
+        "AA 2000 1 100.00 100.00",
+        "AA 2000 2 . . warning: data unavailable in original source.",
+        "AA . 3 90.00 90.00",
+        "AA 2000 . 90.00 90.00",
+        "AA 2000 4 .5 .",
+    ]
+    res, stats = parse_lines(lines)
+    assert stats.rows == 2
+    assert stats.missing == 3
+    assert res.index.tolist() == [100.0, 0.5]
+
+    zip_lines = ["10001\t2000\t.\t100.00", "10001\t2001\t1.5\t."]
+    res, stats = parse_lines(zip_lines, hpi_parse.ZIP_FORMAT)
+    assert stats.rows == 1
+    assert stats.missing == 1
+
+
+def test7():
+    """
+        tests that short lines are counted as malformed and blank lines are
+        not counted at all
+    """
+    lines = [
+        "AA 2000 1 100.00",
+        "",
+        "AA 2000 2",
+        "   ",
+        "AA",
+        "AA 2000 3 110.00 110.00",
+        "\r",
+    ]
+    res, stats = parse_lines(lines)
+    assert stats.rows == 2
+    assert stats.malformed == 2
+    assert stats.missing == 0
+    assert res.index.tolist() == [100.0, 110.0]
+
+
+def test8():
+    """
+        tests that no read asks for more than is left of the size given,
+        and that chunks end on line breaks
+    """
+    reads = []
+
+    class Recorder(io.BytesIO):
+        def read(self, size=-1):
+            reads.append(size)
+            return super().read(size)
+
+    content = b"".join(f"line {i}\n".encode() for i in range(100))
+    chunks = list(hpi_parse.read_chunks(
+        Recorder(content), 1024 * 1024, len(content)
+    ))
+    assert b"".join(chunks) == content
+    assert max(reads) == len(content)
+
+    reads.clear()
+    chunks = list(hpi_parse.read_chunks(Recorder(content), 100))
+    assert b"".join(chunks) == content
+    assert all(chunk.endswith(b"\n") for chunk in chunks)
+    assert max(reads) == 100
+
+
+def test9(tmp_path, monkeypatch):
+    """
+        tests that parsing with a region and year filter gives the same
+        dataset as parsing everything and selecting, and counts the rows it
+        left out as skipped
+    """
+    path = write_zip_file(tmp_path)
+    monkeypatch.setattr(hpi_parse, "MIN_RANGE_SIZE", 1000)
+    full, full_stats = hpi_parse.parse_file(path, hpi_parse.ZIP_FORMAT)
+    regions = ["10003", "10007", "10029", "99999"]
+
+    for years in [None, (1985, 1995), (2030, 2040)]:
+        for workers in [1, 3]:
+            data, stats = hpi_parse.parse_file(
+                path, hpi_parse.ZIP_FORMAT, chunk_size=4096,
+                regions=regions, years=years, workers=workers
+            )
+            expected = full.select(regions=regions, years=years)
+            assert data.regions == expected.regions
+            assert np.array_equal(data.offsets, expected.offsets)
+            assert np.array_equal(data.year, expected.year)
+            assert np.array_equal(data.index, expected.index)
+            assert stats.rows == expected.row_count
+            assert stats.skipped == full_stats.rows - expected.row_count
+            assert stats.missing == full_stats.missing
+            assert stats.malformed == full_stats.malformed
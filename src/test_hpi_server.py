@@ -0,0 +1,163 @@
+"""
+    file: test_hpi_server.py
+    description:
+    Test the hpi_server.py module by sending raw requests to it over a local
+    connection, with a small made up state file
+    author: Lyx Huston
+"""
+
+import asyncio
+import json
+
+import hpi_server  # subject of test
+
+
+def request(method: str, target: str, body: bytes = b"",
+            headers: dict = None) -> bytes:
+    """
+        makes the bytes of one HTTP/1.1 request
+    """
+    headers = dict({"Content-Length": str(len(body))}, **(headers or {}))
+    lines = [f"{method} {target} HTTP/1.1"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode() + body
+
+
+def exchange(server, raw: bytes) -> list[tuple[int, dict]]:
+    """
+        sends raw bytes on one connection and reads the responses until the
+        server closes it
+    """
+    async def run():
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(raw)
+            await writer.drain()
+            data = await reader.read()
+            writer.close()
+        return data
+
+    data = asyncio.run(run())
+    res = []
+    while data:
+        head, _, data = data.partition(b"\r\n\r\n")
+        lines = head.decode().split("\r\n")
+        headers = dict(line.lower().split(": ", 1) for line in lines[1:])
+        length = int(headers["content-length"])
+        res.append((int(lines[0].split()[1]), json.loads(data[:length])))
+        data = data[length:]
+    return res
+
+
+def test1(state_file):
+    """
+        tests queries on one kept alive connection, and what is sent back
+        for unknown paths, wrong methods and bad parameters
+    """
+    server = hpi_server.HPIServer({"state": str(state_file)})
+    query = json.dumps({"query": "range", "region": "VT"}).encode()
+    res = exchange(server, b"".join([
+        request("GET", "/range?region=NY&quarterly=1"),
+        request("GET", "/ranking?year=2000&k=1"),
+        request("POST", "/query", query),
+        request("GET", "/annualize?region=ZZ"),
+        request("GET", "/ranking?year=two"),
+        request("GET", "/nothing"),
+        request("GET", "/query"),
+        request("GET", "/reload"),
+        request("GET", "/range?region=NY&dataset=zip"),
+        request("GET", "/trend?year0=2000&year1=2001",
+                headers={"Connection": "close"}),
+    ]))
+
+    assert [status for status, _ in res] == \
+        [200, 200, 200, 400, 400, 404, 405, 405, 404, 200]
+    assert res[0][1]["high"] == {"year": 2001, "qtr": 1, "index": 121.0}
+    assert res[1][1]["top"] == [["NY", 105.0]]
+    assert res[2][1]["low"] == {"year": 2001, "qtr": None, "index": 80.0}
+    assert [item[0] for item in res[9][1]["top"]] == ["NY", "VT"]
+
+
+def test2(state_file):
+    """
+        tests bodies that are not JSON objects, and content lengths that are
+        not numbers, which end the connection
+    """
+    server = hpi_server.HPIServer({"state": str(state_file)})
+    res = exchange(server, b"".join([
+        request("POST", "/query", b"{not json"),
+        request("POST", "/query", b"[1, 2]"),
+        request("POST", "/query", headers={"Content-Length": "ten"}),
+        request("GET", "/range?region=NY"),
+    ]))
+    assert [status for status, _ in res] == [400, 400, 400]
+    assert res[2][1] == {"error": "bad content-length"}
+
+    res = exchange(server, b"GET /range?region=NY\r\n\r\n")
+    assert res == [(400, {"error": "bad request"})]
+
+    res = exchange(server, request(
+        "GET", "/range?region=NY", headers={"Content-Length": "-1"}
+    ))
+    assert res == [(400, {"error": "bad content-length"})]
+
+
+def test3(state_file, state_lines):
+    """
+        tests that reloading reads the new file, and that metrics are kept
+        per endpoint with unknown paths counted together
+    """
+    server = hpi_server.HPIServer({"state": str(state_file)})
+    state_file.write_text(
+        "\n".join(state_lines + ["CA 2000 1 50.00 50.00"]) + "\n"
+    )
+    res = exchange(server, b"".join([
+        request("GET", "/annualize?region=CA"),
+        request("POST", "/reload"),
+        request("GET", "/annualize?region=CA"),
+        request("POST", "/reload?dataset=zip"),
+        request("GET", "/a"),
+        request("GET", "/b/c?x=1"),
+        request("GET", "/range/?region=NY"),
+        request("GET", "/metrics", headers={"Connection": "close"}),
+    ]))
+
+    assert [status for status, _ in res] == \
+        [400, 200, 200, 404, 404, 404, 200, 200]
+    assert res[1][1]["regions"] == 3
+    assert res[2][1]["values"] == [[2000, 50.0]]
+    metrics = res[7][1]
+    assert set(metrics) == {"annualize", "reload", "other", "range"}
+    assert metrics["annualize"]["count"] == 2
+    assert metrics["annualize"]["errors"] == 1
+    assert metrics["reload"]["count"] == 2
+    assert metrics["other"]["count"] == 2
+    assert metrics["range"]["errors"] == 0
+
+
+def test4(state_file):
+    """
+        tests that headers that are not UTF-8, or too many or too long, are
+        answered with 400 and counted in the metrics
+    """
+    server = hpi_server.HPIServer({"state": str(state_file)})
+    res = exchange(
+        server, b"GET /range?region=NY HTTP/1.1\r\nX-Name: caf\xe9\r\n\r\n"
+    )
+    assert res == [(400, {"error": "bad header"})]
+
+    many = {f"X-{i}": "1" for i in range(hpi_server.MAX_HEADERS)}
+    res = exchange(server, request("GET", "/range?region=NY", headers=many))
+    assert res == [(400, {"error": "headers too large"})]
+
+    long = {f"X-{i}": "a" * 1000 for i in range(70)}
+    res = exchange(server, request("GET", "/trend", headers=long))
+    assert res == [(400, {"error": "headers too large"})]
+
+    res = exchange(server, request(
+        "GET", "/metrics", headers={"Connection": "close"}
+    ))
+    assert res[0][1]["range"]["errors"] == 2
+    assert res[0][1]["trend"]["errors"] == 1
@@ -0,0 +1,62 @@
+"""
+    file: test_import_time.py
+    description:
+    Test that the modules run by the trend jobs import quickly, without
+    loading matplotlib or other slow modules they do not use
+    author: Lyx Huston
+"""
+
+import os
+import subprocess
+import sys
+
+# modules the trend jobs import
+MODULES = ("index_tools", "trending", "period_ranking")
+# slow modules only the code paths that need them should load
+SLOW = ("matplotlib", "numpy.ma", "concurrent.futures.process", "cProfile",
+        "pstats")
+# import time allowed for each module, not counting numpy
+BUDGET_MS = 80
+
+
+def import_times(module: str) -> dict[str, int]:
+    """
+        imports a module in a new interpreter with -X importtime
+        returns the cumulative microseconds of every module imported
+    """
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True, text=True, check=True
+    )
+    times = dict()
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test1():
+    """
+        tests that no slow module is loaded
+    """
+    for module in MODULES + ("timeline_plot",):
+        times = import_times(module)
+        assert module in times
+        for name in times:
+            assert name.split(".")[0] != "matplotlib", (module, name)
+            assert name not in SLOW, (module, name)
+
+
+def test2():
+    """
+        tests the import time budget, best of three to ignore noise
+    """
+    for module in MODULES:
+        best = min(
+            times[module] - times.get("numpy", 0)
+            for times in (import_times(module) for _ in range(3))
+        )
+        assert best / 1000 < BUDGET_MS, f"{module} took {best / 1000:.1f} ms"
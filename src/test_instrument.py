@@ -0,0 +1,75 @@
+"""
+    file: test_instrument.py
+    description:
+    Test the instrument.py module's phase timing and switches
+    author: Lyx Huston
+"""
+
+import io
+import json
+
+import instrument  # subject of test
+
+
+@instrument.timed("test.double", rows=len)
+def double(items):
+    """
+        a timed function
+    """
+    return items + items
+
+
+def test1():
+    """
+        tests that nothing is collected when off
+    """
+    instrument.disable()
+    assert double([1]) == [1, 1]
+    with instrument.phase("test.block") as running:
+        running.add_rows(5)
+
+    assert instrument.summary() == dict()
+
+
+def test2():
+    """
+        tests turning on from arguments, timing, and the JSON summary
+    """
+    argv = ["prog", "--instrument=json", "data.txt"]
+    instrument.from_argv(argv)
+    try:
+        double([1, 2])
+        double([3])
+        with instrument.phase("test.block", rows=4) as running:
+            running.add_rows(1)
+        out = io.StringIO()
+        instrument.report(out)
+    finally:
+        instrument.disable()
+    phases = json.loads(out.getvalue())["phases"]
+
+    assert argv == ["prog", "data.txt"]
+    assert phases["test.double"]["calls"] == 2
+    assert phases["test.double"]["rows"] == 6
+    assert phases["test.block"]["rows"] == 5
+    assert phases["test.block"]["seconds"] >= 0
+
+
+def test3(capsys):
+    """
+        tests that a bad format in the environment warns and stays off, and
+        that asking for it directly still raises
+    """
+    instrument.disable()
+    instrument.from_env({"HPI_INSTRUMENT": "csv"})
+    double([1])
+
+    assert "unknown instrument format 'csv'" in capsys.readouterr().err
+    assert instrument.summary() == dict()
+    try:
+        instrument.configure("csv")
+    except ValueError:
+        pass
+    else:
+        assert False, "configure should not take an unknown format"
+    instrument.disable()
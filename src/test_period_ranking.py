@@ -5,6 +5,8 @@
     author: bksteele, bksvcs@rit.edu
 """
 
+import numpy as np
+
 import index_tools
 import period_ranking # subject of test
 
@@ -69,6 +71,97 @@ def test2():
             print( fname, str( year), ":", "incorrect", results[1:11:9] )
     return
 
+def rank_both(items: list, k: int = None) -> list:
+    """
+        ranks (region, value) items with rank and with rank_values
+    """
+    names = [name for name, _ in items]
+    values = np.array([value for _, value in items], dtype=float)
+    return [
+        period_ranking.rank(iter(items), k),
+        period_ranking.rank_values(names, np.arange(len(items)), values, k),
+    ]
+
+
+def test3():
+    """
+        tests that ties keep the order they were given in, at both ends
+    """
+    items = [("a", 1.0), ("b", 2.0), ("c", 1.0), ("d", 2.0), ("e", 1.0),
+             ("f", 0.0), ("g", 3.0), ("h", 0.0)]
+    order = ["g", "b", "d", "a", "c", "e", "f", "h"]
+    for res in rank_both(items):
+        assert [name for name, _ in res] == order
+    for res in rank_both(items, 2):
+        assert [name for name, _ in res.top] == ["g", "b"]
+        assert [name for name, _ in res.bottom] == ["f", "h"]
+    for res in rank_both(items, 3):
+        assert [name for name, _ in res.top] == ["g", "b", "d"]
+        assert [name for name, _ in res.bottom] == ["e", "f", "h"]
+
+
+def test4():
+    """
+        tests indexing the ends of a Ranking, and that the middle raises
+        IndexError
+    """
+    items = [(f"r{i}", float(i)) for i in range(10)]
+    for res in rank_both(items, 2):
+        assert len(res) == 10
+        assert res[0] == res[-10] == ("r9", 9.0)
+        assert res[1] == ("r8", 8.0)
+        assert res[8] == res[-2] == ("r1", 1.0)
+        assert res[9] == res[-1] == ("r0", 0.0)
+        assert res[:2] == [("r9", 9.0), ("r8", 8.0)]
+        assert res[8:] == res[-2:] == [("r1", 1.0), ("r0", 0.0)]
+        for i in [2, 5, 7, -3, -8, 10, -11]:
+            try:
+                res[i]
+            except IndexError:
+                pass
+            else:
+                assert False, f"entry {i} was not kept"
+
+
+def test5():
+    """
+        tests that with fewer than 2k items every entry can be read
+    """
+    items = [("a", 5.0), ("b", 7.0), ("c", 6.0), ("d", 7.0), ("e", 1.0)]
+    expected = [("b", 7.0), ("d", 7.0), ("c", 6.0), ("a", 5.0), ("e", 1.0)]
+    for k in [3, 5, 10]:
+        for res in rank_both(items, k):
+            assert len(res) == 5
+            assert [res[i] for i in range(5)] == expected
+            assert res[:] == expected
+    for res in rank_both([], 3):
+        assert len(res) == 0
+        assert res[:] == []
+
+
+def test6():
+    """
+        tests that rank and rank_values agree on random values with many
+        ties, and with a plain stable sort
+    """
+    rng = np.random.default_rng(5)
+    for _ in range(200):
+        n = int(rng.integers(0, 40))
+        items = [(f"r{i}", float(v))
+                 for i, v in enumerate(rng.integers(0, 8, n))]
+        expected = sorted(items, key=lambda item: -item[1])
+        for k in [None, 1, 2, 5, 20, 50]:
+            heaps, partition = rank_both(items, k)
+            if k is None:
+                assert heaps == partition == expected
+                continue
+            assert len(heaps) == len(partition) == n
+            ends = min(k, n)
+            assert heaps[:ends] == partition[:ends] == expected[:ends]
+            assert heaps[n - ends:] == partition[n - ends:] == \
+                expected[n - ends:]
+
+
 if __name__ == '__main__':
     print( "\ntesting period_ranking...")
     # runs only when directly invoking this module
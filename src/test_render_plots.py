@@ -0,0 +1,60 @@
+"""
+    file: test_render_plots.py
+    description:
+    Test the render_plots.py module on a small made up dataset
+    author: Lyx Huston
+"""
+
+import hpi_dataset
+import index_tools
+import render_plots  # subject of test
+
+
+def test1(tmp_path):
+    """
+        tests that plots are written, and that a bad group is reported
+    """
+    data = hpi_dataset.HPIDataset.from_dict({
+        reg: [index_tools.AnnualHPI(year, 100.0 + i * year % 7)
+              for year in range(2000, 2010)]
+        for i, reg in enumerate(["NY", "VT", "MA"])
+    })
+    groups = {"north east": ["NY", "VT"], "all": ["NY", "VT", "MA"],
+              "bad": ["ZZ"]}
+    jobs = render_plots.make_jobs(data, groups, str(tmp_path), "svg")
+    failed = render_plots.render_all(jobs, workers=1)
+
+    assert len(jobs) == 6
+    assert sorted(failed) == [str(tmp_path / "bad_timeline.svg"),
+                              str(tmp_path / "bad_whiskers.svg")]
+    assert (tmp_path / "north_east_timeline.svg").stat().st_size > 0
+    assert (tmp_path / "all_whiskers.svg").stat().st_size > 0
+
+
+def test2():
+    """
+        tests that the box statistics match matplotlib's boxplot_stats
+    """
+    import numpy as np
+    from matplotlib import cbook
+    import timeline_plot
+
+    rng = np.random.default_rng(5)
+    data = hpi_dataset.HPIDataset.from_dict({
+        reg: [index_tools.AnnualHPI(year, value)
+              for year, value in zip(range(1990, 1990 + length),
+                                     rng.lognormal(5, 0.4, length))]
+        for reg, length in [("NY", 1), ("VT", 2), ("MA", 17), ("ME", 40)]
+    })
+    regions = ["ME", "NY", "MA", "VT"]
+    found = timeline_plot.box_stats(data, regions)
+    expected = cbook.boxplot_stats(
+        [[hpi.index for hpi in data[reg]] for reg in regions], labels=regions
+    )
+
+    for res, exp in zip(found, expected):
+        assert res["label"] == exp["label"]
+        for key in ("med", "q1", "q3", "iqr", "whislo", "whishi"):
+            assert res[key] == exp[key]
+        assert np.isclose(res["mean"], exp["mean"])
+        assert sorted(res["fliers"]) == sorted(exp["fliers"])
@@ -0,0 +1,69 @@
+"""
+    file: test_similarity.py
+    description:
+    Test the similarity.py module against correlations and distances worked
+    out one pair at a time
+    author: Lyx Huston
+"""
+
+import numpy as np
+
+import similarity  # subject of test
+
+
+def make_data(annual_dataset):
+    """
+        makes 30 regions of random paths from 1995 to 2010, one of them with
+        a gap, and returns them as a dataset and as a dict of year to index
+    """
+    rng = np.random.default_rng(11)
+    values = {
+        f"R{i:02d}": dict(zip(
+            range(1995, 2011), 100 * np.cumprod(rng.uniform(0.9, 1.2, 16))
+        ))
+        for i in range(30)
+    }
+    del values["R07"][2003]
+    return annual_dataset(values), values
+
+
+def test1(annual_dataset):
+    """
+        tests both metrics against brute force, and that a region with a gap
+        is left out
+    """
+    data, values = make_data(annual_dataset)
+    years = range(2000, 2009)
+    series = {
+        reg: np.array([found[y] for y in years])
+        for reg, found in values.items() if all(y in found for y in years)
+    }
+    for metric in similarity.METRICS:
+        index = similarity.TrajectoryIndex(data, 2000, 2008, metric)
+        assert "R07" not in index and len(index) == 29
+        found = index.query("R03", 5)
+        scores = []
+        for reg, line in series.items():
+            if reg == "R03":
+                continue
+            if metric == "correlation":
+                score = np.corrcoef(series["R03"], line)[0, 1]
+            else:
+                score = -np.linalg.norm(series["R03"] / series["R03"][0]
+                                        - line / line[0])
+            scores.append((score, reg))
+        scores.sort(reverse=True)
+        assert [reg for reg, _ in found] == [reg for _, reg in scores[:5]]
+        for (_, score), (expected, _) in zip(found, scores):
+            assert np.isclose(abs(score), abs(expected))
+
+
+def test2(annual_dataset):
+    """
+        tests the list given for plotting
+    """
+    data, _ = make_data(annual_dataset)
+    regions = similarity.similar_regions(data, "R01", 1995, 2010, k=3)
+
+    assert regions[0] == "R01" and len(regions) == 4
+    assert len(set(regions)) == 4
@@ -0,0 +1,42 @@
+"""
+    file: test_synthetic_data.py
+    description:
+    Test that the made up files of synthetic_data.py have the rows asked for
+    and can be read
+    author: Lyx Huston
+"""
+
+import hpi_parse
+import synthetic_data  # subject of test
+
+
+def test1(tmp_path):
+    """
+        tests row and missing counts of both formats
+    """
+    state, zips = synthetic_data.write_files(
+        str(tmp_path), 1000, 2000, missing_rate=0.1, seed=3
+    )
+    state_data, state_stats = hpi_parse.parse_file(
+        state, hpi_parse.STATE_FORMAT
+    )
+    zip_data, zip_stats = hpi_parse.parse_file(zips, hpi_parse.ZIP_FORMAT)
+
+    assert state_stats.rows + state_stats.missing == 1000
+    assert zip_stats.rows + zip_stats.missing == 2000
+    assert state_stats.malformed == zip_stats.malformed == 0
+    assert 50 < state_stats.missing < 150
+    assert 100 < zip_stats.missing < 300
+    assert len(state_data) == 7
+    assert list(state_data)[:2] == ["AA", "AB"]
+
+
+def test2():
+    """
+        tests that region names get longer when two letters run out
+    """
+    names = synthetic_data.region_names(26 * 26 + 1)
+
+    assert names[0] == "AAA"
+    assert names[-1] == "BAA"
+    assert len(set(names)) == len(names)
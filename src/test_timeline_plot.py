@@ -5,6 +5,7 @@
     author: bksteele, bksvcs@rit.edu
 """
 
+import hpi_dataset
 import index_tools
 import timeline_plot
 
@@ -48,6 +49,46 @@ def test1():
 
     return
 
+def test2():
+    """
+        tests build_plottable_matrix on a dict and on a dataset, against
+        filling in each year by hand: repeated years use the last value,
+        years with no data are masked
+    """
+    values = {
+        "AA": [(2000, 1.0), (2001, 2.0), (2001, 3.0), (2004, 4.0)],
+        "AB": [(1999, 5.0), (2002, 6.0), (2003, 7.0)],
+        "AC": [(2002, 8.0)],
+        "AD": [],
+    }
+    data = {reg: [index_tools.AnnualHPI(y, v) for y, v in found]
+            for reg, found in values.items()}
+    dataset = hpi_dataset.HPIDataset.from_dict(data)
+    regions = ["AC", "AA", "AB"]
+
+    for source in (data, dataset):
+        for xyears in (None, [2004, 2000, 2001, 2002], [2001, 2001, 1990]):
+            years, matrix = timeline_plot.build_plottable_matrix(
+                source, regions, xyears
+            )
+            if xyears is None:
+                assert years == list(range(1999, 2005))
+            else:
+                assert years == xyears
+            assert matrix.shape == (len(regions), len(years))
+            for i, reg in enumerate(regions):
+                last = dict(values[reg])
+                for j, year in enumerate(years):
+                    if year not in last or year in years[:j]:
+                        assert matrix.mask[i, j]
+                    else:
+                        assert not matrix.mask[i, j]
+                        assert matrix[i, j] == last[year]
+
+    years, matrix = timeline_plot.build_plottable_matrix(data, ["AD"])
+    assert years == [] and matrix.shape == (1, 0)
+
+
 if __name__ == '__main__':
     print( "\ntesting timeline_plot...")
     # run only when directly invoking this module
@@ -5,6 +5,8 @@
     author: bksteele, bksvcs@rit.edu
 """
 
+import numpy as np
+
 import index_tools
 import trending # subject of test
 
@@ -81,6 +83,84 @@ def test2():
 
     return
 
+
+def test3(annual_dataset):
+    """
+        tests rolling CAGR and year over year change on a small dataset
+        with a gap, against cagr for each pair of years
+    """
+    values = {"AA": {2000: 100.0, 2001: 110.0, 2002: 121.0, 2004: 150.0},
+              "AB": {2001: 50.0, 2002: 40.0, 2003: 45.0, 2004: 60.0}}
+    data = annual_dataset(values)
+
+    regions, years, rates = trending.rolling_cagr(data, 2)
+    assert regions == ["AA", "AB"] and list(years) == list(range(2000, 2005))
+    for i, reg in enumerate(regions):
+        for j, year in enumerate(years.tolist()):
+            ends = [values[reg].get(year - 2), values[reg].get(year)]
+            if None in ends:
+                assert np.isnan(rates[i, j])
+            else:
+                assert np.isclose(rates[i, j], trending.cagr(ends, 2))
+    _, _, yoy = trending.yoy_change(data)
+    assert np.isnan(yoy[0, 3]) and np.isnan(yoy[0, 4])
+    assert np.isclose(yoy[1, 3], 12.5)
+    assert trending.rank_period(regions, years, yoy, 2002) == \
+        [("AA", yoy[0, 2]), ("AB", yoy[1, 2])]
+
+
+
+def test4(annual_dataset):
+    """
+        tests cagr_matrix against calculate_trends for every pair of years,
+        with gaps, a year no region has, and an index of 0 at either end
+    """
+    rng = np.random.default_rng(4)
+    values = {
+        f"R{i}": {y: float(v) for y, v in zip(
+            range(2000, 2011), rng.uniform(50, 150, 11)
+        ) if rng.random() > 0.25}
+        for i in range(12)
+    }
+    values["R3"] = {2003: 0.0, 2005: 20.0, 2007: 0.0, 2009: 30.0}
+    data = annual_dataset(values)
+    annual = {reg: [index_tools.AnnualHPI(y, v) for y, v in found.items()]
+              for reg, found in values.items()}
+    years = list(range(1999, 2012))
+    regions, rates = trending.cagr_matrix(data, years, years)
+
+    for year in (2003, 2007):
+        assert np.isnan(rates[regions.index("R3"), years.index(year)]).all()
+        assert np.isnan(rates[regions.index("R3"), :, years.index(year)]).all()
+    for a, year0 in enumerate(years):
+        assert np.isnan(rates[:, a, a]).all()
+        for b, year1 in enumerate(years[a + 1:], a + 1):
+            for source in (data, annual):
+                trends = dict(trending.calculate_trends(source, year0, year1))
+                for i, reg in enumerate(regions):
+                    if reg in trends:
+                        assert np.isclose(rates[i, a, b], trends[reg])
+                    else:
+                        assert np.isnan(rates[i, a, b])
+
+
+def test5(annual_dataset):
+    """
+        tests that regions with an index of 0 at either end are left out
+        rather than failing the whole ranking
+    """
+    values = {"AA": {2000: 0.0, 2002: 10.0},
+              "AB": {2000: 5.0, 2002: 0.0},
+              "AC": {2000: 100.0, 2002: 121.0}}
+    annual = {reg: [index_tools.AnnualHPI(y, v) for y, v in found.items()]
+              for reg, found in values.items()}
+    for source in (annual, annual_dataset(values)):
+        trends = trending.calculate_trends(source, 2000, 2002)
+        assert len(trends) == 1
+        assert trends[0][0] == "AC"
+        assert np.isclose(trends[0][1], 10.0)
+
+
 if __name__ == '__main__':
 
     print( "\ntesting trending...")
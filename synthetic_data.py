@@ -0,0 +1,194 @@
+"""
+synthetic_data.py
+Author: Lyx Huston
+writes made up HPI_PO_state and ZIP5 files of any size
+
+the files have the same layout as the real ones, so they can be read by
+index_tools, and used by benchmark.py without the real data.  each region is
+a random walk of index values, and a share of the rows have their values
+replaced by '.' like the missing values in the real files.
+
+usage:
+python synthetic_data.py data/synthetic --state-rows 100000 --zip-rows 1000000
+"""
+
+import argparse
+import os
+import string
+
+import numpy as np
+
+STATE_HEADER = "state\tyr\tqtr\tindex_nsa\tindex_sa\n"
+ZIP_HEADER = (
+    "Five-Digit ZIP Code\tYear\tAnnual Change (%)\tHPI\t"
+    "HPI with 1990 base\tHPI with 2000 base\n"
+)
+FIRST_YEAR = 1975
+LAST_YEAR = 2015
+
+
+def region_names(count: int) -> list[str]:
+    """
+    makes state like keys, AA, AB, ... then AAA, AAB, ... if more are needed
+    :param count: how many keys
+    :return: list of keys
+    """
+    letters = string.ascii_uppercase
+    width = 2
+    while len(letters) ** width < count:
+        width += 1
+    res = []
+    for i in range(count):
+        key = ""
+        for _ in range(width):
+            i, rem = divmod(i, len(letters))
+            key = letters[rem] + key
+        res.append(key)
+    return res
+
+
+def random_walk(
+        rng: np.random.Generator, length: int, low: float, high: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    :param rng: random number generator
+    :param length: number of steps
+    :param low: smallest change per step, as a fraction
+    :param high: largest change per step, as a fraction
+    :return: index values, and the change that led to each
+    """
+    change = rng.uniform(low, high, length)
+    return rng.uniform(50, 300) * np.cumprod(1 + change), change
+
+
+def write_state_file(
+        filepath: str,
+        rows: int,
+        missing_rate: float = 0.02,
+        seed: int = 0
+) -> int:
+    """
+    writes a file in HPI_PO_state format
+    every region has every quarter from 1975 to 2015, the last region is cut
+    short to give the number of rows asked for
+    :param filepath: path to write to
+    :param rows: number of data lines, not counting the header
+    :param missing_rate: share of lines with missing values
+    :param seed: seed for the random numbers
+    :return: number of lines with missing values
+    """
+    rng = np.random.default_rng(seed)
+    per_region = (LAST_YEAR - FIRST_YEAR + 1) * 4
+    years = np.repeat(np.arange(FIRST_YEAR, LAST_YEAR + 1), 4).tolist()
+    qtrs = [1, 2, 3, 4] * (LAST_YEAR - FIRST_YEAR + 1)
+    missing = 0
+    with open(filepath, "w") as file:
+        file.write(STATE_HEADER)
+        for reg in region_names(-(-rows // per_region)):
+            count = min(per_region, rows)
+            rows -= count
+            values, _ = random_walk(rng, count, -0.03, 0.05)
+            gaps = (rng.random(count) < missing_rate).tolist()
+            missing += sum(gaps)
+            file.writelines(
+                f"{reg}\t{y}\t{q}\t.\t.\t"
+                "warning: data unavailable in original source.\n"
+                if gap else f"{reg}\t{y}\t{q}\t{v:.2f}\t{v * 1.01:.2f}\n"
+                for y, q, v, gap in zip(years, qtrs, values.tolist(), gaps)
+            )
+    return missing
+
+
+def write_zip_file(
+        filepath: str,
+        rows: int,
+        missing_rate: float = 0.05,
+        seed: int = 0
+) -> int:
+    """
+    writes a file in HPI_AT_ZIP5 format
+    every ZIP code starts in a random year up to 2000 and runs to 2015, the
+    last one is cut short to give the number of rows asked for.  ZIP codes
+    past 99999 have more than five digits
+    :param filepath: path to write to
+    :param rows: number of data lines, not counting the header
+    :param missing_rate: share of lines with missing values
+    :param seed: seed for the random numbers
+    :return: number of lines with missing values
+    """
+    rng = np.random.default_rng(seed)
+    missing = 0
+    zipcode = 0
+    with open(filepath, "w") as file:
+        file.write(ZIP_HEADER)
+        while rows > 0:
+            start = int(rng.integers(FIRST_YEAR, 2001))
+            count = min(LAST_YEAR - start + 1, rows)
+            rows -= count
+            values, change = random_walk(rng, count, -0.2, 0.3)
+            gaps = (rng.random(count) < missing_rate).tolist()
+            missing += sum(gaps)
+            key = f"{zipcode:05d}"
+            zipcode += 1
+            file.writelines(
+                f"{key}\t{y}\t.\t.\t.\t.\n"
+                if gap else
+                f"{key}\t{y}\t{c * 100:.2f}\t{v:.2f}\t{v / 2:.2f}\t.\n"
+                for y, v, c, gap in zip(
+                    range(start, start + count), values.tolist(),
+                    change.tolist(), gaps
+                )
+            )
+    return missing
+
+
+def write_files(
+        directory: str,
+        state_rows: int,
+        zip_rows: int,
+        missing_rate: float = None,
+        seed: int = 0
+) -> tuple[str, str]:
+    """
+    writes a state file and a ZIP5 file named like the real ones
+    :param directory: directory to write to, made if needed
+    :param state_rows: data lines in the state file
+    :param zip_rows: data lines in the ZIP5 file
+    :param missing_rate: share of lines with missing values, or None for
+    the default of each format
+    :param seed: seed for the random numbers
+    :return: paths of the state file and the ZIP5 file
+    """
+    os.makedirs(directory, exist_ok=True)
+    state = os.path.join(directory, "HPI_PO_state.txt")
+    zips = os.path.join(directory, "HPI_AT_ZIP5.txt")
+    rate = dict() if missing_rate is None else {"missing_rate": missing_rate}
+    write_state_file(state, state_rows, seed=seed, **rate)
+    write_zip_file(zips, zip_rows, seed=seed, **rate)
+    return state, zips
+
+
+def main() -> None:
+    """
+    main function
+    runs if module is run
+    """
+    parser = argparse.ArgumentParser(
+        description="write made up state and ZIP5 house price index files"
+    )
+    parser.add_argument("directory", help="directory to write the files to")
+    parser.add_argument("--state-rows", type=int, default=10000)
+    parser.add_argument("--zip-rows", type=int, default=100000)
+    parser.add_argument("--missing-rate", type=float,
+                        help="share of lines with missing values")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for path in write_files(
+            args.directory, args.state_rows, args.zip_rows,
+            args.missing_rate, args.seed
+    ):
+        print(f"wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
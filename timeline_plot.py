@@ -4,47 +4,192 @@ Author: Lyx Huston
 part 3
 the one with a lot of imports
 
-
-Most of the imports seem to not be necessary in the code?
+matplotlib and numpy.ma are slow to import, so they are imported by the
+functions that use them, and importing this module to lay out or filter data
+does not load them.
 """
 
-import numpy.ma as ma
-import matplotlib.ticker as mticker
-import matplotlib.pyplot as plt
-import datetime as dt
-import matplotlib.dates as mdates
-import copy
+from bisect import bisect_left, bisect_right
+
+import numpy as np
 
 from index_tools import AnnualHPI, sort, annualize, read_zip_house_price_data
 from index_tools import read_state_house_price_data, print_range
+from hpi_dataset import HPIDataset
+import instrument
 
 
 def build_plottable_array(
         xyears: list[int],
         regiondata: list[AnnualHPI]
-) -> ma.masked_array:
+) -> "np.ma.MaskedArray":
     """
     "bridges gaps" in data in regiondata that correspond to xyears
     constructs a plottable array
-    for a single region?
+    for a single region, see build_plottable_matrix for many
     :param xyears: list of years to put on the x axis
     :param regiondata: list of AnnualHPI objects
     :return: a plottable array with given data
     """
+    return build_plottable_matrix({"": regiondata}, [""], xyears)[1][0]
+
+
+def build_plottable_matrix(
+        data: dict[str: list[AnnualHPI]],
+        regionList: list[str],
+        xyears: list[int] = None
+) -> tuple[list[int], "np.ma.MaskedArray"]:
+    """
+    lays out many regions at once as a masked array with a row per region
+    and a column per year, masked where a region has no data for the year
+    if a region has a year more than once the last one is used
+    :param data: dictionary of regions to list of AnnualHPI, or HPIDataset
+    :param regionList: regions to lay out, raises KeyError if one is missing
+    :param xyears: years for the columns, or None for every year from the
+    first to the last the regions have
+    :return: years of the columns, and the masked array
+    """
+    import numpy.ma as ma
+
+    lengths, year, index = _region_rows(data, regionList)
+    line = np.repeat(np.arange(len(regionList)), lengths)
+    if xyears is None:
+        xyears = []
+        if len(year):
+            xyears = list(range(int(year.min()), int(year.max()) + 1))
+    if not len(xyears):
+        return list(xyears), ma.masked_all((len(regionList), 0))
+    # column of each year, the first if xyears has it more than once
+    columns = np.asarray(xyears, dtype=np.int64)
+    order = np.argsort(columns, kind="stable")
+    place = np.minimum(
+        np.searchsorted(columns[order], year), len(columns) - 1
+    )
+    inside = columns[order][place] == year
+    matrix = np.zeros((len(regionList), len(columns)))
+    mask = np.ones((len(regionList), len(columns)), dtype=bool)
+    matrix[line[inside], order[place[inside]]] = index[inside]
+    mask[line[inside], order[place[inside]]] = False
+    return list(xyears), ma.masked_array(matrix, mask)
+
+
+def _region_rows(
+        data: dict[str: list[AnnualHPI]],
+        regionList: list[str]
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    gathers the rows of some regions into arrays, one region after another
+    :param data: dictionary of regions to list of AnnualHPI, or HPIDataset
+    :param regionList: regions to gather, raises KeyError if one is missing
+    :return: number of rows of each region, and the year and index of every
+    row
+    """
+    if isinstance(data, HPIDataset):
+        found = np.array(
+            [data.position(reg) for reg in regionList], dtype=np.int64
+        )
+        starts = data.offsets[found]
+        stops = data.offsets[found + 1]
+        rows = data.span_rows(starts, stops)
+        lengths = stops - starts
+        year = data.year[rows]
+        index = data.index[rows]
+    else:
+        series = [data[reg] for reg in regionList]
+        lengths = np.array([len(lst) for lst in series], dtype=np.int64)
+        count = int(lengths.sum())
+        year = np.fromiter(
+            (hpi.year for lst in series for hpi in lst), np.int64, count
+        )
+        index = np.fromiter(
+            (hpi.index for lst in series for hpi in lst), np.float64, count
+        )
+    return lengths, year, index
+
+
+def box_stats(
+        data: dict[str: list[AnnualHPI]],
+        regionList: list[str],
+        whis: float = 1.5
+) -> list[dict]:
+    """
+    works out the box plot statistics of many regions at once, the same as
+    matplotlib's boxplot would: quartiles by linear interpolation, whiskers
+    at the furthest values within whis times the interquartile range of the
+    box, and the values past the whiskers as fliers
+    the result can be drawn again and again with Axes.bxp
+    :param data: dictionary of regions to list of AnnualHPI, or HPIDataset
+    :param regionList: regions to work out, raises KeyError if one is missing
+    :param whis: reach of the whiskers, in interquartile ranges
+    :return: list of dicts for Axes.bxp, one per region, NaN for regions
+    with no data
+    """
+    lengths, _, index = _region_rows(data, regionList)
+    count = len(regionList)
+    line = np.repeat(np.arange(count), lengths)
+    # values sorted within each region, regions one after another
+    values = index[np.lexsort((index, line))]
+    starts = np.cumsum(lengths) - lengths
+    q1, med, q3 = (
+        _sorted_percentile(values, starts, lengths, p) for p in (25, 50, 75)
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(line, weights=values, minlength=count) / lengths
+    iqr = q3 - q1
+    reach_low = (q1 - whis * iqr)[line]
+    reach_high = (q3 + whis * iqr)[line]
+    low = np.full(count, np.inf)
+    np.minimum.at(low, line, np.where(values >= reach_low, values, np.inf))
+    high = np.full(count, -np.inf)
+    np.maximum.at(high, line, np.where(values <= reach_high, values, -np.inf))
+    low = np.where(np.isinf(low) | (low > q1), q1, low)
+    high = np.where(np.isinf(high) | (high < q3), q3, high)
+    outside = (values < low[line]) | (values > high[line])
+    fliers = np.split(
+        values[outside],
+        np.cumsum(np.bincount(line[outside], minlength=count))[:-1]
+    )
+    return [
+        {
+            "label": reg, "mean": mean[i], "med": med[i], "q1": q1[i],
+            "q3": q3[i], "iqr": iqr[i], "whislo": low[i], "whishi": high[i],
+            "fliers": fliers[i],
+        }
+        for i, reg in enumerate(regionList)
+    ]
+
 
-    mask = []
-    graph = []
-    for year in xyears:
-        mask.append(1)
-        graph.append(None)
-    for hpi in regiondata:
-        if hpi.year in xyears:
-            look = xyears.index(hpi.year)
-            graph[look] = hpi.index
-            mask[look] = 0
-    return ma.masked_array(ma.array(graph), mask)
+def _sorted_percentile(
+        values: np.ndarray,
+        starts: np.ndarray,
+        lengths: np.ndarray,
+        percent: float
+) -> np.ndarray:
+    """
+    percentile of each run of sorted values, interpolated the way
+    numpy.percentile does by default
+    :param values: runs of values, each sorted
+    :param starts: start of each run
+    :param lengths: length of each run
+    :param percent: percentile to find, 0 to 100
+    :return: percentile of each run, NaN for empty runs
+    """
+    if not len(values):
+        return np.full(len(lengths), np.nan)
+    last = np.maximum(lengths, 1) - 1
+    position = percent / 100 * last
+    below = np.floor(position).astype(np.int64)
+    gamma = position - below
+    above = np.minimum(below + 1, last)
+    # empty runs may start past the end, their result is replaced by NaN
+    a = values[np.minimum(starts + below, len(values) - 1)]
+    b = values[np.minimum(starts + above, len(values) - 1)]
+    diff = b - a
+    res = np.where(gamma >= 0.5, b - diff * (1 - gamma), a + diff * gamma)
+    return np.where(lengths > 0, res, np.nan)
 
 
+@instrument.timed("timeline_plot.filter_years", rows=instrument.rows_of)
 def filter_years(
         data: dict[str: list[AnnualHPI]],
         year0: int,
@@ -59,67 +204,137 @@ def filter_years(
     :param year0: beginning year
     :param year1: end year
     :return: data set above, but with items taken out that are not in the year
-    range, sorted in ascending order by year
+    range, sorted in ascending order by year.  an HPIDataset gives an
+    HPIDataset
     """
+    if isinstance(data, HPIDataset):
+        return data.select(years=(year0, year1), drop_empty=False)
     res = dict()
     for reg in data:
-        work = list()
-        for hpi in data[reg]:
-            if year0 <= hpi.year <= year1:
-                work.append(hpi)
-        sort(work)
-        res[reg] = work
+        work = sort(list(data[reg]))
+        start = bisect_left(work, year0, key=year_of)
+        stop = bisect_right(work, year1, lo=start, key=year_of)
+        res[reg] = work[start:stop]
     return res
 
 
+def year_of(hpi: AnnualHPI) -> int:
+    """
+    :param hpi: HPI object
+    :return: its year, to bisect on
+    """
+    return hpi.year
+
+
+@instrument.timed("timeline_plot.plot_HPI")
 def plot_HPI(
         data: dict[str: list[AnnualHPI]],
-        regionList: list[str]
+        regionList: list[str],
+        outfile: str = None
 ) -> None:
     """
     plots a timeline of point to point over data
     pre-condition: lists in data are sorted in ascending year order
     :param data: dataset to plot
     :param regionList: regions to plot
+    :param outfile: file to save the plot to instead of displaying it
     :return:
     """
-    low, high = get_highest_lowest_years(
-        get_all_data_from_all_regions(data, regionList)
-    )
-    ran = list(range(low, high + 1))
-    plt.title(f"Home Price Indexes: {low}-{high}")
-    for reg in regionList:
-        plot = build_plottable_array(ran, data[reg])
-        plt.plot(ran, plot, marker="D", scalex=True)
-    plt.legend(regionList)
+    import matplotlib.pyplot as plt
+
+    draw_HPI(plt.gca(), data, regionList)
+    show(outfile)
+
+
+def draw_HPI(
+        axes,
+        data: dict[str: list[AnnualHPI]],
+        regionList: list[str]
+) -> None:
+    """
+    draws the plot of plot_HPI on a set of axes
+    :param axes: matplotlib Axes to draw on
+    :param data: dataset to plot
+    :param regionList: regions to plot
+    :return: None
+    """
+    ran, matrix = build_plottable_matrix(data, regionList)
+    if not ran:
+        raise ValueError("no data for the regions to plot")
+    low, high = ran[0], ran[-1]
+    axes.set_title(f"Home Price Indexes: {low}-{high}")
+    # a line per region, with gaps where the matrix is masked
+    axes.plot(ran, matrix.filled(np.nan).T, marker="D", scalex=True)
+    axes.legend(regionList)
     ticks = range(((low + 1) // 2) * 2, ((high + 3) // 2) * 2, 2)
-    plt.xticks(ticks)
-    plt.xlim(low, high)
-    print("Close display window to continue.")
-    plt.show()
+    axes.set_xticks(ticks)
+    axes.set_xlim(low, high)
 
 
+@instrument.timed("timeline_plot.plot_whiskers")
 def plot_whiskers(
         data: dict[str: list[AnnualHPI]],
-        regionList: list[str]
+        regionList: list[str],
+        outfile: str = None
 ) -> None:
     """
     displays a whisker plot of data
     :param data: dictionary of regions to list of API
     :param regionList: list of regions to plot
+    :param outfile: file to save the plot to instead of displaying it
+    :return: None
+    """
+    import matplotlib.pyplot as plt
+
+    draw_whiskers(plt.gca(), data, regionList)
+    show(outfile)
+
+
+def draw_whiskers(
+        axes,
+        data: dict[str: list[AnnualHPI]],
+        regionList: list[str]
+) -> None:
+    """
+    draws the plot of plot_whiskers on a set of axes
+    the box statistics of every region are worked out together by
+    box_stats, rather than handing boxplot a list of values per region
+    :param axes: matplotlib Axes to draw on
+    :param data: dictionary of regions to list of API
+    :param regionList: list of regions to plot
+    :return: None
+    """
+    draw_box_stats(axes, box_stats(data, regionList))
+
+
+def draw_box_stats(axes, stats: list[dict]) -> None:
+    """
+    draws box statistics from box_stats as a whisker plot
+    :param axes: matplotlib Axes to draw on
+    :param stats: result of box_stats
     :return: None
     """
-    work = []
-    for reg in regionList:
-        work.append([])
-        for hpi in data[reg]:
-            work[-1].append(hpi.index)
-    plt.boxplot(work, labels=regionList, showmeans=True)
-    plt.title(
+    axes.bxp(stats, showmeans=True)
+    axes.set_title(
         "Home Price Index Comparison.  Median is a line.  Mean is a triangle."
     )
-    print("Close display window to continue.")
-    plt.show()
+
+
+@instrument.timed("timeline_plot.show")
+def show(outfile: str = None) -> None:
+    """
+    displays the current plot, or saves it to a file and closes it
+    :param outfile: file to save to, None to display
+    :return: None
+    """
+    import matplotlib.pyplot as plt
+
+    if outfile is None:
+        print("Close display window to continue.")
+        plt.show()
+    else:
+        plt.savefig(outfile)
+        plt.close()
 
 
 def get_all_data_from_all_regions(
@@ -128,6 +343,9 @@ def get_all_data_from_all_regions(
     """
     a helper function to use with get_highest_lowest that isolates all data
     related to the regions to a single list
+    deprecated, nothing here uses it and it is kept for compatibility:
+    build_plottable_matrix lays out many regions without joining their
+    lists, and HPIDataset.year_bounds finds the rows of a range of years
     :param data: a dictionary of regions to lists of annual hpi
     :param regs: list of regions to target
     :return: lists, added
@@ -141,15 +359,17 @@ def get_all_data_from_all_regions(
 def get_highest_lowest_years(lst: list[AnnualHPI]) -> tuple[int, int]:
     """
     finds highest and lowest years from given list
+    deprecated, kept for compatibility with get_all_data_from_all_regions:
+    build_plottable_matrix gives the years of many regions as its columns
     :param lst: list of AnnualHPI objects
     :return: tuple, lowest then highest
     """
     low = lst[0].year
-    high = lst[1].year
+    high = lst[0].year
     for hpi in lst[1:]:
         if hpi.year > high:
             high = hpi.year
-        elif hpi.year < low:
+        if hpi.year < low:
             low = hpi.year
     return low, high
 
@@ -167,6 +387,7 @@ def main() -> None:
 
     :return: None
     """
+    instrument.from_argv()
     filepath = "data/" + input("Enter house price index file: ")
     year0 = int(input("Enter start year of range to plot: "))
     year1 = int(input("Enter ending year of range to plot: "))
@@ -177,18 +398,20 @@ def main() -> None:
             break
         else:
             regs.append(inp)
+    # only the regions asked for are read, state ranges are printed for all
+    # years so the years are filtered after
     if "state" in filepath:
-        unanualized_data = read_state_house_price_data(filepath)
+        unanualized_data = read_state_house_price_data(
+            filepath, cache=True, regions=regs
+        )
         for reg in regs:
             print_range(unanualized_data, reg)
         dat = annualize(unanualized_data)
     else:
-        dat = read_zip_house_price_data(filepath)
-    filtered_data = dict()
-    # the next loop is to make filtering the years *much* quicker
-    for reg in regs:
-        filtered_data[reg] = dat[reg]
-    filtered_data = filter_years(filtered_data, year0, year1)
+        dat = read_zip_house_price_data(
+            filepath, cache=True, regions=regs, years=(year0, year1)
+        )
+    filtered_data = filter_years(dat, year0, year1)
     plot_HPI(filtered_data, regs)
     plot_whiskers(filtered_data, regs)
 
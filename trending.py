@@ -7,8 +7,12 @@ on the magnitude ~10^-14, smaller than was stated as an acceptable difference in
 class (~10^-5)
 """
 
+import numpy as np
+
+import hpi_dataset
 import index_tools
-from period_ranking import binary_insert
+import instrument
+from period_ranking import rank, rank_values
 from typing import Union
 
 
@@ -22,31 +26,231 @@ def cagr(idxlist: list[float], periods: int) -> float:
     return ((idxlist[1] / idxlist[0]) ** (1 / periods) - 1) * 100
 
 
+@instrument.timed("trending.calculate_trends", rows=len)
 def calculate_trends(
         data: dict[str, list[index_tools.AnnualHPI]],
         year0: int,
-        year1: int
+        year1: int,
+        k: int = None
 ) -> list[tuple[str, float]]:
     """
     calculate trends for all regions in data
+    regions with no index for either year, or an index of 0 in either, are
+    left out
     precondition: year0 < year1
     :param data: dictionary of regions to AnnualHPI objects
     :param year0: year at beginning
     :param year1: year at end
+    :param k: only keep the top k and bottom k, see period_ranking.rank
     :return: list of tuples of region, rate sorted in descending order by rate
     """
+    if isinstance(data, hpi_dataset.HPIDataset):
+        return _calculate_dataset_trends(data, year0, year1, k)
     res = list()
     for region in data:
         ins = search_for_annualhpi_of_years(data[region], (year1, year0))
-        if None not in ins:
-            ins = (region, cagr(ins, year0 - year1))
+        # growth from or to an index of 0 has no rate, and cagr divides by
+        # one end and raises the other to a negative power
+        if None not in ins and 0 not in ins:
             # I have noticed that due to the precondition, year0-year1 will give
             # a negative number.  However, due to the fact this works with the
             # test file, I have not changed it.
-            binary_insert(res, ins[1], ins)
+            res.append((region, cagr(ins, year0 - year1)))
+    return rank(res, k)
+
+
+def _calculate_dataset_trends(
+        data: hpi_dataset.HPIDataset,
+        year0: int,
+        year1: int,
+        k: int = None
+) -> list[tuple[str, float]]:
+    """
+    calculate_trends for an HPIDataset
+    picks out the index of every region for both years at once, rather than
+    searching each region.  ties keep the order of the regions in the dataset
+    :param data: annual HPIDataset
+    :param year0: year at beginning
+    :param year1: year at end
+    :param k: only keep the top k and bottom k, see period_ranking.rank
+    :return: list of tuples of region, rate sorted in descending order by rate
+    """
+    found = []
+    for year in (year1, year0):
+        values = np.full(len(data.regions), np.nan)
+        regions, indexes = data.cross_section(year)
+        values[regions] = indexes
+        found.append(values)
+    regions = np.flatnonzero(
+        ~np.isnan(found[0]) & ~np.isnan(found[1])
+        & (found[0] != 0) & (found[1] != 0)
+    )
+    rates = np.array([
+        cagr(ins, year0 - year1)
+        for ins in zip(found[0][regions].tolist(), found[1][regions].tolist())
+    ])
+    return rank_values(data.regions, regions, rates, k)
+
+
+@instrument.timed("trending.cagr_matrix", rows=lambda res: len(res[0]))
+def cagr_matrix(
+        data: "hpi_dataset.HPIDataset",
+        years0=None,
+        years1=None
+) -> tuple[list[str], np.ndarray]:
+    """
+    compound annual growth rate of every region between every pair of years
+    worked out with numpy broadcasting over data.year_matrix(), with the same
+    formula as calculate_trends, so rates agree with it to within rounding.
+    NaN where either year has no data, where the years are the same, or
+    where the index of either year is 0, like the regions calculate_trends
+    leaves out.
+    the result takes 8 * regions * len(years0) * len(years1) bytes
+    :param data: annual HPIDataset
+    :param years0: years at beginning, all years in data if None
+    :param years1: years at end, all years in data if None
+    :return: list of regions, and array of rate indexed by region, position
+    in years0, then position in years1
+    """
+    years, matrix = data.year_matrix()
+    years0 = years if years0 is None else np.asarray(years0, dtype=np.int64)
+    years1 = years if years1 is None else np.asarray(years1, dtype=np.int64)
+    # a column of NaN stands in for years with no data at all
+    matrix = np.concatenate(
+        (matrix, np.full((len(matrix), 1), np.nan)), axis=1
+    )
+    # growth from or to an index of 0 has no rate
+    matrix[matrix == 0] = np.nan
+    columns = []
+    for wanted in (years0, years1):
+        col = wanted - (int(years[0]) if len(years) else 0)
+        columns.append(np.where(
+            (col >= 0) & (col < len(years)), col, len(years)
+        ))
+    periods = (years0[:, None] - years1[None, :]).astype(np.float64)
+    same = periods == 0
+    periods[same] = np.nan
+    with np.errstate(divide="ignore", invalid="ignore"):
+        res = matrix[:, columns[0], None] / matrix[:, None, columns[1]]
+        np.power(res, 1 / periods, out=res)
+    res -= 1
+    res *= 100
+    res[:, same] = np.nan
+    return list(data.regions), res
+
+
+def _lagged(matrix: np.ndarray, lag: int) -> np.ndarray:
+    """
+    :param matrix: region by period matrix
+    :param lag: periods to look back
+    :return: ratio of each period to the one lag periods before, NaN where
+    either has no data or the period is within lag of the first
+    """
+    res = np.full(matrix.shape, np.nan)
+    if lag < matrix.shape[1]:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            np.divide(matrix[:, lag:], matrix[:, :-lag], out=res[:, lag:])
     return res
 
 
+@instrument.timed("trending.change_matrix", rows=lambda res: len(res[0]))
+def change_matrix(
+        data: "hpi_dataset.HPIDataset", lag: int = 1
+) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """
+    percent change of every region in every period from lag periods before,
+    worked out for the whole dataset at once over data.period_matrix()
+    a change is NaN if either period has no data, periods are matched by
+    date, so a gap in a series never pairs the wrong periods
+    :param data: annual or quarterly HPIDataset
+    :param lag: periods to look back, years or quarters
+    :return: list of regions, periods as in HPIDataset.period_keys, and array
+    of change indexed by region then position in periods
+    """
+    if lag < 1:
+        raise ValueError("lag must be at least 1")
+    periods, matrix = data.period_matrix()
+    res = _lagged(matrix, lag)
+    res -= 1
+    res *= 100
+    return list(data.regions), periods, res
+
+
+def yoy_change(
+        data: "hpi_dataset.HPIDataset"
+) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """
+    year over year percent change of every region, for quarterly data each
+    quarter is compared with the same quarter a year before
+    :param data: annual or quarterly HPIDataset
+    :return: same as change_matrix
+    """
+    return change_matrix(data, 4 if data.quarterly else 1)
+
+
+def qoq_change(
+        data: "hpi_dataset.HPIDataset"
+) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """
+    quarter over quarter percent change of every region
+    :param data: quarterly HPIDataset
+    :return: same as change_matrix
+    """
+    if not data.quarterly:
+        raise ValueError("quarter over quarter change needs quarterly data")
+    return change_matrix(data, 1)
+
+
+@instrument.timed("trending.rolling_cagr", rows=lambda res: len(res[0]))
+def rolling_cagr(
+        data: "hpi_dataset.HPIDataset", years: int
+) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """
+    compound annual growth rate of every region over the years up to every
+    period, like calculate_trends(data, year - years, year) for every year
+    at once.  NaN where either end has no data
+    :param data: annual or quarterly HPIDataset, quarters are compared with
+    the same quarter years before
+    :param years: length of the window in years
+    :return: same as change_matrix, with the period each window ends in
+    """
+    if years < 1:
+        raise ValueError("years must be at least 1")
+    periods, matrix = data.period_matrix()
+    res = _lagged(matrix, years * (4 if data.quarterly else 1))
+    with np.errstate(invalid="ignore"):
+        np.power(res, 1 / years, out=res)
+    res -= 1
+    res *= 100
+    return list(data.regions), periods, res
+
+
+def rank_period(
+        regions: list[str],
+        periods: np.ndarray,
+        rates: np.ndarray,
+        period: int,
+        k: int = None
+) -> list[tuple[str, float]]:
+    """
+    ranks the regions by one column of change_matrix, rolling_cagr and the
+    like, regions without a value are left out
+    :param regions: regions of the rows
+    :param periods: periods of the columns
+    :param rates: region by period array
+    :param period: period to rank, a year, or a key from period_keys for
+    quarterly data
+    :param k: only keep the top k and bottom k, see period_ranking.rank
+    :return: list of tuples of region, rate sorted in descending order by rate
+    """
+    col = int(np.searchsorted(periods, period))
+    if col == len(periods) or periods[col] != period:
+        return rank_values(regions, np.zeros(0, dtype=np.int64),
+                           np.zeros(0), k)
+    ids = np.flatnonzero(~np.isnan(rates[:, col]))
+    return rank_values(regions, ids, rates[ids, col], k)
+
+
 def search_for_annualhpi_of_years(
         hpis: Union[list[index_tools.AnnualHPI],
                     tuple[index_tools.AnnualHPI, ...]],
@@ -73,15 +277,21 @@ def main() -> None:
     main function
     runs if module is run
     """
+    instrument.from_argv()
     filepath = "data/" + input("Enter house price index filename: ")
     year0 = int(input("Enter start year of interest: "))
     year1 = int(input("Enter ending year of interest: "))
+    years = (min(year0, year1), max(year0, year1))
     if "state" in filepath:
         data = index_tools.annualize(
-            index_tools.read_state_house_price_data(filepath))
+            index_tools.read_state_house_price_data(
+                filepath, cache=True, years=years
+            ))
     else:
-        data = index_tools.read_zip_house_price_data(filepath)
-    data = calculate_trends(data, year0, year1)
+        data = index_tools.read_zip_house_price_data(
+            filepath, cache=True, years=years
+        )
+    data = calculate_trends(data, year0, year1, k=10)
     print(f"{year0}-{year1} Compound Annual Growth Rate")
     if len(data) <= 10:
         for i in range(len(data)):